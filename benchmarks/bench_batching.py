@@ -0,0 +1,112 @@
+"""Benchmark: throughput and per-item latency of micro-batched classification.
+
+A burst of patient messages arrives at once (an outbreak or a broadcast
+campaign) and is classified through a BatchCoalescer at several batch sizes.
+A stand-in bedrock-runtime client models the two limits that matter: each
+call costs a fixed time-to-first-token plus a per-output-token time, and at
+most CONCURRENCY calls run at once (the account's request-rate quota — extra
+calls queue behind it). Defaults roughly match Claude 3 Haiku; override with
+TTFT_MS, TOKEN_MS and CONCURRENCY.
+
+    items/s   burst size / time until the last result
+    p50, p95  per-item latency from submit() to its result
+
+Batch size 1 is the unbatched baseline (one classify_message per item).
+
+Run from the project root:
+    python benchmarks/bench_batching.py [burst]
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.batching import BatchCoalescer  # noqa: E402
+from src.prompts import BATCH_SYSTEM_PROMPT  # noqa: E402
+
+TTFT_MS = float(os.getenv("TTFT_MS", 350))
+TOKEN_MS = float(os.getenv("TOKEN_MS", 8))
+CONCURRENCY = int(os.getenv("CONCURRENCY", 4))
+BATCH_SIZES = (1, 2, 4, 8, 16)
+CHARS_PER_TOKEN = 4
+
+
+def _triage(rng: random.Random) -> dict:
+    symptoms = rng.sample(["fever", "cough", "headache", "chest pain", "nausea", "dizziness"], 3)
+    return {
+        "urgency": rng.choice(["LOW", "MEDIUM", "HIGH"]),
+        "symptoms": symptoms,
+        "duration": f"{rng.randint(1, 9)} days",
+        "age": str(rng.randint(18, 90)),
+        "red_flags": symptoms[: rng.randint(0, 2)],
+    }
+
+
+class _StandInClient:
+    def __init__(self) -> None:
+        self.slots = threading.BoundedSemaphore(CONCURRENCY)
+        self.rng = random.Random(5)
+        self.calls = 0
+
+    def invoke_model(self, body: str, **_):
+        request = json.loads(body)
+        system = request["system"]
+        system = system[0]["text"] if isinstance(system, list) else system
+        if system == BATCH_SYSTEM_PROMPT:
+            ids = [p["id"] for p in json.loads(request["messages"][0]["content"])]
+            text = json.dumps({item_id: _triage(self.rng) for item_id in ids})
+        else:
+            text = json.dumps(_triage(self.rng))
+        with self.slots:
+            self.calls += 1
+            time.sleep((TTFT_MS + TOKEN_MS * len(text) / CHARS_PER_TOKEN) / 1000)
+        payload = json.dumps({"content": [{"type": "text", "text": text}]})
+        return {"body": io.BytesIO(payload.encode())}
+
+
+def _run(batch_size: int, burst: int) -> tuple:
+    client = _StandInClient()
+    coalescer = BatchCoalescer(max_items=batch_size, max_wait_ms=20, workers=burst)
+    with mock.patch("src.utils.get_bedrock_client", return_value=client), \
+            mock.patch("src.batching.get_bedrock_client", return_value=client), \
+            mock.patch.dict(os.environ, {"LLM_PROVIDER": "bedrock"}):
+        start = time.perf_counter()
+        futures = [coalescer.submit(f"patient {i}: fever and cough since yesterday") for i in range(burst)]
+        latencies = []
+        done = threading.Event()
+
+        def record(_):
+            latencies.append((time.perf_counter() - start) * 1000)
+            if len(latencies) == burst:
+                done.set()
+
+        for future in futures:
+            future.add_done_callback(record)
+        done.wait()
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return burst / elapsed, statistics.median(latencies), p95, client.calls
+
+
+def main(burst: int = 64) -> None:
+    print(f"Burst of {burst} messages (TTFT {TTFT_MS:.0f} ms, {TOKEN_MS:.0f} ms/token, "
+          f"{CONCURRENCY} concurrent calls)")
+    print(f"{'batch':>5} {'calls':>6} {'items/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in BATCH_SIZES:
+        rate, p50, p95, calls = _run(size, burst)
+        print(f"{size:>5} {calls:>6} {rate:>8.1f} {p50:>8.0f} {p95:>8.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
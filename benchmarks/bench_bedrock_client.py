@@ -0,0 +1,60 @@
+"""Benchmark: per-call Bedrock client overhead before and after the registry.
+
+Compares building a fresh ``boto3.client("bedrock-runtime")`` on every call
+(the old ``_classify_bedrock`` behaviour) with fetching the cached client from
+``src.clients``. No network calls are made, so the numbers measure client
+construction only; the saved TLS handshake on warm containers comes on top.
+
+Run from the project root:
+    python benchmarks/bench_bedrock_client.py [iterations]
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3  # noqa: E402
+
+from src.clients import get_bedrock_client, reset_clients  # noqa: E402
+
+REGION = "us-east-1"
+
+
+def _time_calls(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: list) -> None:
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(
+        f"{label:<28} mean={statistics.mean(samples):8.3f} ms  "
+        f"p50={statistics.median(samples):8.3f} ms  p99={p99:8.3f} ms"
+    )
+
+
+def main(iterations: int = 200) -> None:
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    before = _time_calls(lambda: boto3.client("bedrock-runtime", region_name=REGION), iterations)
+    reset_clients()
+    after = _time_calls(lambda: get_bedrock_client(region_name=REGION), iterations)
+
+    print(f"Bedrock client acquisition, {iterations} calls")
+    _report("boto3.client per call", before)
+    _report("get_bedrock_client (cached)", after)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
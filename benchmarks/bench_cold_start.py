@@ -0,0 +1,113 @@
+"""Benchmark: cold-start init duration of the webhook module, eager vs lazy.
+
+Each sample is a fresh interpreter, as in a new Lambda execution environment.
+``eager`` replays the module-level work lambda_function used to do at import
+— boto3.resource("dynamodb").Table(...), S3 and SNS clients, and the openai
+and twilio imports — before importing the handler; ``lazy`` only imports the
+handler. Both then build the table, S3 and SNS clients through the handler's
+getters, which is what the first request pays for in the lazy case. No AWS
+calls are made.
+
+Run from the project root:
+    python benchmarks/bench_cold_start.py [runs] [--importtime]
+
+--importtime also lists the slowest imports of the lazy handler module
+(python -X importtime, cumulative microseconds).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "DYNAMODB_TABLE": "bench-table",
+    "S3_BUCKET": "bench-bucket",
+    "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:123456789012:bench",
+    "TWILIO_AUTH_TOKEN": "bench-token",
+}
+
+EAGER_INIT = """
+import boto3
+try:
+    import openai
+except Exception:
+    pass
+try:
+    from twilio.request_validator import RequestValidator
+except Exception:
+    pass
+boto3.resource("dynamodb").Table(os.environ["DYNAMODB_TABLE"])
+boto3.client("s3")
+boto3.client("sns")
+"""
+
+SAMPLE = """
+import json, os, time
+start = time.perf_counter()
+{init}
+from src import lambda_function
+init_ms = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+lambda_function.get_table(); lambda_function.get_s3_client(); lambda_function.get_sns_client()
+clients_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"init_ms": init_ms, "clients_ms": clients_ms}}))
+"""
+
+
+def _run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=ROOT, env={**os.environ, **ENV}, capture_output=True, text=True, check=True,
+    )
+
+
+def _sample(mode: str) -> dict:
+    code = SAMPLE.format(init=EAGER_INIT if mode == "eager" else "")
+    return json.loads(_run(code).stdout.strip().splitlines()[-1])
+
+
+def _slowest_imports(limit: int = 10) -> list:
+    stderr = _run("from src import lambda_function", "-X", "importtime").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if 1 <= depth <= 2:  # what the handler module and its src/ imports pull in
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main(runs: int = 10, importtime: bool = False) -> None:
+    print(f"cold start over {runs} fresh interpreters (median ms)")
+    results = {}
+    for mode in ("eager", "lazy"):
+        samples = [_sample(mode) for _ in range(runs)]
+        results[mode] = {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+        print(
+            f"  {mode:<6} init {results[mode]['init_ms']:7.1f}"
+            f"  first-request clients {results[mode]['clients_ms']:6.1f}"
+            f"  total {results[mode]['init_ms'] + results[mode]['clients_ms']:7.1f}"
+        )
+    saved = results["eager"]["init_ms"] - results["lazy"]["init_ms"]
+    print(f"  init reduced by {saved:.1f} ms ({saved / results['eager']['init_ms']:.0%})")
+
+    if importtime:
+        print("slowest imports under src.lambda_function (cumulative ms)")
+        for micros, name in _slowest_imports():
+            print(f"  {micros / 1000:7.1f}  {name}")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    main(int(args[0]) if args else 10, "--importtime" in sys.argv)
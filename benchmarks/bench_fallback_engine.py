@@ -0,0 +1,76 @@
+"""Benchmark: per-message cost of the negation-aware keyword fallback.
+
+Times each stage over a synthetic corpus in which roughly a third of the
+messages carry a symptom phrase and half of those are negated, hedged or
+followed by a terminator:
+
+    match   Aho–Corasick whole-word matching only
+    scope   matching plus the NegEx token pass (skipped when nothing matched)
+    full    fallback_classifier end to end
+
+Run from the project root:
+    python benchmarks/bench_fallback_engine.py [messages]
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.keyword_matcher import DEFAULT_MATCHER  # noqa: E402
+from src.negation import scope_matches  # noqa: E402
+from src.utils import fallback_classifier  # noqa: E402
+
+FILLER = (
+    "i have had a since yesterday my and the it is getting worse today "
+    "please help son daughter mother feel tired cough headache sore throat"
+).split()
+SYMPTOMS = ["chest pain", "fever", "vomiting", "shortness of breath", "seizure", "dolor de pecho"]
+CONTEXT = ["no", "i don't have", "maybe", "but", "ruled out", "without", "sin"]
+
+
+def _corpus(messages: int, rng: random.Random) -> list:
+    corpus = []
+    for _ in range(messages):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(5, 25))]
+        if rng.random() < 0.33:
+            phrase = rng.choice(SYMPTOMS)
+            if rng.random() < 0.5:
+                phrase = f"{rng.choice(CONTEXT)} {phrase}"
+            words.insert(rng.randrange(len(words) + 1), phrase)
+        corpus.append(" ".join(words).capitalize() + ".")
+    return corpus
+
+
+def _match(corpus) -> None:
+    for message in corpus:
+        DEFAULT_MATCHER.find_all(message)
+
+
+def _scope(corpus) -> None:
+    for message in corpus:
+        scope_matches(message, DEFAULT_MATCHER.find_all(message))
+
+
+def _full(corpus) -> None:
+    for message in corpus:
+        fallback_classifier(message)
+
+
+def main(messages: int = 100_000) -> None:
+    corpus = _corpus(messages, random.Random(42))
+    print(f"Fallback engine over {messages} synthetic messages")
+    print(f"{'stage':>6} {'msgs/s':>10} {'us/msg':>8}")
+    for name, fn in (("match", _match), ("scope", _scope), ("full", _full)):
+        start = time.perf_counter()
+        fn(corpus)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>6} {messages / elapsed:>10,.0f} {elapsed / messages * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,118 @@
+"""Benchmark: parse-failure rate of the old and the tolerant JSON parsers.
+
+Builds well-formed triage answers and fuzzes them the way model output goes
+wrong in practice — preambles, code fences, trailing commentary, trailing
+commas, raw newlines inside strings and truncation at a random point. Each
+parser counts as correct when it returns the urgency the answer contained
+(a truncation that cuts into urgency itself is expected to fail).
+
+    legacy    split("```") + json.loads, the previous _classify_bedrock logic
+    tolerant  parse_completion (json_extract.extract_object + coerce_triage)
+
+Run from the project root:
+    python benchmarks/bench_json_extract.py [outputs]
+
+``--write-corpus PATH`` saves the fuzzed outputs as JSONL for the tests.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import parse_completion  # noqa: E402
+
+SYMPTOMS = ["fever", "cough", "headache", "chest pain", "vomiting", "rash", "dizziness"]
+PREAMBLES = ["Here is the triage assessment:\n", "Sure! ", "Based on the message:\n\n"]
+COMMENTARY = ["\n\nNote: this is not a diagnosis.", "\nLet me know if you need more.", " }"]
+_URGENCY = re.compile(r'"urgency"\s*:\s*"(LOW|MEDIUM|HIGH)"')
+
+
+def _answer(rng: random.Random) -> str:
+    symptoms = rng.sample(SYMPTOMS, rng.randint(1, 3))
+    return json.dumps({
+        "urgency": rng.choice(["LOW", "MEDIUM", "HIGH"]),
+        "symptoms": symptoms,
+        "duration": rng.choice(["2 days", "since this morning", "unknown"]),
+        "age": rng.choice(["34", "unknown", "7 months"]),
+        "red_flags": symptoms[: rng.randint(0, 1)],
+    }, indent=rng.choice([None, 2]))
+
+
+def _fuzz(text: str, rng: random.Random) -> str:
+    for _ in range(rng.randint(1, 2)):
+        kind = rng.choice(["fence", "preamble", "commentary", "comma", "newline", "truncate", "clean"])
+        if kind == "fence":
+            text = f"```json\n{text}\n```"
+        elif kind == "preamble":
+            text = rng.choice(PREAMBLES) + text
+        elif kind == "commentary":
+            text += rng.choice(COMMENTARY)
+        elif kind == "comma":
+            closer = text.rfind("]") if rng.random() < 0.5 else text.rfind("}")
+            text = text[:closer] + "," + text[closer:]
+        elif kind == "newline":
+            text = text.replace("since this", "since\nthis").replace("7 months", "7\tmonths")
+        elif kind == "truncate":
+            text = text[: rng.randint(len(text) // 3, len(text) - 1)]
+    return text
+
+
+def fuzzed_corpus(size: int, seed: int = 5) -> list:
+    """[(text, expected urgency or None)] — None when truncation removed urgency."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        text = _fuzz(_answer(rng), rng)
+        match = _URGENCY.search(text)
+        corpus.append((text, match.group(1) if match else None))
+    return corpus
+
+
+def legacy_parse(text: str) -> dict:
+    text = text.strip()
+    if "```" in text:
+        text = text.split("```")[1].lstrip("json").strip()
+    result = json.loads(text)
+    result.setdefault("urgency", "LOW")
+    result["urgency"] = result["urgency"].upper()
+    return result
+
+
+def _score(parser, corpus) -> tuple:
+    correct = 0
+    start = time.perf_counter()
+    for text, expected in corpus:
+        try:
+            correct += parser(text)["urgency"] == expected
+        except Exception:
+            pass
+    return correct, time.perf_counter() - start
+
+
+def main(size: int = 10_000) -> None:
+    logging.disable(logging.INFO)
+    corpus = fuzzed_corpus(size)
+    recoverable = sum(expected is not None for _, expected in corpus)
+    print(f"{size} fuzzed outputs, {recoverable} still contain a complete urgency")
+    print(f"{'parser':>9} {'failure rate':>13} {'us/output':>10}")
+    for name, parser in (("legacy", legacy_parse), ("tolerant", parse_completion)):
+        correct, elapsed = _score(parser, corpus)
+        print(f"{name:>9} {1 - correct / recoverable:>13.1%} {elapsed / size * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--write-corpus"]:
+        with open(args[1], "w", encoding="utf-8") as fh:
+            for text, expected in fuzzed_corpus(int(args[2]) if len(args) > 2 else 200):
+                fh.write(json.dumps({"text": text, "urgency": expected}) + "\n")
+    else:
+        main(int(args[0]) if args else 10_000)
@@ -0,0 +1,94 @@
+"""Benchmark: keyword fallback matching over a synthetic message corpus.
+
+Compares the original per-keyword substring scan (one ``in`` per phrase)
+with the precompiled Aho–Corasick matcher, for the shipped lexicon and for
+lexicons padded with synthetic phrases to the sizes a multilingual lexicon
+is expected to reach. The naive scan is timed on a sample of the corpus
+when the lexicon is large, since its cost grows with every phrase added.
+
+Run from the project root:
+    python benchmarks/bench_keyword_matcher.py [messages]
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.keyword_matcher import DEFAULT_LEXICON_PATH, KeywordMatcher, _lexicon_entries  # noqa: E402
+
+FILLER = (
+    "i have had a since yesterday my and the it is getting worse today "
+    "please help son daughter mother feel tired cough headache sore throat "
+    "tengo dolor desde ayer j'ai mal depuis hier estou com"
+).split()
+NAIVE_SAMPLE = 10_000
+
+
+def _corpus(entries, messages: int, rng: random.Random) -> list:
+    phrases = [phrase for phrase, _ in entries]
+    corpus = []
+    for _ in range(messages):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(5, 25))]
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(phrases))
+        corpus.append(" ".join(words).capitalize())
+    return corpus
+
+
+def _synthetic_phrases(count: int, rng: random.Random) -> list:
+    syllables = ["ka", "lo", "mi", "dor", "pe", "tra", "sin", "ve", "qu", "ra", "to", "ne"]
+    return [
+        (" ".join("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                  for _ in range(rng.randint(1, 3))), rng.choice(["HIGH", "MEDIUM"]))
+        for _ in range(count)
+    ]
+
+
+def _naive(entries, corpus) -> int:
+    hits = 0
+    for message in corpus:
+        text = message.lower()
+        for phrase, _ in entries:
+            if phrase in text:
+                hits += 1
+    return hits
+
+
+def _automaton(matcher, corpus) -> int:
+    return sum(len(matcher.find_all(message)) for message in corpus)
+
+
+def _rate(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return len(args[-1]) / (time.perf_counter() - start)
+
+
+def main(messages: int = 100_000) -> None:
+    rng = random.Random(42)
+    with open(DEFAULT_LEXICON_PATH, encoding="utf-8") as fh:
+        shipped = list(dict(_lexicon_entries(json.load(fh))).items())
+
+    print(f"Keyword matching throughput, {messages} synthetic messages (messages/s)")
+    print(f"{'phrases':>8} {'build ms':>9} {'naive scan':>11} {'aho-corasick':>13} {'speed-up':>9}")
+    for extra in (0, 1_000, 5_000):
+        entries = shipped + _synthetic_phrases(extra, rng)
+        corpus = _corpus(entries, messages, rng)
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(entries)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        naive = _rate(_naive, entries, corpus[:NAIVE_SAMPLE] if extra else corpus)
+        fast = _rate(_automaton, matcher, corpus)
+        print(f"{len(entries):>8} {build_ms:>9.1f} {naive:>11,.0f} {fast:>13,.0f} {fast / naive:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
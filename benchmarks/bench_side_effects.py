@@ -0,0 +1,87 @@
+"""Benchmark: sequential vs concurrent post-reply side effects in lambda_handler.
+
+Drives the real handler in-process with stub DynamoDB, S3 and SNS clients that
+sleep for a fixed delay per call, and reports p50/p99 handler latency for each
+SIDE_EFFECTS_MODE. LLM_PROVIDER=unknown keeps classification local.
+
+Run from the project root:
+    python benchmarks/bench_side_effects.py [requests]
+"""
+
+from __future__ import annotations
+
+import importlib
+import os
+import statistics
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DELAYS_MS = {"get_item": 8, "put_item": 15, "put_object": 30, "publish": 25}
+
+ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "DYNAMODB_TABLE": "bench-table",
+    "S3_BUCKET": "bench-bucket",
+    "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:123456789012:bench",
+    "TWILIO_AUTH_TOKEN": "bench-token",
+    "LLM_PROVIDER": "unknown",
+}
+
+
+class _Delayed:
+    """Stub AWS client/table whose listed operations just sleep."""
+
+    def __getattr__(self, name):
+        delay = DELAYS_MS[name] / 1000
+
+        def call(**kwargs):
+            time.sleep(delay)
+            return {}
+        return call
+
+
+def _event(i: int) -> dict:
+    # Alternate HIGH and LOW messages so half the requests publish an alert
+    text = "Chest+pain" if i % 2 else "Mild+headache"
+    return {
+        "body": f"From=%2B1555000{i % 1000:04d}&Body={text}",
+        "headers": {"X-Twilio-Signature": "bench"},
+        "requestContext": {"domainName": "bench.local", "http": {"path": "/webhook"}},
+    }
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main(requests: int = 100) -> None:
+    with mock.patch.dict(os.environ, ENV):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+        lambda_function.verify_twilio_signature = lambda *args: True
+        lambda_function.table = _Delayed()
+        lambda_function.s3_client = _Delayed()
+        lambda_function.sns_client = _Delayed()
+
+        print(f"lambda_handler latency over {requests} requests, stub delays {DELAYS_MS}")
+        for mode in ("sequential", "concurrent"):
+            os.environ["SIDE_EFFECTS_MODE"] = mode
+            samples = []
+            for i in range(requests):
+                start = time.perf_counter()
+                lambda_function.lambda_handler(_event(i), None)
+                samples.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{mode:<11} p50={statistics.median(samples):7.2f} ms  "
+                f"p99={_percentile(samples, 99):7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,89 @@
+"""Benchmark: serialized DynamoDB request bytes per store_conversation call.
+
+Replays a conversation of N messages against a stub table that serializes
+every request with boto3's TypeSerializer (what goes over the wire) and
+compares whole-item put_item with the dirty-field UpdateItem path.
+
+Run from the project root:
+    python benchmarks/bench_store_bytes.py [messages]
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+
+from src.utils import (  # noqa: E402
+    build_response_and_state,
+    increment_message_count,
+    load_conversation,
+    store_conversation,
+    trim_history,
+)
+
+USER = "+15550001234"
+MESSAGE = "I have had a sore throat and a mild fever since yesterday evening."
+
+
+class _SerializingTable:
+    """Stub table that keeps one item and records request sizes."""
+
+    def __init__(self) -> None:
+        self.item = None
+        self.sizes = []
+        self._serializer = TypeSerializer()
+
+    def _record(self, **kwargs) -> None:
+        wire = {
+            k: {n: self._serializer.serialize(v) for n, v in val.items()}
+            if k in ("Item", "ExpressionAttributeValues", "Key") else val
+            for k, val in kwargs.items()
+        }
+        self.sizes.append(len(json.dumps(wire)))
+
+    def get_item(self, Key):
+        return {"Item": self.item} if self.item else {}
+
+    def put_item(self, Item):
+        self._record(Item=Item)
+        self.item = json.loads(json.dumps(Item))
+
+    def update_item(self, **kwargs):
+        conversation = kwargs.pop("_conversation")
+        self._record(**kwargs)
+        self.item = json.loads(json.dumps(conversation))
+
+
+def _replay(messages: int, partial: bool) -> list:
+    table = _SerializingTable()
+    if partial:
+        original = table.update_item
+        table.update_item = lambda **kw: original(_conversation=current, **kw)
+    for _ in range(messages):
+        current = load_conversation(table, USER)
+        if not partial:
+            current = dict(current)
+        increment_message_count(current)
+        build_response_and_state({"urgency": "LOW"}, current, MESSAGE, None, "", USER)
+        trim_history(current)
+        store_conversation(table, current)
+    return table.sizes
+
+
+def main(messages: int = 60) -> None:
+    before = _replay(messages, partial=False)
+    after = _replay(messages, partial=True)
+    print(f"Serialized bytes per store over {messages} messages")
+    print(f"{'message':>8} {'put_item':>10} {'update_item':>12}")
+    for n in sorted({1, 5, 10, 20, messages // 2, messages}):
+        print(f"{n:>8} {before[n - 1]:>10} {after[n - 1]:>12}")
+    print(f"{'total':>8} {sum(before):>10} {sum(after):>12}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 60)
@@ -0,0 +1,103 @@
+"""Benchmark: time-to-decision of streaming vs blocking Bedrock classification.
+
+A stand-in bedrock-runtime client emits the completion at a fixed
+time-to-first-token and per-token rate (defaults roughly match Claude 3 Haiku;
+override with TTFT_MS and TOKEN_MS). The blocking call returns after the last
+token, as invoke_model does; the streaming call yields ~4-character deltas.
+
+    blocking   _classify_bedrock — reply can be chosen only when it returns
+    decision   stream_classification until urgency() returns
+    complete   stream_classification until result() returns
+
+Run from the project root:
+    python benchmarks/bench_streaming.py [requests]
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.prompts import SYSTEM_PROMPT  # noqa: E402
+from src.streaming import stream_classification  # noqa: E402
+from src.utils import _classify_bedrock  # noqa: E402
+
+TTFT_MS = float(os.getenv("TTFT_MS", 350))
+TOKEN_MS = float(os.getenv("TOKEN_MS", 8))
+CHARS_PER_TOKEN = 4
+
+
+def _completion(rng: random.Random) -> str:
+    symptoms = rng.sample(["fever", "cough", "headache", "chest pain", "nausea", "dizziness"], 3)
+    return json.dumps({
+        "urgency": rng.choice(["LOW", "MEDIUM", "HIGH"]),
+        "symptoms": symptoms,
+        "duration": f"{rng.randint(1, 9)} days",
+        "age": str(rng.randint(18, 90)),
+        "red_flags": symptoms[: rng.randint(0, 2)],
+    })
+
+
+class _StandInClient:
+    def __init__(self, text: str) -> None:
+        self.deltas = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        self.text = text
+
+    def invoke_model(self, **_):
+        time.sleep((TTFT_MS + TOKEN_MS * len(self.deltas)) / 1000)
+        body = json.dumps({"content": [{"type": "text", "text": self.text}]})
+        return {"body": io.BytesIO(body.encode())}
+
+    def invoke_model_with_response_stream(self, **_):
+        return {"body": self._events()}
+
+    def _events(self):
+        time.sleep(TTFT_MS / 1000)
+        for delta in self.deltas:
+            payload = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": delta}}
+            yield {"chunk": {"bytes": json.dumps(payload).encode()}}
+            time.sleep(TOKEN_MS / 1000)
+
+
+def _report(label: str, samples: list) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:<10} mean={statistics.mean(samples):7.1f} ms  "
+          f"p50={statistics.median(samples):7.1f} ms  p95={p95:7.1f} ms")
+
+
+def main(requests: int = 20) -> None:
+    rng = random.Random(11)
+    blocking, decision, complete = [], [], []
+    for _ in range(requests):
+        client = _StandInClient(_completion(rng))
+        with mock.patch("src.utils.get_bedrock_client", return_value=client), \
+                mock.patch("src.streaming.get_bedrock_client", return_value=client):
+            start = time.perf_counter()
+            _classify_bedrock("I feel unwell", SYSTEM_PROMPT, "I feel unwell")
+            blocking.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            pending = stream_classification("I feel unwell", [])
+            pending.urgency()
+            decision.append((time.perf_counter() - start) * 1000)
+            pending.result()
+            complete.append((time.perf_counter() - start) * 1000)
+
+    print(f"Bedrock classification, {requests} requests "
+          f"(TTFT {TTFT_MS:.0f} ms, {TOKEN_MS:.0f} ms/token, ~{len(client.deltas)} tokens)")
+    _report("blocking", blocking)
+    _report("decision", decision)
+    _report("complete", complete)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
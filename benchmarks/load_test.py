@@ -0,0 +1,429 @@
+"""Load test: drive lambda_handler with synthetic, correctly-signed Twilio traffic.
+
+Requests are generated open-loop — each is scheduled at a fixed time by the
+traffic pattern and latency is measured from that time, so a saturated
+handler shows up as queueing rather than as a lower offered rate.
+
+    steady  --rate requests per second for --duration seconds
+    burst   --burst-size requests at once every --burst-interval seconds
+    ramp    rate rising linearly from 0 to --rate over --duration
+
+Senders are drawn from --users phone numbers (Zipf-skewed by --skew, so a few
+users send most messages, as in a real campaign) and messages from the
+LOW/MEDIUM/HIGH corpora below in the proportions given by --mix. Every body
+is signed with the real X-Twilio-Signature algorithm (utils.twilio_signature)
+and checked by the handler.
+
+In-process (default), lambda_handler runs on --concurrency threads, one
+thread standing in for one warm container (they share a process, so the
+container caches are shared too). DynamoDB, S3 and SNS are moto stand-ins
+with --ddb-ms/--s3-ms/--sns-ms latency added per call through botocore
+hooks, and Bedrock is a stand-in client with --ttft-ms + --token-ms per
+output token; --jitter varies every latency by ±that fraction. Each request
+is broken down into stages by timing the handler's collaborators:
+
+    signature     verify_twilio_signature
+    conversation  load_conversation + complete_conversation
+    classify      classify_message (or stream_classification until urgency)
+    reply         build_response_and_state
+    side_effects  run_side_effects, plus one effect:<name> row per effect
+    other         everything else (parsing, rate limit, logging, TwiML)
+
+With --url the same traffic is POSTed over HTTP instead (e.g. to
+local_runner.py or `sam local start-api`); only total latency is reported
+then, and the server's own dependencies are used.
+
+Run from the project root:
+    python benchmarks/load_test.py --pattern burst --burst-size 50 --duration 10
+    python benchmarks/load_test.py --url http://localhost:5000/webhook --rate 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils import fallback_classifier, twilio_signature  # noqa: E402
+
+REGION = "us-east-1"
+AUTH_TOKEN = "load-test-token"
+DOMAIN = "loadtest.execute-api.us-east-1.amazonaws.com"
+PATH = "/webhook"
+ENV = {
+    "DYNAMODB_TABLE": "loadtest-table",
+    "S3_BUCKET": "loadtest-bucket",
+    "SNS_TOPIC_ARN": f"arn:aws:sns:{REGION}:123456789012:loadtest-topic",
+    "TWILIO_AUTH_TOKEN": AUTH_TOKEN,
+    "LLM_PROVIDER": "bedrock",
+    "AWS_DEFAULT_REGION": REGION,
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+}
+
+MESSAGES = {
+    "low": [
+        "I have a mild headache since this morning",
+        "Runny nose and a bit of a sore throat",
+        "Feeling tired after a cold last week",
+        "Small cut on my finger, it stopped bleeding",
+    ],
+    "medium": [
+        "I have had a fever of 39 for three days",
+        "Painful urination and lower back pain since yesterday",
+        "My ear has been hurting for a week and now there is discharge",
+        "Vomiting since last night and I can't keep water down",
+    ],
+    "high": [
+        "Crushing chest pain spreading to my left arm",
+        "My father suddenly can't move his right side and his speech is slurred",
+        "I can't breathe properly and my lips are turning blue",
+        "She took a whole bottle of pills and is very drowsy",
+    ],
+}
+STAGES = ("signature", "conversation", "classify", "reply", "side_effects")
+LIMITED_REPLY = "too many messages"
+
+_local = threading.local()
+
+
+# ---------------------------------------------------------------------------
+# Traffic
+# ---------------------------------------------------------------------------
+
+def schedule(args: argparse.Namespace) -> List[float]:
+    """Offsets (seconds from start) at which requests are sent."""
+    if args.pattern == "burst":
+        bursts = max(1, int(args.duration / args.burst_interval))
+        return [b * args.burst_interval for b in range(bursts) for _ in range(args.burst_size)]
+    total = int(args.rate * args.duration)
+    if args.pattern == "ramp":
+        # rate(t) = rate * t / duration  →  n(t) = rate * t² / (2 * duration)
+        return [(2 * args.duration * i / args.rate) ** 0.5 for i in range(total // 2)]
+    return [i / args.rate for i in range(total)]
+
+
+class Traffic:
+    """Draws (sender, message) pairs from the user population and message mix."""
+
+    def __init__(self, users: int, skew: float, mix: Dict[str, float], seed: int = 7) -> None:
+        self.rng = random.Random(seed)
+        self.users = [f"whatsapp:+1555{n:07d}" for n in range(users)]
+        self.user_weights = [1 / (rank + 1) ** skew for rank in range(users)]
+        self.kinds = list(mix)
+        self.kind_weights = [mix[k] for k in self.kinds]
+
+    def next(self) -> Tuple[str, str, str]:
+        user = self.rng.choices(self.users, self.user_weights)[0]
+        kind = self.rng.choices(self.kinds, self.kind_weights)[0]
+        return user, kind, self.rng.choice(MESSAGES[kind])
+
+
+def signed_request(url: str, user: str, message: str) -> Tuple[str, str]:
+    """(form body, X-Twilio-Signature) for a WhatsApp message to ``url``."""
+    params = {
+        "From": user,
+        "To": "whatsapp:+14155238886",
+        "Body": message,
+        "MessageSid": f"SM{random.getrandbits(128):032x}",
+        "NumMedia": "0",
+    }
+    return urlencode(params), twilio_signature(url, params, AUTH_TOKEN)
+
+
+# ---------------------------------------------------------------------------
+# In-process stand-ins
+# ---------------------------------------------------------------------------
+
+class _StandInBedrock:
+    def __init__(self, ttft_ms: float, token_ms: float, jitter: float) -> None:
+        self.ttft_ms, self.token_ms, self.jitter = ttft_ms, token_ms, jitter
+
+    def invoke_model(self, body: str, **_):
+        text = self._completion(body)
+        _sleep((self.ttft_ms + self.token_ms * len(text) / 4) / 1000, self.jitter)
+        payload = json.dumps({"content": [{"type": "text", "text": text}]})
+        return {"body": io.BytesIO(payload.encode())}
+
+    def invoke_model_with_response_stream(self, body: str, **_):
+        return {"body": self._events(self._completion(body))}
+
+    def _events(self, text: str):
+        _sleep(self.ttft_ms / 1000, self.jitter)
+        for i in range(0, len(text), 4):
+            payload = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text[i:i + 4]}}
+            yield {"chunk": {"bytes": json.dumps(payload).encode()}}
+            time.sleep(self.token_ms / 1000)
+
+    @staticmethod
+    def _completion(body: str) -> str:
+        content = json.loads(body)["messages"][0]["content"]
+        result = fallback_classifier(content.rpartition("Latest message: ")[2])
+        result.pop("source", None)
+        return json.dumps(result)
+
+
+def _sleep(seconds: float, jitter: float) -> None:
+    if seconds > 0:
+        time.sleep(seconds * random.uniform(1 - jitter, 1 + jitter))
+
+
+def _inject_latency(latency_ms: Dict[str, float], jitter: float) -> None:
+    """Delay every botocore call by the latency configured for its service.
+
+    Registered on the default session after moto has replaced it and before
+    any client exists, so every client the handler creates inherits the hook.
+    """
+    import boto3
+
+    def delay(model, **_):
+        _sleep(latency_ms.get(model.service_model.service_name, 0) / 1000, jitter)
+
+    boto3.setup_default_session(region_name=REGION)
+    boto3.DEFAULT_SESSION.events.register("before-call", delay)
+
+
+def _timed(stage: str, fn: Callable) -> Callable:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stages = getattr(_local, "stages", None)
+            if stages is not None:
+                stages[stage] += (time.perf_counter() - start) * 1000
+    return wrapper
+
+
+def _instrument(module) -> List[Any]:
+    """Patch the handler's collaborators with stage timers; returns the patchers."""
+    def side_effects(effects, *args, **kwargs):
+        timings = run(effects, *args, **kwargs)
+        stages = getattr(_local, "stages", None)
+        if stages is not None:
+            for name, ms in (timings or {}).items():
+                stages[f"effect:{name}"] += ms
+        return timings
+
+    def streamed(*args, **kwargs):
+        pending = stream(*args, **kwargs)
+        pending.urgency = _timed("classify", pending.urgency)
+        return pending
+
+    run = _timed("side_effects", module.run_side_effects)
+    stream = _timed("classify", module.stream_classification)
+    conversation = _timed("conversation", module.load_conversation)
+    patches = {
+        "verify_twilio_signature": _timed("signature", module._utils.verify_twilio_signature),
+        "load_conversation": conversation,
+        "complete_conversation": _timed("conversation", module.complete_conversation),
+        "classify_message": _timed("classify", module.classify_message),
+        "stream_classification": streamed,
+        "build_response_and_state": _timed("reply", module.build_response_and_state),
+        "run_side_effects": side_effects,
+    }
+    return [mock.patch.object(module, name, fn, create=True) for name, fn in patches.items()]
+
+
+def in_process_target(args: argparse.Namespace) -> Callable[[str, str], Tuple[Dict[str, float], bool]]:
+    """Set up the stand-ins and return a function sending one message."""
+    from moto import mock_dynamodb, mock_s3, mock_sns
+
+    os.environ.update(ENV)  # moto credentials and the stand-in resource names
+    for mocker in (mock_dynamodb(), mock_s3(), mock_sns()):
+        mocker.start()
+    _inject_latency({"dynamodb": args.ddb_ms, "s3": args.s3_ms, "sns": args.sns_ms}, args.jitter)
+
+    import boto3
+    boto3.resource("dynamodb").create_table(
+        TableName=os.environ["DYNAMODB_TABLE"],
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("s3").create_bucket(Bucket=os.environ["S3_BUCKET"])
+    boto3.client("sns").create_topic(Name=os.environ["SNS_TOPIC_ARN"].rsplit(":", 1)[-1])
+
+    module = importlib.import_module("src.lambda_function")
+    bedrock = _StandInBedrock(args.ttft_ms, args.token_ms, args.jitter)
+    for patcher in _instrument(module) + [
+        mock.patch("src.utils.get_bedrock_client", return_value=bedrock),
+        mock.patch("src.streaming.get_bedrock_client", return_value=bedrock),
+    ]:
+        patcher.start()
+    url = f"https://{DOMAIN}{PATH}"
+
+    def send(user: str, message: str) -> Tuple[Dict[str, float], bool]:
+        body, signature = signed_request(url, user, message)
+        event = {
+            "body": body,
+            "headers": {"X-Twilio-Signature": signature, "Content-Type": "application/x-www-form-urlencoded"},
+            "requestContext": {"domainName": DOMAIN, "http": {"path": PATH, "method": "POST"}},
+        }
+        _local.stages = defaultdict(float)
+        response = module.lambda_handler(event, None)
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"HTTP {response['statusCode']}: {response['body']}")
+        return dict(_local.stages), LIMITED_REPLY in response["body"]
+
+    return send
+
+
+def http_target(url: str) -> Callable[[str, str], Tuple[Dict[str, float], bool]]:
+    parts = urlsplit(url)
+    # Twilio signs the public URL, without a default or local port
+    signed_url = f"{parts.scheme}://{parts.hostname}{parts.path}"
+
+    def send(user: str, message: str) -> Tuple[Dict[str, float], bool]:
+        body, signature = signed_request(signed_url, user, message)
+        request = urllib.request.Request(url, data=body.encode(), method="POST", headers={
+            "X-Twilio-Signature": signature, "Content-Type": "application/x-www-form-urlencoded",
+        })
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return {}, LIMITED_REPLY in response.read().decode("utf-8", "replace")
+
+    return send
+
+
+# ---------------------------------------------------------------------------
+# Run and report
+# ---------------------------------------------------------------------------
+
+def run(args: argparse.Namespace, send: Callable) -> Dict[str, Any]:
+    offsets = schedule(args)
+    traffic = Traffic(args.users, args.skew, args.mix)
+    totals: List[float] = []
+    waits: List[float] = []
+    stages: Dict[str, List[float]] = defaultdict(list)
+    counts = defaultdict(int)
+    lock = threading.Lock()
+
+    def one(offset: float, user: str, kind: str, message: str) -> None:
+        started = time.perf_counter()
+        try:
+            breakdown, limited = send(user, message)
+            error = None
+        except Exception as exc:
+            breakdown, limited, error = {}, False, exc
+        done = time.perf_counter()
+        with lock:
+            waits.append((started - (start + offset)) * 1000)
+            totals.append((done - (start + offset)) * 1000)
+            counts[kind] += 1
+            if error is not None:
+                counts["errors"] += 1
+                if counts["errors"] <= 3:
+                    print(f"error: {error}", file=sys.stderr)
+                return
+            counts["rate_limited"] += limited
+            if breakdown:
+                service = (done - started) * 1000
+                for stage in STAGES:
+                    stages[stage].append(breakdown.get(stage, 0.0))
+                for stage, ms in breakdown.items():
+                    if stage.startswith("effect:"):
+                        stages[stage].append(ms)
+                stages["other"].append(service - sum(breakdown.get(s, 0.0) for s in STAGES))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        start = time.perf_counter()
+        for offset in offsets:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, offset, *traffic.next())
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(totals),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(totals) / elapsed, 1),
+        "offered_rps": round(len(offsets) / args.duration, 1),
+        "counts": dict(counts),
+        "latency_ms": {"total": _summary(totals), "queue": _summary(waits),
+                       **{stage: _summary(values) for stage, values in stages.items()}},
+    }
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))], 1)
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": round(ordered[-1], 1)}
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    counts = result["counts"]
+    print(f"{result['requests']} requests in {result['elapsed_s']} s → {result['throughput_rps']} req/s "
+          f"(offered {result['offered_rps']})  errors={counts.get('errors', 0)} "
+          f"rate_limited={counts.get('rate_limited', 0)}  "
+          + " ".join(f"{k}={counts.get(k, 0)}" for k in MESSAGES))
+    print(f"{'stage (ms)':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage, summary in result["latency_ms"].items():
+        if summary:
+            print(f"{stage:<22}" + "".join(f"{summary[k]:>9.1f}" for k in ("p50", "p95", "p99", "max")))
+
+
+def _mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition(":")
+        if kind.strip() not in MESSAGES:
+            raise argparse.ArgumentTypeError(f"unknown message kind: {kind}")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="POST to this webhook URL instead of calling the handler in-process")
+    parser.add_argument("--pattern", choices=["steady", "burst", "ramp"], default="steady")
+    parser.add_argument("--rate", type=float, default=20.0, help="requests/s (steady, ramp peak)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--burst-size", type=int, default=50)
+    parser.add_argument("--burst-interval", type=float, default=5.0, help="seconds between bursts")
+    parser.add_argument("--concurrency", type=int, default=32, help="handler threads (warm containers)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of sender popularity (0 = uniform)")
+    parser.add_argument("--mix", type=_mix, default=_mix("low:70,medium:25,high:5"))
+    parser.add_argument("--ddb-ms", type=float, default=8.0)
+    parser.add_argument("--s3-ms", type=float, default=25.0)
+    parser.add_argument("--sns-ms", type=float, default=20.0)
+    parser.add_argument("--ttft-ms", type=float, default=350.0)
+    parser.add_argument("--token-ms", type=float, default=8.0)
+    parser.add_argument("--jitter", type=float, default=0.3, help="±fraction applied to every latency")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the handler's logs")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    send = http_target(args.url) if args.url else in_process_target(args)
+    result = run(args, send)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
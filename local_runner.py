@@ -24,6 +24,7 @@ from flask import Flask, Response, request
 
 # Support running from the project root (python local_runner.py)
 try:
+    from src.transcripts import append_transcript
     from src.utils import (
         build_response_and_state,
         classify_message,
@@ -33,9 +34,10 @@ try:
         load_conversation,
         sanitize_input,
         store_conversation,
-        upload_transcript,
+        trim_history,
     )
 except ImportError:
+    from transcripts import append_transcript  # type: ignore
     from utils import (  # type: ignore
         build_response_and_state,
         classify_message,
@@ -45,7 +47,7 @@ except ImportError:
         load_conversation,
         sanitize_input,
         store_conversation,
-        upload_transcript,
+        trim_history,
     )
 
 load_dotenv()
@@ -83,19 +85,22 @@ def webhook() -> Response:
         return Response(twiml, mimetype="application/xml")
 
     increment_message_count(conversation)
-    triage_result = classify_message(message, conversation.get("history", []), provider=llm_provider)
+    triage_result = classify_message(
+        message, conversation.get("history", []), provider=llm_provider,
+        summary=conversation.get("summary"),
+    )
+    turns_before = len(conversation.get("history", []))
+    first_new_turn = int(conversation.get("history_offset", 0)) + turns_before
     reply = build_response_and_state(
         triage_result, conversation, message, sns_client, topic_arn or "", user_id
     )
+    new_turns = conversation["history"][turns_before:]
+    trim_history(conversation)
 
     if table:
         store_conversation(table, conversation)
     if bucket_name:
-        lines = [
-            f"{msg['timestamp']} [{msg.get('role', 'patient')}]: {msg['message']}"
-            for msg in conversation.get("history", [])
-        ]
-        upload_transcript(s3_client, bucket_name, user_id, "\n".join(lines))
+        append_transcript(s3_client, bucket_name, user_id, new_turns, first_new_turn)
 
     return Response(generate_twiml_response(reply), mimetype="application/xml")
 
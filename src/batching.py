@@ -0,0 +1,271 @@
+"""Micro-batched LLM classification for bursts of patient messages.
+
+During an outbreak or a broadcast campaign hundreds of patients can message
+within seconds, and one Bedrock call per message runs into the account's
+request-rate quota long before its token quota. With BATCH_CLASSIFY=on, a
+long-lived process (the SQS worker, or a local runner) submits
+classifications to a BatchCoalescer instead of calling the model directly.
+The coalescer collects submissions for up to BATCH_MAX_WAIT_MS or until
+BATCH_MAX_ITEMS are pending and classifies them with one multi-item prompt.
+
+Patients in a batch share a request, so the per-item results are isolated:
+
+- each patient's text is JSON-encoded under an opaque id (``p1``, ``p2``…),
+  never concatenated, and the prompt tells the model to triage each id from
+  its own text only
+- each id's answer is validated on its own with coerce_triage; one malformed,
+  missing or truncated entry never affects the others
+- any item without a valid answer — or every item, if the batch call fails or
+  the Bedrock breaker is open — is classified again on its own with
+  classify_message, so a batch never yields a worse result than the single
+  call would have
+
+Only Bedrock is batched; with LLM_PROVIDER=openai items go one by one.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from circuit_breaker import get_circuit_breaker
+    from clients import get_bedrock_client
+    from json_extract import coerce_triage, extract_object
+    from prompts import BATCH_SYSTEM_PROMPT, build_prompt
+    from utils import MAX_OUTPUT_TOKENS, classify_message, invoke_bedrock, usage_fields
+except ImportError:
+    from src.circuit_breaker import get_circuit_breaker
+    from src.clients import get_bedrock_client
+    from src.json_extract import coerce_triage, extract_object
+    from src.prompts import BATCH_SYSTEM_PROMPT, build_prompt
+    from src.utils import MAX_OUTPUT_TOKENS, classify_message, invoke_bedrock, usage_fields
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ITEMS = 8
+DEFAULT_MAX_WAIT_MS = 20.0
+MAX_WORKERS = 4              # batches in flight at once
+ITEM_OUTPUT_TOKENS = 160     # completion budget per patient
+MAX_BATCH_OUTPUT_TOKENS = 4096
+
+
+class BatchItem(NamedTuple):
+    """One pending classification."""
+
+    message: str
+    history: List[Dict[str, Any]]
+    summary: Optional[str] = None
+
+
+def batch_ids(count: int) -> List[str]:
+    return [f"p{n}" for n in range(1, count + 1)]
+
+
+def build_batch_prompt(items: Sequence[BatchItem], ids: Sequence[str]) -> Tuple[str, str]:
+    """Return (system, user) for one request covering every item.
+
+    Each item's context is packed exactly as for a single call (build_prompt)
+    and JSON-encoded, so quotes or braces in one patient's text cannot break
+    out into another's entry.
+    """
+    patients = [
+        {"id": item_id, "message": build_prompt(item.message, item.history, item.summary).user}
+        for item_id, item in zip(ids, items)
+    ]
+    return BATCH_SYSTEM_PROMPT, json.dumps(patients, ensure_ascii=False)
+
+
+def parse_batch(text: str, ids: Sequence[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Map each id to its validated triage result, or None when its entry is
+    missing or invalid. Raises ValueError only if no JSON object is found."""
+    obj, repairs = extract_object(text)
+    if repairs:
+        logger.info(json.dumps({"event": "llm_json_repaired", "repairs": repairs, "batch": True}))
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    for item_id in ids:
+        entry = obj.get(item_id)
+        try:
+            results[item_id] = coerce_triage(entry) if isinstance(entry, dict) else None
+        except ValueError:
+            results[item_id] = None
+    return results
+
+
+def batch_output_tokens(count: int) -> int:
+    return min(MAX_BATCH_OUTPUT_TOKENS, max(MAX_OUTPUT_TOKENS, count * ITEM_OUTPUT_TOKENS))
+
+
+def classify_batch(
+    items: Sequence[BatchItem],
+    provider: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Classify ``items`` with one Bedrock call; returns results in item order.
+
+    Items the batch answer does not cover with a valid result are classified
+    individually (see the module docstring).
+    """
+    provider = (provider or os.getenv("LLM_PROVIDER", "bedrock")).lower()
+    if len(items) == 1 or provider != "bedrock":
+        return [_classify_one(item, provider, timeout) for item in items]
+
+    ids = batch_ids(len(items))
+    start = time.perf_counter()
+    parsed: Dict[str, Optional[Dict[str, Any]]] = {}
+    usage: Dict[str, int] = {}
+    breaker = get_circuit_breaker("bedrock")
+    if breaker is None or breaker.allow():
+        try:
+            parsed, usage = _call_bedrock(items, ids, timeout)
+            ok = True
+        except Exception as exc:
+            ok = False
+            logger.error(json.dumps({"event": "llm_batch_error", "size": len(items), "error": str(exc)}))
+        if breaker is not None:
+            breaker.record(ok, (time.perf_counter() - start) * 1000)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    results = []
+    retried = 0
+    for item_id, item in zip(ids, items):
+        result = parsed.get(item_id)
+        if result is None:
+            retried += 1
+            result = _classify_one(item, provider, timeout)
+        results.append(result)
+    logger.info(json.dumps({
+        "event": "llm_batch",
+        "size": len(items),
+        "valid": len(items) - retried,
+        "retried": retried,
+        "batch_ms": round(batch_ms, 1),
+        **usage,
+    }))
+    return results
+
+
+def _call_bedrock(
+    items: Sequence[BatchItem], ids: Sequence[str], timeout: Optional[float]
+) -> Tuple[Dict[str, Optional[Dict[str, Any]]], Dict[str, int]]:
+    system, user = build_batch_prompt(items, ids)
+    if timeout is None:
+        client = get_bedrock_client()
+    else:
+        client = get_bedrock_client(read_timeout=max(1, math.ceil(timeout)), max_attempts=1)
+    response, _ = invoke_bedrock(
+        client, "invoke_model", user, system, max_tokens=batch_output_tokens(len(items))
+    )
+    body = json.loads(response["body"].read())
+    return parse_batch(body["content"][0]["text"], ids), usage_fields(body.get("usage"))
+
+
+def _classify_one(item: BatchItem, provider: str, timeout: Optional[float]) -> Dict[str, Any]:
+    return classify_message(
+        item.message,
+        item.history,
+        provider=provider,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=timeout,
+        summary=item.summary,
+    )
+
+
+class BatchCoalescer:
+    """Collects submitted classifications into batches.
+
+    A collector thread takes the first pending item, waits up to
+    ``max_wait_ms`` for more (or until ``max_items``), and hands the batch to
+    a small pool so collection continues while earlier batches are in flight.
+    """
+
+    def __init__(
+        self,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        classify=classify_batch,
+        workers: int = MAX_WORKERS,
+    ) -> None:
+        self.max_items = max(1, max_items)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.classify = classify
+        self.batches = 0
+        self.items = 0
+        self._pending: "queue.Queue[Tuple[BatchItem, Future]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-batch")
+        self._collector = threading.Thread(target=self._collect, name="batch-coalescer", daemon=True)
+        self._collector.start()
+
+    def submit(
+        self, message: str, history: Optional[List[Dict[str, Any]]] = None, summary: Optional[str] = None
+    ) -> Future:
+        """Queue one classification; the Future resolves to its triage result."""
+        future: Future = Future()
+        self._pending.put((BatchItem(message, history or [], summary), future))
+        return future
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_items:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch: List[Tuple[BatchItem, Future]]) -> None:
+        try:
+            results = self.classify([item for item, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_coalescer: Optional[BatchCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> Optional[BatchCoalescer]:
+    """Return the process-wide BatchCoalescer, or None unless BATCH_CLASSIFY=on.
+
+    BATCH_MAX_ITEMS and BATCH_MAX_WAIT_MS bound each batch.
+    """
+    global _coalescer
+    if os.getenv("BATCH_CLASSIFY", "off").lower() not in ("on", "true", "1"):
+        return None
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = BatchCoalescer(
+                    max_items=int(os.getenv("BATCH_MAX_ITEMS", DEFAULT_MAX_ITEMS)),
+                    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", DEFAULT_MAX_WAIT_MS)),
+                )
+    return _coalescer
+
+
+def reset_coalescer() -> None:
+    """Forget the process-wide coalescer (used by tests)."""
+    global _coalescer
+    with _coalescer_lock:
+        _coalescer = None
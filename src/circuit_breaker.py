@@ -0,0 +1,246 @@
+"""Per-provider circuit breakers for the WhatsApp Healthcare Triage Agent.
+
+During a provider outage every message would otherwise wait for botocore
+retries and the read timeout before falling back to keywords, which inflates
+Lambda duration and concurrency exactly when headroom matters. A breaker
+watches the outcomes of recent calls to one provider:
+
+    closed     calls go through; the last WINDOW outcomes are kept
+    open       calls are refused at once and the keyword classifier answers
+    half-open  after OPEN_SECONDS one probe call is let through; success
+               closes the breaker, failure opens it again
+
+The breaker opens when, over at least MIN_CALLS recent calls, the failure
+rate reaches FAILURE_RATE or the rate of calls slower than SLOW_MS reaches
+SLOW_RATE. A call "fails" when the provider helper had to return the keyword
+fallback.
+
+With CIRCUIT_BREAKER_SHARED=on a trip is also written to the conversations
+table (item ``breaker#<provider>``), and closed breakers in other containers
+check it every SHARED_REFRESH_SECONDS so they open together.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+try:
+    from clients import get_client
+except ImportError:
+    from src.clients import get_client
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+WINDOW = 20
+MIN_CALLS = 10
+FAILURE_RATE = 0.5
+SLOW_MS = 4000.0
+SLOW_RATE = 0.8
+OPEN_SECONDS = 30.0
+SHARED_REFRESH_SECONDS = 5.0
+SHARED_PREFIX = "breaker#"
+
+
+class SharedBreakerState:
+    """Trip times shared through the conversations table."""
+
+    def __init__(self, table_name: str) -> None:
+        self.table_name = table_name
+
+    def open_until(self, name: str) -> float:
+        try:
+            item = get_client("dynamodb").get_item(
+                TableName=self.table_name,
+                Key={"user_id": {"S": SHARED_PREFIX + name}},
+                ProjectionExpression="open_until",
+            ).get("Item")
+        except Exception as exc:
+            logger.error(json.dumps({"event": "circuit_shared_error", "error": str(exc)}))
+            return 0.0
+        return float(item["open_until"]["N"]) if item else 0.0
+
+    def trip(self, name: str, open_until: float) -> None:
+        try:
+            get_client("dynamodb").put_item(
+                TableName=self.table_name,
+                Item={
+                    "user_id": {"S": SHARED_PREFIX + name},
+                    "open_until": {"N": repr(round(open_until, 3))},
+                    "ttl": {"N": str(int(open_until) + 3600)},
+                },
+            )
+        except Exception as exc:
+            logger.error(json.dumps({"event": "circuit_shared_error", "error": str(exc)}))
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker around one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = WINDOW,
+        min_calls: int = MIN_CALLS,
+        failure_rate: float = FAILURE_RATE,
+        slow_ms: float = SLOW_MS,
+        slow_rate: float = SLOW_RATE,
+        open_seconds: float = OPEN_SECONDS,
+        shared: Optional[SharedBreakerState] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.shared = shared
+        self._clock = clock
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+        self.state = CLOSED
+        self.open_until = 0.0
+        self._probing = False
+        self._next_shared_check = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may go to the provider now."""
+        now = self._clock()
+        if self.state == CLOSED and self.shared is not None and now >= self._next_shared_check:
+            self._next_shared_check = now + SHARED_REFRESH_SECONDS
+            shared_until = self.shared.open_until(self.name)
+            if shared_until > now:
+                with self._lock:
+                    self._open(shared_until, "shared")
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now >= self.open_until:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, success: bool, elapsed_ms: float) -> None:
+        """Record the outcome of a call that allow() let through."""
+        slow = elapsed_ms >= self.slow_ms
+        trip_until = None
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                else:
+                    trip_until = self._open(self._clock() + self.open_seconds, "probe_failed")
+            elif self.state == CLOSED:
+                self._outcomes.append((not success, slow))
+                reason = self._threshold_crossed()
+                if reason:
+                    trip_until = self._open(self._clock() + self.open_seconds, reason)
+        if trip_until is not None and self.shared is not None:
+            self.shared.trip(self.name, trip_until)
+
+    def wrap(
+        self, call: Callable[[Optional[float]], Dict[str, Any]], fallback: Callable[[], Dict[str, Any]]
+    ) -> Callable[[Optional[float]], Dict[str, Any]]:
+        """Guard a provider helper; ``fallback`` answers while the breaker is open."""
+
+        def guarded(timeout: Optional[float]) -> Dict[str, Any]:
+            if not self.allow():
+                logger.warning(json.dumps({"event": "circuit_open", "provider": self.name}))
+                return fallback()
+            start = time.perf_counter()
+            result = call(timeout)
+            self.record(result.get("source") != "keywords", (time.perf_counter() - start) * 1000)
+            return result
+
+        return guarded
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "failures": sum(f for f, _ in self._outcomes),
+                "slow": sum(s for _, s in self._outcomes),
+            }
+
+    def _threshold_crossed(self) -> Optional[str]:
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return None
+        if sum(f for f, _ in self._outcomes) / calls >= self.failure_rate:
+            return "failure_rate"
+        if sum(s for _, s in self._outcomes) / calls >= self.slow_rate:
+            return "slow_rate"
+        return None
+
+    def _open(self, until: float, reason: str) -> float:
+        self.open_until = until
+        self._outcomes.clear()
+        self._transition(OPEN, reason)
+        return until
+
+    def _transition(self, state: str, reason: Optional[str] = None) -> None:
+        if state == self.state and state != OPEN:
+            return
+        logger.warning(json.dumps({
+            "event": "circuit_state", "provider": self.name, "from": self.state, "to": state,
+            **({"reason": reason} if reason else {}),
+        }))
+        self.state = state
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> Optional[CircuitBreaker]:
+    """Return the container-wide breaker for ``provider``, or None unless CIRCUIT_BREAKER=on.
+
+    Thresholds come from CIRCUIT_BREAKER_FAILURE_RATE, _SLOW_MS, _SLOW_RATE,
+    _MIN_CALLS and _OPEN_SECONDS; CIRCUIT_BREAKER_SHARED=on shares trips via
+    the DYNAMODB_TABLE table.
+    """
+    if os.getenv("CIRCUIT_BREAKER", "off").lower() not in ("on", "true", "1"):
+        return None
+    breaker = _breakers.get(provider)
+    if breaker is not None:
+        return breaker
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            shared = None
+            table_name = os.getenv("DYNAMODB_TABLE")
+            if table_name and os.getenv("CIRCUIT_BREAKER_SHARED", "off").lower() in ("on", "true", "1"):
+                shared = SharedBreakerState(table_name)
+            breaker = CircuitBreaker(
+                provider,
+                min_calls=int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", MIN_CALLS)),
+                failure_rate=float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", FAILURE_RATE)),
+                slow_ms=float(os.getenv("CIRCUIT_BREAKER_SLOW_MS", SLOW_MS)),
+                slow_rate=float(os.getenv("CIRCUIT_BREAKER_SLOW_RATE", SLOW_RATE)),
+                open_seconds=float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", OPEN_SECONDS)),
+                shared=shared,
+            )
+            _breakers[provider] = breaker
+    return breaker
+
+
+def reset_circuit_breakers() -> None:
+    """Forget every breaker (used by tests)."""
+    with _breakers_lock:
+        _breakers.clear()
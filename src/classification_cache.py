@@ -0,0 +1,237 @@
+"""Cache of LLM triage results for the WhatsApp Healthcare Triage Agent.
+
+Many inbound messages are near-identical, and every one of them costs a paid
+Bedrock/OpenAI call. classify_message consults this cache before invoking a
+provider. The key is the provider and model, the normalised message text
+(Unicode NFKC, case, punctuation and whitespace folded) and a hash of the
+conversation context window and summary, so the same words in a different
+conversation are a different key. The context is fingerprinted by role and
+normalised text only: the per-turn timestamps in the prompt would otherwise
+make every key after a conversation's first message unique.
+
+Two tiers: an in-process TTL + LRU cache, and an optional DynamoDB tier
+shared by all containers (items ``cache#classify#<key>`` in the
+conversations table, expired by the table's TTL).
+
+HIGH results are never shared across users: they are stored only under a
+key scoped to the user, and are not cached at all when no user is known.
+Keyword-fallback results are not cached either — they mean the provider
+failed, and the next message should try it again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 1024
+TTL_SECONDS = 3600
+SHARED_PREFIX = "cache#classify#"
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_message(message: str) -> str:
+    """Fold case, punctuation and whitespace so trivially different texts share a key."""
+    text = unicodedata.normalize("NFKC", message).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def context_fingerprint(turns: List[Dict[str, Any]]) -> str:
+    """Role and normalised text of each context turn, without timestamps."""
+    return "\n".join(
+        f"{turn.get('role', 'patient')}: {normalise_message(str(turn.get('message', '')))}"
+        for turn in turns
+    )
+
+
+def cache_keys(
+    provider: str, model: str, message: str, context: str, user_id: Optional[str]
+) -> Tuple[str, Optional[str]]:
+    """Return (shared_key, user_key); user_key is None without a user."""
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+    base = "\x1f".join((provider, model, normalise_message(message), context_hash))
+    shared = hashlib.sha256(base.encode("utf-8")).hexdigest()
+    if not user_id:
+        return shared, None
+    scoped = hashlib.sha256(f"{base}\x1f{user_id}".encode("utf-8")).hexdigest()
+    return shared, scoped
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries also expire ``ttl`` seconds after insertion.
+
+    Values are stored as JSON so callers always get an independent copy.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES,
+        ttl: float = TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._items: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires, blob = entry
+            if expires <= self._clock():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+        return json.loads(blob)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        blob = json.dumps(value, default=str)
+        with self._lock:
+            self._items[key] = (self._clock() + self.ttl, blob)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DynamoDBCacheTier:
+    """Shared tier stored as items in the conversations table."""
+
+    def __init__(self, table, ttl: float = TTL_SECONDS) -> None:
+        self.table = table
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = self.table.get_item(Key={"user_id": SHARED_PREFIX + key}).get("Item")
+        except Exception as exc:
+            logger.error(json.dumps({"event": "classification_cache_error", "error": str(exc)}))
+            return None
+        # DynamoDB TTL deletes lazily, so check expiry here too
+        if not item or int(item.get("ttl", 0)) <= time.time():
+            return None
+        return json.loads(item["result"])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            self.table.put_item(Item={
+                "user_id": SHARED_PREFIX + key,
+                "result": json.dumps(value, default=str),
+                "ttl": int(time.time() + self.ttl),
+            })
+        except Exception as exc:
+            logger.error(json.dumps({"event": "classification_cache_error", "error": str(exc)}))
+
+
+class ClassificationCache:
+    """Two-tier cache with the HIGH-result scoping rules described above."""
+
+    def __init__(self, local: TTLCache, shared: Optional[DynamoDBCacheTier] = None) -> None:
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, shared_key: str, user_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        keys = [k for k in (user_key, shared_key) if k]
+        for key in keys:
+            result = self.local.get(key)
+            if result is not None:
+                self._count(hit=True)
+                return result
+        if self.shared is not None:
+            for key in keys:
+                result = self.shared.get(key)
+                if result is not None:
+                    self.local.put(key, result)
+                    self._count(hit=True, shared=True)
+                    return result
+        self._count(hit=False)
+        return None
+
+    def put(self, shared_key: str, user_key: Optional[str], result: Dict[str, Any]) -> None:
+        if result.get("source") == "keywords":
+            return
+        if str(result.get("urgency", "")).upper() == "HIGH":
+            if user_key is None:
+                return
+            key = user_key
+        else:
+            key = shared_key
+        self.local.put(key, result)
+        if self.shared is not None:
+            self.shared.put(key, result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the structured logs."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self.local),
+            }
+
+    def _count(self, hit: bool, shared: bool = False) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.shared_hits += int(shared)
+            else:
+                self.misses += 1
+
+
+_cache: Optional[ClassificationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_classification_cache(table=None) -> Optional[ClassificationCache]:
+    """Return the container-wide classification cache, or None when disabled.
+
+    CLASSIFICATION_CACHE=off disables it; CLASSIFICATION_CACHE_ENTRIES and
+    CLASSIFICATION_CACHE_TTL size the in-process tier, and
+    CLASSIFICATION_CACHE_SHARED=on adds the DynamoDB tier on ``table``.
+    """
+    global _cache
+    if os.getenv("CLASSIFICATION_CACHE", "on").lower() in ("off", "false", "0"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = float(os.getenv("CLASSIFICATION_CACHE_TTL", TTL_SECONDS))
+                local = TTLCache(int(os.getenv("CLASSIFICATION_CACHE_ENTRIES", MAX_ENTRIES)), ttl)
+                shared = None
+                shared_on = os.getenv("CLASSIFICATION_CACHE_SHARED", "off").lower()
+                if table is not None and shared_on in ("on", "true", "1"):
+                    shared = DynamoDBCacheTier(table, ttl)
+                _cache = ClassificationCache(local, shared)
+    return _cache
+
+
+def reset_classification_cache() -> None:
+    """Forget the container-wide cache (used by tests)."""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,220 @@
+"""Process-wide client registry for the WhatsApp Healthcare Triage Agent.
+
+Building a boto3 client re-parses the service model, builds an endpoint
+resolver and opens a fresh connection pool. Clients are therefore created
+lazily on first use and cached per (service, region, config) so warm Lambda
+invocations reuse the same keep-alive connections. OpenAI clients are cached
+per API key and share a single HTTP connection pool.
+
+Nothing here runs at import time: the openai package (by far the slowest
+import in the bundle) is only loaded by optional_module when an OpenAI client
+is first requested, and DynamoDBTable gives handlers the resource-style
+get/put/update calls on top of the low-level client, so cold starts never
+build the boto3 resource layer.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bedrock defaults — well inside the Twilio webhook deadline (15 s)
+BEDROCK_CONNECT_TIMEOUT = 2.0   # seconds
+BEDROCK_READ_TIMEOUT = 10.0     # seconds
+BEDROCK_MAX_ATTEMPTS = 2        # total attempts, including the first call
+BEDROCK_RETRY_MODE = "standard"
+MAX_POOL_CONNECTIONS = 10
+
+# OpenAI defaults — per-call timeouts from the Lambda budget override these
+OPENAI_TIMEOUT = 10.0           # seconds
+OPENAI_MAX_RETRIES = 1
+
+_clients: Dict[str, Any] = {}
+_openai_clients: Dict[str, Any] = {}
+_openai_http_client: Any = None
+_modules: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def get_client(service_name: str, region_name: Optional[str] = None, **config: Any):
+    """Return a cached boto3 client for the service, region and botocore config.
+
+    The first call for a given key builds the client; later calls (including
+    those from subsequent warm invocations) return the same instance.
+    """
+    region = region_name or _default_region()
+    key = json.dumps([service_name, region, config], sort_keys=True, default=str)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = boto3.client(
+                service_name,
+                region_name=region,
+                config=Config(**config) if config else None,
+            )
+            _clients[key] = client
+            logger.info(json.dumps({
+                "event": "client_created", "service": service_name, "region": region,
+            }))
+    return client
+
+
+def get_bedrock_client(
+    region_name: Optional[str] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    max_attempts: Optional[int] = None,
+    retry_mode: Optional[str] = None,
+):
+    """Return the shared bedrock-runtime client.
+
+    Timeouts and retry behaviour default to the BEDROCK_* environment
+    variables, falling back to the module constants.
+    """
+    return get_client(
+        "bedrock-runtime",
+        region_name,
+        connect_timeout=_resolve(connect_timeout, "BEDROCK_CONNECT_TIMEOUT", BEDROCK_CONNECT_TIMEOUT, float),
+        read_timeout=_resolve(read_timeout, "BEDROCK_READ_TIMEOUT", BEDROCK_READ_TIMEOUT, float),
+        retries={
+            "total_max_attempts": _resolve(max_attempts, "BEDROCK_MAX_ATTEMPTS", BEDROCK_MAX_ATTEMPTS, int),
+            "mode": _resolve(retry_mode, "BEDROCK_RETRY_MODE", BEDROCK_RETRY_MODE, str),
+        },
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+    )
+
+
+def get_openai_client(api_key: str):
+    """Return the cached OpenAI client for an API key.
+
+    All clients share one HTTP connection pool, so the TLS session to the
+    OpenAI endpoint survives across warm invocations and key rotations.
+    """
+    openai = optional_module("openai")
+    if openai is None:
+        raise RuntimeError("openai package is not installed")
+
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    client = _openai_clients.get(key)
+    if client is not None:
+        return client
+
+    global _openai_http_client
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            if _openai_http_client is None and hasattr(openai, "DefaultHttpxClient"):
+                _openai_http_client = openai.DefaultHttpxClient()
+            client = openai.OpenAI(
+                api_key=api_key,
+                timeout=_resolve(None, "OPENAI_TIMEOUT", OPENAI_TIMEOUT, float),
+                max_retries=_resolve(None, "OPENAI_MAX_RETRIES", OPENAI_MAX_RETRIES, int),
+                http_client=_openai_http_client,
+            )
+            _openai_clients[key] = client
+            logger.info(json.dumps({"event": "client_created", "service": "openai"}))
+    return client
+
+
+def optional_module(name: str):
+    """Import an optional dependency on first use; None when it is missing."""
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except Exception:
+            _modules[name] = None
+    return _modules[name]
+
+
+class DynamoDBTable:
+    """The subset of the boto3 ``Table`` resource API the handlers use.
+
+    Keys, items and expression values are plain Python values (numbers come
+    back as Decimal), and errors are the client's ClientError, exactly as with
+    the resource; the calls go straight to the low-level client so the
+    resource model is never loaded.
+    """
+
+    def __init__(self, client, name: str) -> None:
+        self.client = client
+        self.name = name
+
+    def get_item(self, Key: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        response = self.client.get_item(TableName=self.name, Key=_serialize(Key), **kwargs)
+        if "Item" in response:
+            response["Item"] = _deserialize(response["Item"])
+        return response
+
+    def put_item(self, Item: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        _serialize_values(kwargs)
+        return self.client.put_item(TableName=self.name, Item=_serialize(Item), **kwargs)
+
+    def update_item(self, Key: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        _serialize_values(kwargs)
+        response = self.client.update_item(TableName=self.name, Key=_serialize(Key), **kwargs)
+        if "Attributes" in response:
+            response["Attributes"] = _deserialize(response["Attributes"])
+        return response
+
+
+def reset_clients() -> None:
+    """Drop every cached client (used by tests and after credential rotation)."""
+    global _openai_http_client
+    with _lock:
+        _clients.clear()
+        _openai_clients.clear()
+        _openai_http_client = None
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _default_region() -> str:
+    return os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
+
+
+def _serialize(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+
+def _deserialize(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
+
+
+def _serialize_values(kwargs: Dict[str, Any]) -> None:
+    if "ExpressionAttributeValues" in kwargs:
+        kwargs["ExpressionAttributeValues"] = _serialize(kwargs["ExpressionAttributeValues"])
+
+
+def _resolve(value: Any, env_name: str, default: Any, cast):
+    """Prefer an explicit argument, then the environment, then the default."""
+    if value is not None:
+        return cast(value)
+    raw = os.getenv(env_name)
+    if raw in (None, ""):
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        logger.warning(json.dumps({"event": "invalid_env_value", "var": env_name}))
+        return default
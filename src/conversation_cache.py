@@ -0,0 +1,126 @@
+"""Per-container hot cache of conversation state.
+
+Patients often send several messages within seconds, and a warm Lambda
+container that served the previous message already holds the item it wrote.
+ConversationCache keeps those items in an LRU bounded by entry count and
+serialised size so load_conversation can skip the get_item.
+
+The cache may be stale when another container handled the user in between.
+That is detected at write time: store_conversation sends a conditional
+UpdateItem on the item's ``version`` attribute, and on conflict it reloads
+the item, reapplies this message's changes and retries. The write returns
+the stored item, which replaces the cached copy, so indices derived from it
+afterwards (the transcript's first new turn) never come from stale state.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 512
+MAX_BYTES = 8 * 1024 * 1024
+
+
+class ConversationCache:
+    """Thread-safe LRU of conversation items keyed by ``user_id``.
+
+    Items are stored pickled: the byte length bounds memory use, and every
+    get returns an independent deep copy that callers are free to mutate.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            blob = self._items.get(user_id)
+            if blob is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(user_id)
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, user_id: str, item: Dict[str, Any]) -> None:
+        blob = pickle.dumps(dict(item), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._discard(user_id)
+            if len(blob) > self.max_bytes:
+                return  # would evict everything else; not worth caching
+            self._items[user_id] = blob
+            self._bytes += len(blob)
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._discard(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for the structured logs."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._items),
+                "bytes": self._bytes,
+            }
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _discard(self, user_id: str) -> None:
+        blob = self._items.pop(user_id, None)
+        if blob is not None:
+            self._bytes -= len(blob)
+
+
+_cache: Optional[ConversationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_conversation_cache() -> Optional[ConversationCache]:
+    """Return the container-wide cache, or None when it is disabled.
+
+    Sized by CONVERSATION_CACHE_ENTRIES and CONVERSATION_CACHE_BYTES;
+    setting either to 0 disables caching.
+    """
+    global _cache
+    entries = int(os.getenv("CONVERSATION_CACHE_ENTRIES", MAX_ENTRIES))
+    max_bytes = int(os.getenv("CONVERSATION_CACHE_BYTES", MAX_BYTES))
+    if entries <= 0 or max_bytes <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ConversationCache(entries, max_bytes)
+    return _cache
+
+
+def reset_conversation_cache() -> None:
+    """Forget the container-wide cache (used by tests)."""
+    global _cache
+    with _cache_lock:
+        _cache = None
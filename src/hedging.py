@@ -0,0 +1,246 @@
+"""Hedged LLM requests for the WhatsApp Healthcare Triage Agent.
+
+Bedrock throttling pushes the classification p99 to several seconds. With
+LLM_HEDGE=on, classify_message starts the primary provider and, if it has not
+produced a valid answer by a deadline taken from the primary's recent latency
+percentile, also starts the secondary provider. Whichever returns a valid
+result first wins; the other call is cancelled if it has not started, and
+otherwise left to finish in the background with its result discarded (a
+running SDK call cannot be interrupted from another thread).
+
+A "valid" result is one from the model — the provider helpers return the
+keyword fallback (``source: keywords``) when the call or JSON parsing fails,
+and that never wins a race while the other provider may still answer.
+
+Every hedge costs a second paid call. HedgeStats counts how often the hedge
+fired and won, and estimates the extra spend from the prompt's input token
+estimate and the providers' list prices.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_DEADLINE_MS = 1500.0  # used until MIN_SAMPLES primary latencies have been seen
+MIN_DEADLINE_MS = 200.0
+MIN_SAMPLES = 20
+WINDOW = 200
+MAX_WORKERS = 4
+OUTPUT_TOKENS = 100  # typical triage JSON answer
+# USD per 1k (input, output) tokens, for the extra-cost estimate only
+PRICES_PER_1K = {"bedrock": (0.00025, 0.00125), "openai": (0.001, 0.002)}
+SECONDARY = {"bedrock": "openai", "openai": "bedrock"}
+
+ProviderCall = Callable[[Optional[float]], Dict[str, Any]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def is_valid(result: Optional[Dict[str, Any]]) -> bool:
+    return bool(result) and result.get("source") != "keywords"
+
+
+def estimate_cost(provider: str, input_tokens: int) -> float:
+    """Rough USD cost of one classification call with ``input_tokens`` of prompt."""
+    input_price, output_price = PRICES_PER_1K.get(provider, (0.0, 0.0))
+    return (input_tokens * input_price + OUTPUT_TOKENS * output_price) / 1000
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one provider."""
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self._samples.append(elapsed_ms)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None with fewer than MIN_SAMPLES samples."""
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[rank]
+
+
+class HedgeStats:
+    """Per-container counters logged with every hedged classification."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.extra_cost_usd = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, hedged: bool, hedge_won: bool, failed: bool, extra_cost: float) -> Dict[str, Any]:
+        with self._lock:
+            self.calls += 1
+            self.hedged += int(hedged)
+            self.hedge_wins += int(hedge_won)
+            self.failures += int(failed)
+            self.extra_cost_usd += extra_cost
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.calls, 4),
+                "hedge_wins": self.hedge_wins,
+                "hedge_win_rate": round(self.hedge_wins / self.hedged, 4) if self.hedged else 0.0,
+                "failures": self.failures,
+                "extra_cost_usd": round(self.extra_cost_usd, 6),
+            }
+
+
+class Hedger:
+    """Races a secondary provider against a slow primary."""
+
+    def __init__(
+        self,
+        secondary: Optional[str] = None,
+        percentile: float = DEFAULT_PERCENTILE,
+        default_deadline_ms: float = DEFAULT_DEADLINE_MS,
+    ) -> None:
+        self._secondary = secondary
+        self.percentile = percentile
+        self.default_deadline_ms = default_deadline_ms
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.stats = HedgeStats()
+        self._lock = threading.Lock()
+
+    def secondary(self, primary: str) -> Optional[str]:
+        secondary = self._secondary or SECONDARY.get(primary)
+        return secondary if secondary != primary else None
+
+    def deadline_ms(self, provider: str) -> float:
+        observed = self._tracker(provider).percentile(self.percentile)
+        if observed is None:
+            return self.default_deadline_ms
+        return max(MIN_DEADLINE_MS, observed)
+
+    def run(
+        self,
+        primary: str,
+        primary_call: ProviderCall,
+        secondary: str,
+        secondary_call: ProviderCall,
+        timeout: Optional[float] = None,
+        input_tokens: int = 0,
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Return (result, provider) of the first valid answer, or (None, None)."""
+        start = time.perf_counter()
+        deadline = self.deadline_ms(primary) / 1000
+        if timeout is not None:
+            deadline = min(deadline, timeout)
+
+        futures: Dict[Future, str] = {self._submit(primary, primary_call, timeout, start): primary}
+        done, _ = wait(futures, timeout=deadline)
+        result, winner = _first_valid(done, futures)
+
+        end = None if timeout is None else start + timeout
+        hedged = False
+        if winner is None and (end is None or time.perf_counter() < end):
+            hedged = True
+            left = None if end is None else end - time.perf_counter()
+            futures[self._submit(secondary, secondary_call, left, time.perf_counter())] = secondary
+        pending = {f for f in futures if not f.done()}
+        while winner is None and pending:
+            left = None if end is None else end - time.perf_counter()
+            if left is not None and left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            result, winner = _first_valid(done, futures)
+        for future in pending:
+            future.cancel()
+
+        hedge_won = hedged and winner == secondary
+        extra = estimate_cost(secondary, input_tokens) if hedged else 0.0
+        logger.info(json.dumps({
+            "event": "llm_hedge",
+            "primary": primary,
+            "winner": winner,
+            "hedge_fired": hedged,
+            "deadline_ms": round(deadline * 1000, 1),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            **self.stats.record(hedged, hedge_won, winner is None, extra),
+        }))
+        return result, winner
+
+    def _submit(self, provider: str, call: ProviderCall, timeout: Optional[float], start: float) -> Future:
+        tracker = self._tracker(provider)
+
+        def timed() -> Dict[str, Any]:
+            result = call(timeout)
+            if is_valid(result):
+                tracker.record((time.perf_counter() - start) * 1000)
+            return result
+
+        return _get_executor().submit(timed)
+
+    def _tracker(self, provider: str) -> LatencyTracker:
+        with self._lock:
+            return self.latency.setdefault(provider, LatencyTracker())
+
+
+def _first_valid(done, futures: Dict[Future, str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    for future in done:
+        if future.exception() is None and is_valid(future.result()):
+            return future.result(), futures[future]
+    return None, None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="llm-hedge")
+    return _executor
+
+
+_hedger: Optional[Hedger] = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Optional[Hedger]:
+    """Return the container-wide Hedger, or None unless LLM_HEDGE=on.
+
+    LLM_HEDGE_SECONDARY picks the secondary provider (default: the other
+    one), LLM_HEDGE_PERCENTILE the primary latency percentile used as the
+    deadline and LLM_HEDGE_DEADLINE_MS the deadline before enough latencies
+    have been observed.
+    """
+    global _hedger
+    if os.getenv("LLM_HEDGE", "off").lower() not in ("on", "true", "1"):
+        return None
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger(
+                    secondary=os.getenv("LLM_HEDGE_SECONDARY") or None,
+                    percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", DEFAULT_PERCENTILE)),
+                    default_deadline_ms=float(os.getenv("LLM_HEDGE_DEADLINE_MS", DEFAULT_DEADLINE_MS)),
+                )
+    return _hedger
+
+
+def reset_hedger() -> None:
+    """Forget the container-wide hedger (used by tests)."""
+    global _hedger
+    with _hedger_lock:
+        _hedger = None
@@ -0,0 +1,171 @@
+"""Tolerant extraction of the triage JSON from LLM output.
+
+Models do not always answer with bare JSON: there may be a preamble ("Here
+is the triage:"), a code fence, commentary after the object, a trailing
+comma, a raw newline inside a string, or — when max_tokens cuts the answer
+off — no closing braces at all. Each of those used to cost a paid completion
+and send the message to the keyword fallback.
+
+extract_object makes one pass from the first ``{``, copying the object while
+tracking strings and nesting, and fixes what it can on the way:
+
+    preamble / trailing_text   text outside the first balanced object is ignored
+    trailing_comma             ``,`` before ``}`` or ``]`` is dropped
+    control_char               raw newlines/tabs inside strings are escaped
+    truncated                  open strings and brackets are closed, backing off
+                               to the last complete member if needed
+
+coerce_triage then checks the result against the triage schema. urgency is
+required — a response without a readable urgency is not guessed at — and the
+other fields are coerced to their expected types.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+URGENCY_LEVELS = ("LOW", "MEDIUM", "HIGH")
+LIST_FIELDS = ("symptoms", "red_flags")
+TEXT_FIELDS = ("duration", "age")
+MAX_BACKOFF = 4  # members dropped at most when repairing a truncated object
+
+_URGENCY_WORD = re.compile(r"\b(" + "|".join(URGENCY_LEVELS) + r")\b")
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def extract_object(text: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Return the first JSON object in ``text`` and the repairs applied.
+
+    Raises ValueError if no object can be recovered.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("no JSON object in model output")
+    repairs: List[str] = ["preamble"] if text[:start].strip().strip("`").strip() not in ("", "json") else []
+
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[Tuple[int, int]] = []  # (output length, depth) before each top-level-or-deeper comma
+    in_string = escape = False
+    end = None
+
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch in _CONTROL_ESCAPES:
+                _note(repairs, "control_char")
+                ch = _CONTROL_ESCAPES[ch]
+            out.append(ch)
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+        elif ch in "}]":
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                break  # mismatched bracket: treat the rest as garbage
+            for _ in range(_drop_trailing_commas(out, repairs)):
+                cuts.pop()
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                end = i + 1
+                break
+            continue
+        elif ch == ",":
+            cuts.append((len(out), len(stack)))
+        out.append(ch)
+
+    if end is not None:
+        if text[end:].strip().strip("`").strip():
+            _note(repairs, "trailing_text")
+        return _loads("".join(out)), repairs
+
+    _note(repairs, "truncated")
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    candidates = [("".join(out), stack)]
+    for length, depth in reversed(cuts[-MAX_BACKOFF:]):
+        candidates.append(("".join(out[:length]), stack[:depth]))
+    for body, open_brackets in candidates:
+        body = body.rstrip().rstrip(",")
+        try:
+            return _loads(body + "".join(_CLOSERS[b] for b in reversed(open_brackets))), repairs
+        except ValueError:
+            continue
+    raise ValueError("could not repair truncated JSON")
+
+
+def coerce_triage(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate ``obj`` against the triage schema and coerce field types.
+
+    Urgency is the whole field when it is exactly one level; otherwise the
+    most severe level named in it, so an echoed "LOW|MEDIUM|HIGH" or a hedged
+    "not HIGH, LOW" errs towards HIGH. Raises ValueError if urgency is
+    missing or unrecognisable.
+    """
+    raw = str(obj.get("urgency", "")).strip().upper()
+    if raw in URGENCY_LEVELS:
+        urgency = raw
+    else:
+        named = _URGENCY_WORD.findall(raw)
+        if not named:
+            raise ValueError("triage JSON has no valid urgency")
+        urgency = max(named, key=URGENCY_LEVELS.index)
+    result: Dict[str, Any] = {"urgency": urgency}
+    for field in LIST_FIELDS:
+        value = obj.get(field)
+        if value is None or value == "":
+            result[field] = []
+        elif isinstance(value, (list, tuple)):
+            result[field] = [str(v).strip() for v in value if v not in (None, "")]
+        else:
+            result[field] = [str(value).strip()]
+    for field in TEXT_FIELDS:
+        value = obj.get(field)
+        result[field] = "unknown" if value in (None, "", []) else str(value).strip()
+    return result
+
+
+def _loads(body: str) -> Dict[str, Any]:
+    try:
+        obj = json.loads(body)
+    except json.JSONDecodeError as exc:
+        raise ValueError(str(exc)) from exc
+    if not isinstance(obj, dict):
+        raise ValueError("model output is not a JSON object")
+    return obj
+
+
+def _drop_trailing_commas(out: List[str], repairs: List[str]) -> int:
+    """Remove commas (and the whitespace between them) before a closer."""
+    dropped = 0
+    i = len(out) - 1
+    while i >= 0:
+        if out[i].isspace():
+            i -= 1
+        elif out[i] == ",":
+            del out[i:]
+            dropped += 1
+            i -= 1
+        else:
+            break
+    if dropped:
+        _note(repairs, "trailing_comma")
+    return dropped
+
+
+def _note(repairs: List[str], repair: str) -> None:
+    if repair not in repairs:
+        repairs.append(repair)
@@ -0,0 +1,133 @@
+"""Multi-pattern symptom matcher for the keyword fallback classifier.
+
+The lexicon (lexicon.json next to this module, or LEXICON_PATH) groups
+phrases by severity and language. It is compiled once at import into an
+Aho–Corasick automaton, so a message is scanned in a single pass whose cost
+depends on the message length and the number of matches, not on how many
+phrases the lexicon holds. The transition table trades memory for speed:
+roughly 0.5 MB for the shipped lexicon and 30 MB at 5,000 phrases.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicon.json")
+SEVERITY_RANK = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+
+class Match(NamedTuple):
+    phrase: str
+    severity: str
+    start: int  # span in the lower-cased message
+    end: int
+    status: str = "affirmed"  # or "negated" / "uncertain", see negation.py
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton over (phrase, severity) entries.
+
+    Matching is case-insensitive and reports every occurrence, including
+    overlapping ones ("vomit" inside "vomiting"). A phrase listed under
+    several severities keeps the highest.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]) -> None:
+        severities: Dict[str, str] = {}
+        for phrase, severity in entries:
+            phrase = phrase.strip().lower()
+            if not phrase:
+                continue
+            if SEVERITY_RANK[severity] > SEVERITY_RANK.get(severities.get(phrase, "LOW"), 0):
+                severities[phrase] = severity
+
+        goto: List[Dict[str, int]] = [{}]
+        self._output: List[Tuple[Tuple[str, str], ...]] = [()]
+        for phrase, severity in severities.items():
+            state = 0
+            for ch in phrase:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    self._output.append(())
+                state = nxt
+            self._output[state] += ((phrase, severity),)
+
+        # Breadth-first failure links; each state inherits its suffix's outputs.
+        # Failure transitions are then folded into a full transition table so
+        # matching is one dict lookup per character with no fallback loop.
+        fail = [0] * len(goto)
+        self._delta: List[Dict[str, int]] = [dict(goto[0])] + [{}] * (len(goto) - 1)
+        queue = deque(goto[0].values())  # depth-1 states fail to the root
+        while queue:
+            state = queue.popleft()
+            if state:
+                self._delta[state] = {**self._delta[fail[state]], **goto[state]}
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[nxt] = goto[fallback].get(ch, 0) if state else 0
+                self._output[nxt] += self._output[fail[nxt]]
+        self.size = len(severities)
+
+    @classmethod
+    def from_file(cls, path: str) -> "KeywordMatcher":
+        with open(path, encoding="utf-8") as fh:
+            return cls(_lexicon_entries(json.load(fh)))
+
+    def find_all(self, text: str, whole_words: bool = True) -> List[Match]:
+        """Return every lexicon phrase occurring in ``text``, in order of end position.
+
+        With ``whole_words`` a match must start and end on a word boundary,
+        so "vomit" is not found inside "vomiting" or an unrelated token.
+        """
+        delta, output = self._delta, self._output
+        text = text.lower()
+        last = len(text) - 1
+        matches: List[Match] = []
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if output[state]:
+                if whole_words and i < last and text[i + 1].isalnum():
+                    continue
+                for phrase, severity in output[state]:
+                    start = i + 1 - len(phrase)
+                    if whole_words and start and text[start - 1].isalnum():
+                        continue
+                    matches.append(Match(phrase, severity, start, i + 1))
+        return matches
+
+
+def _lexicon_entries(lexicon: Dict[str, Dict[str, List[str]]]) -> Iterable[Tuple[str, str]]:
+    for severity, languages in lexicon.items():
+        if severity.startswith("_"):
+            continue  # comments and rule lists such as _fast_path
+        for phrases in languages.values():
+            for phrase in phrases:
+                yield phrase, severity
+
+
+def load_lexicon() -> Dict[str, Any]:
+    """Read the lexicon named by LEXICON_PATH (default: lexicon.json here)."""
+    with open(os.getenv("LEXICON_PATH", DEFAULT_LEXICON_PATH), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _load_default() -> KeywordMatcher:
+    matcher = KeywordMatcher(_lexicon_entries(load_lexicon()))
+    logger.info(json.dumps({"event": "lexicon_loaded", "phrases": matcher.size}))
+    return matcher
+
+
+DEFAULT_MATCHER = _load_default()
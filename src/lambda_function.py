@@ -10,47 +10,88 @@ from __future__ import annotations
 import json
 import logging
 import os
+import time
+from concurrent.futures import Future
+from functools import partial
 from typing import Any, Dict, List
 from urllib.parse import parse_qs
 
-import boto3
-
 # Support both Lambda runtime (CodeUri: src/ → no 'src.' prefix) and
 # local pytest (project root → needs 'src.' prefix).
 try:
+    from classification_cache import get_classification_cache
+    from clients import DynamoDBTable, get_client
+    from conversation_cache import get_conversation_cache
+    from metrics import Metrics
+    from pipeline import SideEffect, run_side_effects
+    from pre_triage import STATS as PRE_TRIAGE_STATS
+    from pre_triage import enrichment_enabled, pre_triage, pre_triage_enabled
+    from rate_limit import RATE_LIMIT_ATTRIBUTES, get_rate_limiter
+    from streaming import stream_classification, streaming_enabled
+    from transcripts import append_transcript
+    from work_queue import get_work_queue
+    from worker import alert_job, enrich_job, transcript_job
     from utils import (
+        GATE_ATTRIBUTES,
+        build_alert,
         build_response_and_state,
         classify_message,
+        complete_conversation,
+        consistent_read,
         generate_twiml_response,
         increment_message_count,
         is_rate_limited,
+        llm_timeout_budget,
         load_conversation,
         sanitize_input,
+        send_alert,
+        spill_history,
         store_conversation,
-        upload_transcript,
+        trim_history,
     )
     import utils as _utils
 except ImportError:
+    from src.classification_cache import get_classification_cache
+    from src.clients import DynamoDBTable, get_client
+    from src.conversation_cache import get_conversation_cache
+    from src.metrics import Metrics
+    from src.pipeline import SideEffect, run_side_effects
+    from src.pre_triage import STATS as PRE_TRIAGE_STATS
+    from src.pre_triage import enrichment_enabled, pre_triage, pre_triage_enabled
+    from src.rate_limit import RATE_LIMIT_ATTRIBUTES, get_rate_limiter
+    from src.streaming import stream_classification, streaming_enabled
+    from src.transcripts import append_transcript
+    from src.work_queue import get_work_queue
+    from src.worker import alert_job, enrich_job, transcript_job
     from src.utils import (
+        GATE_ATTRIBUTES,
+        build_alert,
         build_response_and_state,
         classify_message,
+        complete_conversation,
+        consistent_read,
         generate_twiml_response,
         increment_message_count,
         is_rate_limited,
+        llm_timeout_budget,
         load_conversation,
         sanitize_input,
+        send_alert,
+        spill_history,
         store_conversation,
-        upload_transcript,
+        trim_history,
     )
     import src.utils as _utils
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# AWS clients initialised once per container for connection reuse
-dynamodb = boto3.resource("dynamodb")
-s3_client = boto3.client("s3")
-sns_client = boto3.client("sns")
+# AWS clients are built on first use (get_table / get_s3_client /
+# get_sns_client) and then kept for the life of the container, so the cold
+# start only pays for the ones the first request needs.
+table = None
+s3_client = None
+sns_client = None
 
 table_name = os.environ.get("DYNAMODB_TABLE")
 bucket_name = os.environ.get("S3_BUCKET")
@@ -70,12 +111,45 @@ _missing = [
 if _missing:
     logger.warning(json.dumps({"event": "missing_env_vars", "vars": _missing}))
 
-table = dynamodb.Table(table_name) if table_name else None
+
+def get_table():
+    """Return the conversation table, or None when DYNAMODB_TABLE is unset."""
+    global table
+    if table is None and table_name:
+        table = DynamoDBTable(get_client("dynamodb"), table_name)
+    return table
+
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        s3_client = get_client("s3")
+    return s3_client
+
+
+def get_sns_client():
+    global sns_client
+    if sns_client is None:
+        sns_client = get_client("sns")
+    return sns_client
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    """Process an incoming Twilio WhatsApp webhook and return a TwiML reply."""
+    """Process an incoming Twilio WhatsApp webhook and return a TwiML reply.
+
+    Stage timings are flushed as one EMF line per invocation (metrics.py).
+    """
+    metrics = Metrics(Provider=llm_provider)
+    try:
+        with metrics.span("total"):
+            return _handle_webhook(event, context, metrics)
+    finally:
+        metrics.flush()
+
+
+def _handle_webhook(event: Dict[str, Any], context: Any, metrics: Metrics) -> Dict[str, Any]:
     request_id = getattr(context, "aws_request_id", "local")
+    metrics.property("request_id", request_id)
     logger.info(json.dumps({"event": "webhook_received", "request_id": request_id}))
 
     body = event.get("body", "") or ""
@@ -92,58 +166,164 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
     # Use globals() so tests can patch verify_twilio_signature on this module
     verify_fn = globals().get("verify_twilio_signature", _utils.verify_twilio_signature)
-    if not verify_fn(signature, full_url, params, twilio_auth_token or ""):
+    with metrics.span("verify_signature"):
+        valid = verify_fn(signature, full_url, params, twilio_auth_token or "")
+    if not valid:
         logger.warning(json.dumps({"event": "invalid_signature", "request_id": request_id}))
+        metrics.property("outcome", "forbidden")
         return {"statusCode": 403, "body": "Forbidden"}
 
     user_id = params.get("From", [""])[0]
     raw_message = params.get("Body", [""])[0].strip()
 
     if not user_id or not raw_message:
+        metrics.property("outcome", "bad_request")
         return {"statusCode": 400, "body": "Missing From or Body parameter"}
 
     message = sanitize_input(raw_message)
     masked_user = f"***{user_id[-4:]}" if len(user_id) > 4 else "****"
 
-    conversation = load_conversation(table, user_id) if table else {}
+    # Rate-limited requests never pay for the full conversation read: the
+    # limiter counts atomically in DynamoDB before anything is loaded, and the
+    # legacy in-item check reads only the projected counters.
+    table = get_table()
+    rate_limiter = get_rate_limiter(table)
+    cache = get_conversation_cache()
+    if rate_limiter is not None:
+        with metrics.span("rate_limit"):
+            limited = not rate_limiter.acquire(user_id).allowed
+        with metrics.span("load_conversation"):
+            conversation = {} if limited or not table else load_conversation(
+                table, user_id, cache, consistent=consistent_read("full")
+            )
+        if hasattr(conversation, "exclude"):
+            conversation.exclude(*RATE_LIMIT_ATTRIBUTES)
+    else:
+        with metrics.span("rate_limit"):
+            conversation = load_conversation(
+                table, user_id, cache, attributes=GATE_ATTRIBUTES, consistent=consistent_read("gate")
+            ) if table else {}
+            limited = is_rate_limited(conversation)
+
+    if cache is not None and conversation:
+        logger.info(json.dumps({
+            "event": "conversation_cache",
+            "request_id": request_id,
+            "hit": getattr(conversation, "from_cache", False),
+            **cache.stats(),
+        }))
 
-    if is_rate_limited(conversation):
+    if limited:
         logger.warning(json.dumps({"event": "rate_limited", "user": masked_user}))
+        metrics.property("outcome", "rate_limited")
         twiml = generate_twiml_response(
             "You have sent too many messages today. Please try again tomorrow "
             "or contact your healthcare provider directly."
         )
         return {"statusCode": 200, "headers": {"Content-Type": "application/xml"}, "body": twiml}
 
-    increment_message_count(conversation)
+    if rate_limiter is None:
+        increment_message_count(conversation)
+    if table:
+        with metrics.span("load_conversation"):
+            complete_conversation(table, conversation, cache, consistent=consistent_read("full"))
 
-    triage_result = classify_message(
-        message,
-        conversation.get("history", []),
-        provider=llm_provider,
-    )
+    # Unambiguous emergencies are answered from the rules without waiting
+    # for the LLM; everything else goes through classify_message as before.
+    fast_result = None
+    if pre_triage_enabled():
+        start = time.perf_counter()
+        with metrics.span("pre_triage"):
+            fast_result = pre_triage(message)
+        logger.info(json.dumps({
+            "event": "pre_triage",
+            "request_id": request_id,
+            "rules": (fast_result or {}).get("rules", []),
+            **PRE_TRIAGE_STATS.record(fast_result is not None, (time.perf_counter() - start) * 1000),
+        }))
+
+    # With BEDROCK_STREAMING the reply is chosen as soon as urgency has
+    # streamed in; the rest of the extraction is awaited by the side effects
+    # that need it.
+    pending = None
+    if fast_result is not None:
+        triage_result = fast_result
+    else:
+        classification_cache = get_classification_cache(table)
+        start = time.perf_counter()
+        with metrics.span("classify"):
+            if streaming_enabled(llm_provider):
+                pending = stream_classification(
+                    message,
+                    conversation.get("history", []),
+                    timeout=llm_timeout_budget(context),
+                    summary=conversation.get("summary"),
+                    user_id=user_id,
+                    cache=classification_cache,
+                )
+                triage_result = {"urgency": pending.urgency()}
+            else:
+                triage_result = classify_message(
+                    message,
+                    conversation.get("history", []),
+                    provider=llm_provider,
+                    timeout=llm_timeout_budget(context),
+                    summary=conversation.get("summary"),
+                    user_id=user_id,
+                    cache=classification_cache,
+                )
+        PRE_TRIAGE_STATS.record_llm((time.perf_counter() - start) * 1000)
+        if classification_cache is not None:
+            logger.info(json.dumps({
+                "event": "classification_cache",
+                "request_id": request_id,
+                **classification_cache.stats(),
+            }))
 
+    metrics.dimension("Provider", "rules" if fast_result is not None else llm_provider)
+    metrics.dimension("Urgency", triage_result.get("urgency"))
+    metrics.property("outcome", "triaged")
     logger.info(json.dumps({
         "event": "triage_complete",
         "request_id": request_id,
         "user": masked_user,
         "urgency": triage_result.get("urgency"),
         "provider": llm_provider,
+        **({"decision_ms": pending.decision_ms} if pending is not None else {}),
     }))
 
-    reply_message = build_response_and_state(
-        triage_result, conversation, message, sns_client, topic_arn, user_id
-    )
-
-    if table:
-        store_conversation(table, conversation)
+    turns_before = len(conversation.get("history", []))
+    history_before = list(conversation.get("history", []))
+    first_new_turn = int(conversation.get("history_offset", 0)) + turns_before
+    with metrics.span("build_reply"):
+        reply_message = build_response_and_state(
+            triage_result, conversation, message, None, topic_arn, user_id,
+            send_alerts=False,
+        )
+        new_turns = conversation["history"][turns_before:]
+        dropped = trim_history(conversation)
 
-    if bucket_name:
-        lines = [
-            f"{msg['timestamp']} [{msg.get('role', 'patient')}]: {msg['message']}"
-            for msg in conversation.get("history", [])
-        ]
-        upload_transcript(s3_client, bucket_name, user_id, "\n".join(lines))
+    # The alert, state write and transcript archive are independent once the
+    # reply is known; SIDE_EFFECTS_MODE decides whether they overlap.
+    effects = _side_effects(
+        triage_result, conversation, user_id, new_turns, first_new_turn, dropped, cache, pending
+    )
+    if fast_result is not None:
+        effects.extend(_enrichment(
+            message, history_before, conversation.get("summary"), fast_result, user_id
+        ))
+    with metrics.span("side_effects"):
+        timings = run_side_effects(effects)
+    for name, ms in timings.items():
+        metrics.add(name, ms)
+    metrics.count("side_effects_abandoned", sum(effect.name not in timings for effect in effects))
+    logger.info(json.dumps({
+        "event": "side_effects_complete", "request_id": request_id, "timings_ms": timings,
+    }))
+    if pending is not None:
+        logger.info(json.dumps({
+            "event": "streaming_classification", "request_id": request_id, **pending.log_fields(),
+        }))
 
     twiml = generate_twiml_response(reply_message)
     return {
@@ -153,5 +333,113 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     }
 
 
+def _side_effects(
+    triage_result: Dict[str, Any],
+    conversation: Dict[str, Any],
+    user_id: str,
+    new_turns: List[Dict[str, Any]],
+    first_new_turn: int,
+    dropped: List[Dict[str, Any]],
+    cache=None,
+    pending=None,
+) -> List[SideEffect]:
+    """Collect the post-reply side effects for this message.
+
+    Only ``new_turns`` are archived; earlier ones are already in the
+    transcript segments. Their absolute index is taken from the stored item
+    once store_conversation has run, falling back to ``first_new_turn``
+    (derived from the loaded, possibly cached, history) if it failed. Turns
+    ``dropped`` by trim_history are spilled to a secondary item only when
+    there is no transcript bucket to hold them.
+
+    When WORK_QUEUE_BACKEND is configured the alert and transcript are
+    enqueued for worker.queue_handler instead of running on the webhook's
+    critical path; conversation state is always written inline.
+
+    With a streaming ``pending`` classification, ``triage_result`` holds only
+    the urgency. The alert then waits for the full result and runs last, so
+    the state and transcript writes overlap the rest of the stream.
+    """
+    queue = get_work_queue()
+    effects = []
+    result = pending.result if pending is not None else (lambda: triage_result)
+
+    alert = None
+    if conversation.get("triage_level") == "HIGH":
+        # Rule-based emergencies page staff inline; the alert is the point
+        if queue is not None and triage_result.get("source") != "rules":
+            alert = SideEffect("enqueue_alert", lambda: queue.enqueue(alert_job(result(), user_id)))
+        else:
+            alert = SideEffect(
+                "send_alert",
+                lambda: send_alert(get_sns_client(), topic_arn, *build_alert(result(), user_id)),
+            )
+    if alert is not None and pending is None:
+        effects.append(alert)
+
+    table = get_table()
+    stored: Future = Future()
+    if table:
+        def store() -> None:
+            ok = False
+            try:
+                ok = store_conversation(table, conversation, cache)
+            finally:
+                stored.set_result(ok)
+
+        effects.append(SideEffect("store_conversation", store))
+        if dropped and not bucket_name:
+            spill_start = int(conversation["history_offset"]) - len(dropped)
+            effects.append(SideEffect(
+                "spill_history", partial(spill_history, table, user_id, dropped, spill_start)
+            ))
+    else:
+        stored.set_result(False)
+
+    def start_index() -> int:
+        # The conversation may have come from a stale cache; once stored it
+        # holds the item as written, with this message's turns last
+        if stored.result():
+            return int(conversation.get("history_offset", 0)) + len(conversation["history"]) - len(new_turns)
+        return first_new_turn
+
+    if bucket_name:
+        if queue is not None:
+            effects.append(SideEffect(
+                "enqueue_transcript",
+                lambda: queue.enqueue(transcript_job(user_id, new_turns, start_index())),
+            ))
+        else:
+            s3 = get_s3_client()
+            effects.append(SideEffect(
+                "append_transcript",
+                lambda: append_transcript(s3, bucket_name, user_id, new_turns, start_index()),
+                required=False,
+            ))
+
+    if pending is not None:
+        # Even without an alert, let the stream finish (and fill the cache)
+        # before the container is frozen
+        effects.append(alert or SideEffect("collect_classification", pending.result))
+
+    return effects
+
+
+def _enrichment(
+    message: str,
+    history: List[Dict[str, Any]],
+    summary: Any,
+    triage_result: Dict[str, Any],
+    user_id: str,
+) -> List[SideEffect]:
+    """Queue the full LLM extraction for a rule-based HIGH so the worker can
+    follow up the alert with it. Needs a work queue; skipped otherwise."""
+    queue = get_work_queue()
+    if queue is None or not enrichment_enabled():
+        return []
+    job = enrich_job(user_id, message, history, summary, triage_result)
+    return [SideEffect("enqueue_enrichment", partial(queue.enqueue, job))]
+
+
 # Expose at module level so the globals() lookup above works for test patching
 verify_twilio_signature = _utils.verify_twilio_signature
@@ -0,0 +1,89 @@
+"""Per-invocation stage timings emitted as CloudWatch Embedded Metric Format.
+
+lambda_handler wraps each stage in ``metrics.span(name)`` and adds the
+side-effect durations returned by run_side_effects. Nothing is sent while the
+request runs: flush() writes one EMF JSON line to stdout at the end of the
+invocation and CloudWatch Logs extracts the metrics from it, so there are no
+PutMetricData calls and no extra latency.
+
+Each stage becomes a millisecond metric in METRICS_NAMESPACE (counters such
+as side_effects_abandoned use the Count unit), published twice: without
+dimensions (the per-stage p50/p99 on the dashboard) and by Provider and
+Urgency. The line is written straight to sys.stdout rather than through the
+logger because EMF needs the JSON object alone on the line, without the
+runtime's log prefix.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+DEFAULT_NAMESPACE = "WhatsAppTriage"
+DIMENSION_SETS = [[], ["Provider", "Urgency"]]
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("METRICS_EMF", "off").lower() in ("on", "true", "1")
+
+
+class Metrics:
+    """Stage timings, dimensions and properties for one invocation."""
+
+    def __init__(self, **dimensions: str) -> None:
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.dimensions: Dict[str, str] = {"Provider": "none", "Urgency": "none", **dimensions}
+        self.properties: Dict[str, Any] = {}
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """Time the block; repeated spans with the same name add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Add to a Count metric (e.g. side effects abandoned at return)."""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def dimension(self, key: str, value: Any) -> None:
+        self.dimensions[key] = str(value)
+
+    def property(self, key: str, value: Any) -> None:
+        """Attach a searchable log field that is not a metric."""
+        self.properties[key] = value
+
+    def to_emf(self) -> Dict[str, Any]:
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": os.getenv("METRICS_NAMESPACE", DEFAULT_NAMESPACE),
+                    "Dimensions": DIMENSION_SETS,
+                    "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in self.timings]
+                    + [{"Name": name, "Unit": "Count"} for name in self.counts],
+                }],
+            },
+            **self.properties,
+            **self.dimensions,
+            **{name: round(ms, 2) for name, ms in self.timings.items()},
+            **self.counts,
+        }
+
+    def flush(self) -> None:
+        """Write the EMF line (when METRICS_EMF=on) and start over."""
+        if self.timings and metrics_enabled():
+            sys.stdout.write(json.dumps(self.to_emf()) + "\n")
+            sys.stdout.flush()
+        self.timings.clear()
+        self.counts.clear()
@@ -0,0 +1,186 @@
+"""NegEx-style negation and uncertainty scoping for the keyword fallback.
+
+"I do NOT have chest pain" must not page staff. scope_matches tokenises the
+message with one precompiled regex and walks the tokens once, looking
+triggers up by their first token.
+
+Negation only reaches the phrase it governs. A pre-negation ("no", "sin",
+"pas de") negates a symptom that follows it directly, with at most articles,
+determiners or possessives in between ("no chest pain", "without any
+fever"); a post-negation ("ruled out") negates the symptom right before it.
+WhatsApp messages are rarely punctuated, so a wider window would reach
+symptoms the trigger is not about: in "not feeling well chest pain" or
+"without my inhaler I have difficulty breathing" nothing is negated. A
+negated symptom carries over "or"/"nor" to the next one ("no fever or chest
+pain").
+
+Uncertainty triggers ("maybe", "tal vez") still open a short window over the
+following tokens, closed by terminators ("but", "and", a comma or full
+stop): they only cap HIGH at MEDIUM, so reaching too far is the safe error.
+
+A HIGH phrase that opens with its own negation ("not breathing", "no
+respira") is never negated: "No, he is not breathing" must still page staff.
+fallback_classifier further keeps a negated HIGH symptom at MEDIUM, so a
+scoping mistake can never turn an emergency into LOW.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from keyword_matcher import Match
+except ImportError:
+    from src.keyword_matcher import Match
+
+WINDOW = 5  # tokens an uncertainty trigger reaches, as in NegEx
+
+PRE_NEGATION = [
+    # en
+    "no", "not", "never", "without", "denies", "deny", "negative for", "free of",
+    "don't have", "do not have", "doesn't have", "does not have", "didn't have",
+    "haven't had", "have not had", "no signs of", "no sign of", "no history of",
+    "no longer", "not having",
+    # es
+    "sin", "nunca", "ningún", "ninguna", "no tengo", "no tiene",
+    # fr
+    "ne", "n'", "pas de", "sans", "jamais", "aucun", "aucune",
+    # pt
+    "não", "nao", "sem", "nenhum", "nenhuma", "não tenho", "nao tenho", "não tem", "nao tem",
+]
+POST_NEGATION = [
+    "ruled out", "has gone", "have gone", "is gone", "are gone", "went away",
+    "has resolved", "resolved", "se fue", "desapareció", "a disparu", "passou",
+]
+UNCERTAINTY = [
+    "maybe", "possibly", "possible", "might", "might be", "could be", "not sure if",
+    "in case", "what if", "if i get", "tal vez", "quizás", "quizá", "a lo mejor",
+    "peut-être", "au cas où", "talvez", "caso eu",
+]
+# May sit between a pre-negation and the symptom it negates
+DETERMINERS = {
+    # en
+    "a", "an", "the", "any", "my", "his", "her", "their", "our", "your", "some",
+    # es
+    "un", "una", "unos", "unas", "el", "la", "los", "las", "mi", "mis", "su", "sus", "de", "del",
+    # fr
+    "une", "le", "les", "l'", "du", "des", "d'", "mon", "ma", "mes", "son", "sa", "ses",
+    # pt
+    "um", "uma", "o", "os", "as", "meu", "minha", "seu", "sua", "do", "da", "dos", "das",
+}
+COORDINATORS = {"or", "nor", "o", "ni", "ou", "nem"}  # carry a negation to the next symptom
+TERMINATORS = [
+    "but", "and", "however", "although", "though", "except", "apart from", "aside from",
+    "pero", "y", "aunque", "excepto", "mais", "et", "sauf", "mas", "e", "porém", "exceto",
+]
+
+# First token -> [(token sequence, kind)], longest sequence first, so
+# "no signs of" wins over "no" with a dict lookup instead of a regex scan.
+TRIGGERS: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+for _kind, _phrases in (
+    ("pre_neg", PRE_NEGATION), ("post_neg", POST_NEGATION),
+    ("uncertain", UNCERTAINTY), ("term", TERMINATORS),
+):
+    for _phrase in _phrases:
+        _words = tuple(_phrase.split())
+        TRIGGERS.setdefault(_words[0], []).append((_words, _kind))
+for _candidates in TRIGGERS.values():
+    _candidates.sort(key=lambda c: len(c[0]), reverse=True)
+
+ELISIONS = ("n'",)  # French "n'ai", "n'est": negation fused to the next word
+NEGATION_WORDS = {phrase.split()[0] for phrase in PRE_NEGATION}
+
+# Words (keeping apostrophes and hyphens inside them) and clause punctuation
+TOKEN_RE = re.compile(r"(\w+(?:['’-]\w+)*)|([.,;:!?\n]+)")
+
+
+def scope_matches(text: str, matches: List[Match]) -> List[Match]:
+    """Return ``matches`` with ``status`` set to affirmed, negated or uncertain."""
+    if not matches:
+        return matches
+
+    tokens = [
+        (m.start(), m.group(1).lower().replace("’", "'") if m.group(1) else None)
+        for m in TOKEN_RE.finditer(text)
+    ]
+    starts = [start for start, _ in tokens]
+    status: List[str] = []
+    post_negations = set()  # token indices where a post-negation starts
+    uncertain_left = 0
+
+    i = 0
+    while i < len(tokens):
+        kind, width = _trigger(tokens, i)
+        if kind in ("stop", "term"):
+            uncertain_left = 0
+        status.extend(["uncertain" if uncertain_left else "affirmed"] * width)
+        uncertain_left = max(0, uncertain_left - width)
+
+        if kind == "pre_neg":
+            # Negate the determiners after the trigger and the word past them;
+            # punctuation or a further trigger ("n'ai pas de") is left to the loop
+            j = _skip(tokens, i + width, DETERMINERS)
+            if j < len(tokens) and _trigger(tokens, j)[0] == "word":
+                j += 1
+            status.extend(["negated"] * (j - i - width))
+            uncertain_left = max(0, uncertain_left - (j - i - width))
+            i = j
+            continue
+        if kind == "uncertain":
+            uncertain_left = WINDOW
+        elif kind == "post_neg":
+            post_negations.add(i)
+        i += width
+
+    scoped = []
+    carried = -1  # token a negation was carried to over "or"/"nor"
+    for match in sorted(matches, key=lambda m: m.start):
+        k = bisect_right(starts, match.start) - 1
+        if k < 0:
+            scoped.append(match)
+            continue
+        after = bisect_left(starts, match.end)
+        current = status[k]
+        if k == carried or after in post_negations:
+            current = "negated"
+        if current == "negated" and _self_negated(match):
+            current = "affirmed"
+        if current == "negated" and after < len(tokens) and tokens[after][1] in COORDINATORS:
+            carried = _skip(tokens, after + 1, DETERMINERS)
+        scoped.append(match._replace(status=current))
+    return scoped
+
+
+def _trigger(tokens: List[Tuple[int, Optional[str]]], i: int) -> Tuple[str, int]:
+    """(kind, width in tokens) of the token at ``i``: a trigger, word or stop."""
+    word = tokens[i][1]
+    if word is None:
+        return "stop", 1
+    for words, kind in TRIGGERS.get(word, ()):
+        if len(words) == 1 or tuple(t for _, t in tokens[i:i + len(words)]) == words:
+            return kind, len(words)
+    if word.startswith(ELISIONS):
+        return "pre_neg", 1
+    return "word", 1
+
+
+def _skip(tokens: List[Tuple[int, Optional[str]]], i: int, words) -> int:
+    """Index of the first token at or after ``i`` that is not in ``words``."""
+    while i < len(tokens) and tokens[i][1] in words:
+        i += 1
+    return i
+
+
+def _self_negated(match: Match) -> bool:
+    """True for HIGH phrases that open with a negation trigger of their own.
+
+    Only the first word counts: "dor no peito" contains the Portuguese "no"
+    (in the), which is not a negation of the phrase.
+    """
+    if match.severity != "HIGH":
+        return False
+    first = TOKEN_RE.search(match.phrase.lower())
+    word = first.group(1) if first else None
+    return bool(word) and (word in NEGATION_WORDS or word.startswith(ELISIONS))
@@ -0,0 +1,113 @@
+"""Post-reply side effects for the WhatsApp Healthcare Triage Agent.
+
+Once the reply text is known, the SNS alert, the DynamoDB write and the S3
+transcript upload no longer depend on each other. run_side_effects executes
+them either one after another (the original behaviour) or concurrently on a
+small thread pool that lives for the lifetime of the container.
+
+Required effects (state and alerts) are always awaited before the handler
+returns. Best-effort effects (the transcript archive) are awaited only for a
+short grace period so a slow S3 PUT cannot hold the Twilio reply hostage;
+any still running then is logged and counted (``side_effects_abandoned``)
+because the frozen container may never finish it.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+SIDE_EFFECTS_MODES = ("sequential", "concurrent")
+DEFAULT_MODE = "sequential"
+MAX_WORKERS = 4
+BEST_EFFORT_GRACE_MS = 1000  # how long to wait for best-effort effects
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class SideEffect(NamedTuple):
+    """A named, zero-argument callable run after the reply is decided."""
+
+    name: str
+    fn: Callable[[], Any]
+    required: bool = True
+
+
+def side_effects_mode() -> str:
+    """Return the configured SIDE_EFFECTS_MODE, defaulting to sequential."""
+    mode = os.getenv("SIDE_EFFECTS_MODE", DEFAULT_MODE).lower()
+    if mode not in SIDE_EFFECTS_MODES:
+        logger.warning(json.dumps({"event": "unknown_side_effects_mode", "mode": mode}))
+        return DEFAULT_MODE
+    return mode
+
+
+def run_side_effects(
+    effects: List[SideEffect],
+    mode: Optional[str] = None,
+    grace_ms: Optional[float] = None,
+) -> Dict[str, float]:
+    """Run the side effects and return their durations in milliseconds.
+
+    Exceptions are logged and swallowed, matching the helpers in utils.py —
+    the patient still needs a reply. Effects that were not finished when the
+    function returned are logged as abandoned and omitted from the result.
+    """
+    resolved_mode = mode or side_effects_mode()
+    timings: Dict[str, float] = {}
+
+    if resolved_mode == "sequential" or len(effects) < 2:
+        for effect in effects:
+            _run_timed(effect, timings)
+        return timings
+
+    executor = _get_executor()
+    futures = {executor.submit(_run_timed, effect, timings): effect for effect in effects}
+
+    required = [f for f, effect in futures.items() if effect.required]
+    wait(required)
+
+    best_effort = [f for f, effect in futures.items() if not effect.required]
+    if best_effort:
+        if grace_ms is None:
+            grace_ms = float(os.getenv("SIDE_EFFECTS_GRACE_MS", BEST_EFFORT_GRACE_MS))
+        _, pending = wait(best_effort, timeout=grace_ms / 1000)
+        # Lambda freezes the container once the handler returns, so these
+        # stall until the next invocation, or are lost if it never comes
+        for future in pending:
+            logger.warning(json.dumps({
+                "event": "side_effect_abandoned", "effect": futures[future].name, "grace_ms": grace_ms,
+            }))
+
+    return dict(timings)
+
+
+def _run_timed(effect: SideEffect, timings: Dict[str, float]) -> None:
+    start = time.perf_counter()
+    try:
+        effect.fn()
+    except Exception as exc:
+        logger.error(json.dumps({
+            "event": "side_effect_error", "effect": effect.name, "error": str(exc),
+        }))
+    timings[effect.name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = int(os.getenv("SIDE_EFFECTS_MAX_WORKERS", MAX_WORKERS))
+                _executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="side-effect"
+                )
+    return _executor
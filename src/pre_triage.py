@@ -0,0 +1,111 @@
+"""Deterministic pre-triage that short-circuits the LLM for clear emergencies.
+
+Messages such as "he is not breathing" are obviously HIGH, and they are
+exactly the ones where a 1–3 s LLM round trip delays the emergency reply.
+pre_triage runs the keyword fallback first (a few microseconds) and returns
+HIGH immediately when an affirmed phrase from the lexicon's ``_fast_path``
+list is present. The list is deliberately narrower than the HIGH lexicon:
+only phrases that are unambiguous on their own qualify, and questions ("what
+are the signs of a heart attack?") always go to the LLM. So does any message
+with a ``_fast_path_exclusions`` cue: past events and medical history ("had a
+heart attack two years ago"), someone else's past ("grandma died of"),
+medication ("my seizure medication") and hypotheticals ("is it an overdose
+if"). An affirmed phrase in those contexts says nothing about an emergency
+now.
+
+The fast path is off by default (PRE_TRIAGE=on enables it) until its
+precision on the labelled corpus has been measured.
+
+The handler can then enqueue the full LLM extraction to enrich the staff
+alert after the reply has gone out (see worker.enrich_job).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    from keyword_matcher import load_lexicon
+    from utils import fallback_classifier
+except ImportError:
+    from src.keyword_matcher import load_lexicon
+    from src.utils import fallback_classifier
+
+_LEXICON = load_lexicon()
+FAST_PATH_PHRASES = frozenset(p.lower() for p in _LEXICON.get("_fast_path", []))
+FAST_PATH_EXCLUSIONS = tuple(
+    p.lower() for phrases in _LEXICON.get("_fast_path_exclusions", {}).values() for p in phrases
+)
+# Word-bounded, longest first; apostrophes and hyphens count as word characters
+EXCLUSION_RE = re.compile(
+    r"(?<![\w'-])(?:"
+    + "|".join(re.escape(p) for p in sorted(FAST_PATH_EXCLUSIONS, key=len, reverse=True))
+    + r")(?![\w'-])"
+) if FAST_PATH_EXCLUSIONS else None
+LLM_ESTIMATE_MS = 1500.0  # assumed LLM latency until this container has measured one
+EWMA_ALPHA = 0.2
+
+
+def pre_triage_enabled() -> bool:
+    return os.getenv("PRE_TRIAGE", "off").lower() in ("on", "true", "1")
+
+
+def enrichment_enabled() -> bool:
+    return os.getenv("PRE_TRIAGE_ENRICH", "on").lower() not in ("off", "false", "0")
+
+
+def pre_triage(message: str) -> Optional[Dict[str, Any]]:
+    """Return a HIGH triage result if a fast-path rule fires, else None."""
+    if "?" in message:
+        return None
+    if EXCLUSION_RE is not None and EXCLUSION_RE.search(message.lower()):
+        return None
+    result = fallback_classifier(message)
+    rules = [
+        m["phrase"] for m in result["matches"]
+        if m["status"] == "affirmed" and m["phrase"] in FAST_PATH_PHRASES
+    ]
+    if not rules:
+        return None
+    result["urgency"] = "HIGH"
+    result["source"] = "rules"
+    result["rules"] = rules
+    return result
+
+
+class PreTriageStats:
+    """Per-container hit rate and an estimate of the LLM latency avoided.
+
+    LLM latency is tracked as an exponentially weighted average of the
+    classify_message calls this container has made.
+    """
+
+    def __init__(self) -> None:
+        self.checked = 0
+        self.hits = 0
+        self.llm_ms = LLM_ESTIMATE_MS
+        self._lock = threading.Lock()
+
+    def record_llm(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self.llm_ms += EWMA_ALPHA * (elapsed_ms - self.llm_ms)
+
+    def record(self, hit: bool, elapsed_ms: float) -> Dict[str, Any]:
+        """Count one pre-triage check and return the fields to log for it."""
+        with self._lock:
+            self.checked += 1
+            self.hits += int(hit)
+            return {
+                "hit": hit,
+                "elapsed_ms": round(elapsed_ms, 3),
+                "latency_saved_ms": round(self.llm_ms - elapsed_ms, 1) if hit else 0.0,
+                "checked": self.checked,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.checked, 4),
+            }
+
+
+STATS = PreTriageStats()
@@ -0,0 +1,136 @@
+"""Prompt construction for the triage classifier.
+
+The system prompt never changes, so it and its token estimate are built once
+at import. The per-message part is the patient's message plus as much recent
+conversation as fits a token budget (PROMPT_CONTEXT_TOKENS): turns are added
+newest-first, so a long earlier message is what gets dropped, never the
+latest exchange, and the rolling summary of trimmed turns is added last if
+room remains.
+
+Token counts are estimated, not exact — one token per word or punctuation
+mark plus one per further six characters of a long word, which tracks
+Claude's and GPT's tokenizers closely enough for budgeting and cost logs
+without shipping either.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+TRIAGE_TASK = (
+    "Extract: a list of symptoms, "
+    "how long symptoms have lasted (duration), the patient's age if mentioned, "
+    "and any red-flag emergency symptoms. "
+    "Classify urgency as HIGH (call emergency services immediately), "
+    "MEDIUM (see a doctor within 24 hours), or LOW (safe for self-care). "
+    "IMPORTANT: You are NOT a diagnostic tool — only classify urgency. "
+)
+# urgency comes first so a streamed completion decides the reply branch
+# after a handful of tokens (see streaming.py)
+TRIAGE_SCHEMA = (
+    '{"urgency": "LOW|MEDIUM|HIGH", "symptoms": ["string"], "duration": "string", '
+    '"age": "string", "red_flags": ["string"]}'
+)
+
+SYSTEM_PROMPT = (
+    "You are a medical triage assistant. Analyze the patient's message "
+    "and any prior conversation context provided. " + TRIAGE_TASK
+    + "Respond ONLY with valid JSON matching this schema exactly, keys in this order: "
+    + TRIAGE_SCHEMA
+)
+
+# Several patients in one request (see batching.py)
+BATCH_SYSTEM_PROMPT = (
+    "You are a medical triage assistant. You will receive a JSON array of "
+    "independent patients, each with an \"id\" and their \"message\" (which may "
+    "include that patient's prior conversation context). Triage every patient "
+    "separately using only their own text; one patient's text must never affect "
+    "another patient's result. For each patient: " + TRIAGE_TASK
+    + "Respond ONLY with a JSON object that maps every id to an object matching "
+    "this schema exactly, keys in this order: " + TRIAGE_SCHEMA
+)
+
+CONTEXT_TOKEN_BUDGET = 800  # history + summary; the latest message is always sent in full
+MAX_CONTEXT_TURNS = 10
+ROLE_LABELS = {"patient": "Patient", "agent": "Agent"}
+
+HISTORY_HEADER = "Conversation history:\n"
+LATEST_HEADER = "\n\nLatest message: "
+SUMMARY_HEADER = "Summary of earlier messages: "
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of model tokens in ``text``."""
+    return sum(1 + (len(t) - 1) // 6 for t in _TOKEN_RE.findall(text))
+
+
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+_FRAME_TOKENS = estimate_tokens(HISTORY_HEADER + LATEST_HEADER)
+_SUMMARY_FRAME_TOKENS = estimate_tokens(SUMMARY_HEADER) + 1
+
+
+class Prompt(NamedTuple):
+    """A packed prompt and what went into it."""
+
+    system: str
+    user: str
+    context: str
+    input_tokens: int
+    context_turns: int
+    dropped_turns: int
+
+    def log_fields(self) -> Dict[str, Any]:
+        return {
+            "input_tokens": self.input_tokens,
+            "context_turns": self.context_turns,
+            "dropped_turns": self.dropped_turns,
+        }
+
+
+def context_token_budget() -> int:
+    try:
+        return int(os.getenv("PROMPT_CONTEXT_TOKENS", CONTEXT_TOKEN_BUDGET))
+    except ValueError:
+        return CONTEXT_TOKEN_BUDGET
+
+
+def build_prompt(
+    message: str,
+    history: List[Dict[str, Any]],
+    summary: Optional[str] = None,
+    budget: Optional[int] = None,
+) -> Prompt:
+    """Pack ``message``, recent ``history`` and ``summary`` into a prompt."""
+    remaining = context_token_budget() if budget is None else budget
+    recent = history[-MAX_CONTEXT_TURNS:]
+    lines: List[str] = []
+    context_tokens = 0
+    for entry in reversed(recent):
+        role = entry.get("role", "patient")
+        label = ROLE_LABELS.get(role) or role.capitalize()
+        line = f"[{entry.get('timestamp', '')}] {label}: {entry.get('message', '')}"
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+        context_tokens += cost
+    lines.reverse()
+    context = "\n".join(lines)
+
+    tokens = SYSTEM_PROMPT_TOKENS + estimate_tokens(message)
+    if context:
+        user = f"{HISTORY_HEADER}{context}{LATEST_HEADER}{message}"
+        tokens += _FRAME_TOKENS + context_tokens
+    else:
+        user = message
+    if summary:
+        summary_tokens = estimate_tokens(summary) + _SUMMARY_FRAME_TOKENS
+        if summary_tokens <= remaining:
+            user = f"{SUMMARY_HEADER}{summary}\n\n{user}"
+            tokens += summary_tokens
+    return Prompt(SYSTEM_PROMPT, user, context, tokens, len(lines), len(recent) - len(lines))
@@ -0,0 +1,171 @@
+"""Per-user daily rate limiting for the WhatsApp Healthcare Triage Agent.
+
+The original check read ``daily_count`` from the loaded conversation and
+wrote it back later, so concurrent webhooks from one user could both pass.
+DynamoDBRateLimiter instead increments the counter server-side with a
+conditional UpdateItem and learns allow/deny from that single round trip.
+TokenBucketRateLimiter is a pure in-memory backend for local runs and tests.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+try:
+    from utils import MAX_DAILY_MESSAGES, _is_condition_failure, _mask
+except ImportError:
+    from src.utils import MAX_DAILY_MESSAGES, _is_condition_failure, _mask
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ATTRIBUTES = ("daily_count", "count_date")
+
+_deserializer = TypeDeserializer()
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    count: int  # messages counted today, including this one when allowed
+
+
+class DynamoDBRateLimiter:
+    """Atomic daily counter stored on the conversation item.
+
+    The common case — same day, under the limit — is one conditional
+    ``ADD daily_count :one``. Only the first message of a day (or a denied
+    one) needs a second call to reset the counter. When two first-of-day
+    messages race, the one whose reset loses retries the ADD once, so only a
+    counter that is really at the limit denies.
+    """
+
+    def __init__(self, table, limit: int = MAX_DAILY_MESSAGES) -> None:
+        self.table = table
+        self.limit = limit
+
+    def acquire(self, user_id: str) -> RateLimitDecision:
+        today = _today()
+        try:
+            return self._increment(user_id, today)
+        except ClientError as exc:
+            if not _is_condition_failure(exc):
+                return self._fail_open(user_id, exc)
+        except Exception as exc:
+            return self._fail_open(user_id, exc)
+
+        # Either a new day / new user, or the limit is reached
+        try:
+            self.table.update_item(
+                Key={"user_id": user_id},
+                UpdateExpression="SET count_date = :today, daily_count = :one",
+                ConditionExpression="attribute_not_exists(count_date) OR count_date <> :today",
+                ExpressionAttributeValues={":one": 1, ":today": today},
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+            return RateLimitDecision(True, 1)
+        except ClientError as exc:
+            if not _is_condition_failure(exc):
+                return self._fail_open(user_id, exc)
+            count = _stored_count(exc)
+            if count is not None and count >= self.limit:
+                return RateLimitDecision(False, count)
+        except Exception as exc:
+            return self._fail_open(user_id, exc)
+
+        # Another request reset the counter for today first: count this one
+        # against it instead of treating the lost race as the limit
+        try:
+            return self._increment(user_id, today)
+        except ClientError as exc:
+            if _is_condition_failure(exc):
+                count = _stored_count(exc)
+                return RateLimitDecision(False, self.limit if count is None else count)
+            return self._fail_open(user_id, exc)
+        except Exception as exc:
+            return self._fail_open(user_id, exc)
+
+    def _increment(self, user_id: str, today: str) -> RateLimitDecision:
+        response = self.table.update_item(
+            Key={"user_id": user_id},
+            UpdateExpression="ADD daily_count :one",
+            ConditionExpression="count_date = :today AND daily_count < :limit",
+            ExpressionAttributeValues={":one": 1, ":today": today, ":limit": self.limit},
+            ReturnValues="UPDATED_NEW",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+        return RateLimitDecision(True, int(response["Attributes"]["daily_count"]))
+
+    def _fail_open(self, user_id: str, exc: Exception) -> RateLimitDecision:
+        # Matches load_conversation: a DynamoDB outage must not block patients
+        logger.error(json.dumps({"event": "rate_limit_error", "user": _mask(user_id), "error": str(exc)}))
+        return RateLimitDecision(True, 0)
+
+
+class TokenBucketRateLimiter:
+    """In-memory token bucket per user: ``limit`` tokens refilled over a day."""
+
+    def __init__(
+        self,
+        limit: int = MAX_DAILY_MESSAGES,
+        period_seconds: float = 86_400,
+        clock=time.monotonic,
+    ) -> None:
+        self.limit = limit
+        self.rate = limit / period_seconds
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id: str) -> RateLimitDecision:
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(user_id, (float(self.limit), now))
+            tokens = min(float(self.limit), tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[user_id] = (tokens, now)
+        return RateLimitDecision(allowed, self.limit - int(tokens))
+
+
+_memory_limiter: Optional[TokenBucketRateLimiter] = None
+
+
+def get_rate_limiter(table):
+    """Return the limiter selected by RATE_LIMIT_BACKEND.
+
+    ``dynamodb`` (default when a table is configured) or ``memory``. ``item``
+    — or no table — returns None, meaning the legacy in-item check
+    (is_rate_limited / increment_message_count) applies.
+    """
+    global _memory_limiter
+    default = "dynamodb" if table is not None else "item"
+    backend = os.getenv("RATE_LIMIT_BACKEND", default).lower()
+    limit = int(os.getenv("MAX_DAILY_MESSAGES", MAX_DAILY_MESSAGES))
+    if backend == "dynamodb" and table is not None:
+        return DynamoDBRateLimiter(table, limit)
+    if backend == "memory":
+        if _memory_limiter is None or _memory_limiter.limit != limit:
+            _memory_limiter = TokenBucketRateLimiter(limit)
+        return _memory_limiter
+    return None
+
+
+def _stored_count(exc: ClientError) -> Optional[int]:
+    """daily_count from the item a failed condition check returned (ALL_OLD)."""
+    value = (exc.response.get("Item") or {}).get("daily_count")
+    if value is None:
+        return None
+    return int(_deserializer.deserialize(value))
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
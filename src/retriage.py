@@ -0,0 +1,403 @@
+"""Offline re-triage of archived conversations with Bedrock batch inference.
+
+When the prompt or the model changes, historical conversations are
+re-classified in bulk rather than one classify_message call at a time. A run
+has three stages, each a function here and a subcommand of
+``python -m src.retriage``:
+
+    prepare  stream every conversation in the transcript archive
+             (transcripts.py) and write one batch-inference record per patient
+             turn — the turn and the history before it, packed by build_prompt
+             as the webhook would — plus a manifest joining each record id back
+             to its conversation, turn index and original urgency
+    submit   start a Bedrock model invocation job over the prepared input
+    report   stream the job's output, join it to the manifest and write an
+             urgency-diff report (transition counts, escalations,
+             de-escalations, failed records)
+
+``replay`` runs all three offline: ReplayBatchClient stands in for the
+``bedrock`` control-plane client and "runs" the job at once from canned
+completions (or the keyword classifier), writing output in Bedrock's format.
+
+Records and the manifest are spooled through temporary files, and report
+spools the job output into a temporary SQLite database keyed by record id
+before streaming the manifest past it, so memory stays flat however large the
+archive; the model input carries only an opaque record
+id, never the phone-number prefix. The original urgency is recovered from the
+agent reply that followed each patient turn (TRIAGE_REPLIES); replies from
+older templates are reported as ``unknown``.
+
+Layout under the run prefix (``retriage/<run-id>``) in the output bucket:
+
+    input.jsonl                  batch-inference records
+    manifest.jsonl               record id → conversation, turn, original urgency
+    output/<job-id>/input.jsonl.out   written by Bedrock
+    report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from collections import defaultdict, deque
+from typing import IO, Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+try:
+    from clients import get_client
+    from keyword_matcher import SEVERITY_RANK
+    from prompts import MAX_CONTEXT_TURNS, build_prompt
+    from transcripts import iter_conversation, iter_jsonl, list_transcripts
+    from utils import (
+        BEDROCK_MODEL_ID,
+        TRIAGE_REPLIES,
+        bedrock_request_body,
+        fallback_classifier,
+        parse_completion,
+    )
+except ImportError:
+    from src.clients import get_client
+    from src.keyword_matcher import SEVERITY_RANK
+    from src.prompts import MAX_CONTEXT_TURNS, build_prompt
+    from src.transcripts import iter_conversation, iter_jsonl, list_transcripts
+    from src.utils import (
+        BEDROCK_MODEL_ID,
+        TRIAGE_REPLIES,
+        bedrock_request_body,
+        fallback_classifier,
+        parse_completion,
+    )
+
+logger = logging.getLogger(__name__)
+
+RUN_PREFIX = "retriage"
+INPUT_NAME = "input.jsonl"
+MANIFEST_NAME = "manifest.jsonl"
+OUTPUT_DIR = "output"
+REPORT_NAME = "report.json"
+OUTPUT_SUFFIX = ".jsonl.out"
+UNKNOWN = "unknown"
+MAX_REPORTED_CHANGES = 1000  # individual changes listed in report.json
+
+_REPLY_URGENCY = {reply: urgency for urgency, reply in TRIAGE_REPLIES.items()}
+
+
+class RetriageTurn(NamedTuple):
+    """A patient turn to re-classify and what the agent originally decided."""
+
+    conversation: str
+    turn: int
+    message: str
+    history: List[Dict[str, Any]]
+    original: str
+
+
+def run_prefix(run_id: str) -> str:
+    return f"{RUN_PREFIX}/{run_id}"
+
+
+def iter_turns(s3_client, bucket: str) -> Iterator[RetriageTurn]:
+    """Yield every archived patient turn with the history that preceded it."""
+    for prefix in list_transcripts(s3_client, bucket):
+        window: deque = deque(maxlen=MAX_CONTEXT_TURNS)
+        pending: Optional[Tuple[int, str, List[Dict[str, Any]]]] = None
+        for index, turn in enumerate(iter_conversation(s3_client, bucket, prefix)):
+            role = turn.get("role", "patient")
+            if pending is not None:
+                original = UNKNOWN
+                if role == "agent":
+                    original = _REPLY_URGENCY.get(turn.get("message", ""), UNKNOWN)
+                yield RetriageTurn(prefix, *pending, original)
+                pending = None
+            if role == "patient":
+                pending = (index, turn.get("message", ""), list(window))
+            window.append(turn)
+        if pending is not None:
+            yield RetriageTurn(prefix, *pending, UNKNOWN)
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+def prepare(s3_client, source_bucket: str, bucket: str, run_id: str) -> Dict[str, int]:
+    """Write the batch input and manifest for every archived patient turn."""
+    prefix = run_prefix(run_id)
+    records = conversations = 0
+    last = None
+    with tempfile.TemporaryFile() as inputs, tempfile.TemporaryFile() as manifest:
+        for turn in iter_turns(s3_client, source_bucket):
+            records += 1
+            if turn.conversation != last:
+                conversations += 1
+                last = turn.conversation
+            record_id = f"{records:011d}"
+            prompt = build_prompt(turn.message, turn.history)
+            body = bedrock_request_body(prompt.user, prompt.system)
+            inputs.write(f'{{"recordId": "{record_id}", "modelInput": {body}}}\n'.encode("utf-8"))
+            _write_line(manifest, {
+                "recordId": record_id,
+                "conversation": turn.conversation,
+                "turn": turn.turn,
+                "original": turn.original,
+            })
+        _upload(s3_client, bucket, f"{prefix}/{INPUT_NAME}", inputs)
+        _upload(s3_client, bucket, f"{prefix}/{MANIFEST_NAME}", manifest)
+    result = {"conversations": conversations, "records": records}
+    logger.info(json.dumps({"event": "retriage_prepared", "run": run_id, **result}))
+    return result
+
+
+def submit(
+    bedrock_client, bucket: str, run_id: str, role_arn: str, model_id: str = BEDROCK_MODEL_ID
+) -> str:
+    """Start the model invocation job for a prepared run; returns its ARN.
+
+    ``role_arn`` is the service role Bedrock assumes to read the input and
+    write the output (RetriageBatchRole in template.yaml). Bedrock rejects
+    jobs below its minimum record count; replay small runs locally instead.
+    """
+    prefix = run_prefix(run_id)
+    response = bedrock_client.create_model_invocation_job(
+        jobName=f"{RUN_PREFIX}-{run_id}",
+        roleArn=role_arn,
+        modelId=model_id,
+        inputDataConfig={"s3InputDataConfig": {
+            "s3Uri": f"s3://{bucket}/{prefix}/{INPUT_NAME}", "s3InputFormat": "JSONL",
+        }},
+        outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{bucket}/{prefix}/{OUTPUT_DIR}/"}},
+    )
+    logger.info(json.dumps({"event": "retriage_submitted", "run": run_id, "job": response["jobArn"]}))
+    return response["jobArn"]
+
+
+def job_status(bedrock_client, job_arn: str) -> str:
+    """Submitted, InProgress, Completed, PartiallyCompleted, Failed, …"""
+    return bedrock_client.get_model_invocation_job(jobIdentifier=job_arn)["status"]
+
+
+def report(s3_client, bucket: str, run_id: str) -> Dict[str, Any]:
+    """Join the job output to the manifest and write the urgency-diff report."""
+    prefix = run_prefix(run_id)
+    records = changed = escalated = deescalated = failed = missing = 0
+    transitions: Dict[str, int] = defaultdict(int)
+    changes: List[Dict[str, Any]] = []
+    outputs = _spool_outputs(s3_client, bucket, f"{prefix}/{OUTPUT_DIR}/")
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=f"{prefix}/{MANIFEST_NAME}")["Body"]
+        for entry in iter_jsonl(body):
+            records += 1
+            row = outputs.execute(
+                "SELECT urgency FROM outputs WHERE record_id = ?", (entry["recordId"],)
+            ).fetchone()
+            if row is None:
+                missing += 1
+                continue
+            urgency = row[0]
+            if urgency is None:
+                failed += 1
+                continue
+            original = entry["original"]
+            transitions[f"{original}->{urgency}"] += 1
+            if original == urgency:
+                continue
+            changed += 1
+            if original in SEVERITY_RANK:
+                if SEVERITY_RANK[urgency] > SEVERITY_RANK[original]:
+                    escalated += 1
+                else:
+                    deescalated += 1
+            if len(changes) < MAX_REPORTED_CHANGES:
+                changes.append({
+                    "conversation": entry["conversation"], "turn": entry["turn"],
+                    "original": original, "new": urgency,
+                })
+    finally:
+        outputs.close()
+
+    result = {
+        "run": run_id,
+        "records": records,
+        "compared": records - failed - missing,
+        "changed": changed,
+        "escalated": escalated,
+        "deescalated": deescalated,
+        "failed": failed,
+        "missing": missing,
+        "transitions": dict(sorted(transitions.items())),
+        # biggest escalations first: those are the conversations to review
+        "changes": sorted(changes, key=_escalation, reverse=True),
+    }
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}/{REPORT_NAME}",
+        Body=json.dumps(result, indent=2).encode("utf-8"),
+        ContentType="application/json",
+        ServerSideEncryption="AES256",
+    )
+    logger.info(json.dumps({
+        "event": "retriage_report",
+        **{k: v for k, v in result.items() if k not in ("transitions", "changes")},
+    }))
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Offline replay
+# ---------------------------------------------------------------------------
+
+class ReplayBatchClient:
+    """Stand-in for the ``bedrock`` client's batch-inference calls.
+
+    create_model_invocation_job reads the input from S3 and writes the output
+    file at once. ``outputs`` maps record ids to canned completion text; a
+    record missing from it gets an error entry. Without ``outputs`` every
+    record is answered by the keyword classifier.
+    """
+
+    def __init__(self, s3_client, outputs: Optional[Mapping[str, str]] = None) -> None:
+        self.s3 = s3_client
+        self.outputs = outputs
+        self.jobs: Dict[str, str] = {}
+
+    def create_model_invocation_job(
+        self, inputDataConfig: Dict[str, Any], outputDataConfig: Dict[str, Any], **_: Any
+    ) -> Dict[str, str]:
+        in_bucket, in_key = _split_uri(inputDataConfig["s3InputDataConfig"]["s3Uri"])
+        out_bucket, out_prefix = _split_uri(outputDataConfig["s3OutputDataConfig"]["s3Uri"])
+        job_id = f"replay{len(self.jobs) + 1}"
+        body = self.s3.get_object(Bucket=in_bucket, Key=in_key)["Body"]
+        with tempfile.TemporaryFile() as out:
+            for record in iter_jsonl(body):
+                _write_line(out, self._answer(record))
+            name = in_key.rsplit("/", 1)[-1]
+            _upload(self.s3, out_bucket, f"{out_prefix.rstrip('/')}/{job_id}/{name}.out", out)
+        arn = f"arn:aws:bedrock:local:000000000000:model-invocation-job/{job_id}"
+        self.jobs[arn] = "Completed"
+        return {"jobArn": arn}
+
+    def get_model_invocation_job(self, jobIdentifier: str, **_) -> Dict[str, str]:
+        return {"jobArn": jobIdentifier, "status": self.jobs[jobIdentifier]}
+
+    def _answer(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        if self.outputs is None:
+            content = record["modelInput"]["messages"][0]["content"]
+            text = json.dumps(fallback_classifier(content.rpartition("Latest message: ")[2]))
+        elif record["recordId"] in self.outputs:
+            text = self.outputs[record["recordId"]]
+        else:
+            return {**record, "error": {"errorCode": 400, "errorMessage": "no canned output"}}
+        return {**record, "modelOutput": {"content": [{"type": "text", "text": text}]}}
+
+
+def load_outputs(path: str) -> Dict[str, str]:
+    """Read canned completions from a JSONL file of {"recordId", "text"} lines."""
+    with open(path, encoding="utf-8") as fh:
+        return {entry["recordId"]: entry["text"] for entry in map(json.loads, filter(str.strip, fh))}
+
+
+def replay(
+    s3_client, source_bucket: str, bucket: str, run_id: str, outputs: Optional[Mapping[str, str]] = None
+) -> Dict[str, Any]:
+    """Prepare, run against ReplayBatchClient and report, all offline."""
+    prepare(s3_client, source_bucket, bucket, run_id)
+    submit(ReplayBatchClient(s3_client, outputs), bucket, run_id, role_arn="replay")
+    return report(s3_client, bucket, run_id)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _iter_outputs(s3_client, bucket: str, prefix: str) -> Iterator[Dict[str, Any]]:
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(OUTPUT_SUFFIX):
+                yield from iter_jsonl(s3_client.get_object(Bucket=bucket, Key=obj["Key"])["Body"])
+
+
+def _spool_outputs(s3_client, bucket: str, prefix: str) -> sqlite3.Connection:
+    """Index the job output by record id in a temporary on-disk database.
+
+    Bedrock does not promise output in input order, so the manifest cannot be
+    merged against it directly. Only the re-classified urgency (NULL for a
+    failed record) is kept; the first output for a record id wins.
+    """
+    conn = sqlite3.connect("")  # "" is a private temporary file, removed on close
+    conn.execute("CREATE TABLE outputs (record_id TEXT PRIMARY KEY, urgency TEXT)")
+    conn.executemany(
+        "INSERT OR IGNORE INTO outputs VALUES (?, ?)",
+        ((record.get("recordId"), _output_urgency(record))
+         for record in _iter_outputs(s3_client, bucket, prefix)),
+    )
+    conn.commit()
+    return conn
+
+
+def _output_urgency(record: Dict[str, Any]) -> Optional[str]:
+    """The re-classified urgency, or None for an errored or unparseable record."""
+    if record.get("error"):
+        return None
+    try:
+        return parse_completion(record["modelOutput"]["content"][0]["text"])["urgency"]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _escalation(change: Dict[str, Any]) -> int:
+    new = SEVERITY_RANK[change["new"]]
+    return new - SEVERITY_RANK.get(change["original"], new)
+
+
+def _write_line(fh: IO[bytes], obj: Dict[str, Any]) -> None:
+    fh.write((json.dumps(obj) + "\n").encode("utf-8"))
+
+
+def _upload(s3_client, bucket: str, key: str, fh: IO[bytes]) -> None:
+    fh.seek(0)
+    s3_client.upload_fileobj(
+        fh, bucket, key,
+        ExtraArgs={"ContentType": "application/x-ndjson", "ServerSideEncryption": "AES256"},
+    )
+
+
+def _split_uri(uri: str) -> Tuple[str, str]:
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.retriage", description=__doc__.split("\n\n")[0])
+    parser.add_argument("stage", choices=["prepare", "submit", "status", "report", "replay"])
+    parser.add_argument("--run", help="run id (prepare, submit, report, replay)")
+    parser.add_argument("--job", help="job ARN (status)")
+    parser.add_argument("--source-bucket", default=os.getenv("S3_BUCKET"), help="transcript archive")
+    parser.add_argument("--bucket", default=os.getenv("RETRIAGE_BUCKET") or os.getenv("S3_BUCKET"),
+                        help="bucket for input, output and report")
+    parser.add_argument("--role-arn", default=os.getenv("RETRIAGE_ROLE_ARN"), help="batch service role (submit)")
+    parser.add_argument("--model-id", default=BEDROCK_MODEL_ID)
+    parser.add_argument("--outputs", help="canned completions JSONL (replay)")
+    args = parser.parse_args(argv)
+
+    s3 = get_client("s3")
+    if args.stage == "prepare":
+        result: Any = prepare(s3, args.source_bucket, args.bucket, args.run)
+    elif args.stage == "submit":
+        result = submit(get_client("bedrock"), args.bucket, args.run, args.role_arn, args.model_id)
+    elif args.stage == "status":
+        result = job_status(get_client("bedrock"), args.job)
+    elif args.stage == "report":
+        result = report(s3, args.bucket, args.run)
+    else:
+        outputs = load_outputs(args.outputs) if args.outputs else None
+        result = replay(s3, args.source_bucket, args.bucket, args.run, outputs)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,322 @@
+"""Streaming Bedrock classification for the WhatsApp Healthcare Triage Agent.
+
+The blocking call waits for the whole completion before json.loads, yet the
+reply branch in build_response_and_state depends only on ``urgency``. The
+system prompt asks for urgency first, so with invoke_model_with_response_stream
+it arrives within the first few tokens. UrgencyScanner reads the text deltas
+incrementally and reports urgency as soon as its string value closes.
+
+stream_classification starts the call on a background thread and returns a
+PendingClassification straight away. The handler waits for urgency() to
+choose its reply and write state, and waits for result() (symptoms,
+red_flags, ...) only where the full extraction is needed: the staff alert
+and the classification cache.
+
+Whatever goes wrong, the two answers stay consistent: a stream that fails
+after urgency was decided keeps that urgency and takes the remaining fields
+from the keyword fallback; one that fails or stalls earlier falls back
+entirely.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    from circuit_breaker import get_circuit_breaker
+    from clients import get_bedrock_client
+    from prompts import build_prompt
+    from utils import (
+        _classification_keys,
+        fallback_classifier,
+        invoke_bedrock,
+        parse_completion,
+        usage_fields,
+    )
+except ImportError:
+    from src.circuit_breaker import get_circuit_breaker
+    from src.clients import get_bedrock_client
+    from src.prompts import build_prompt
+    from src.utils import (
+        _classification_keys,
+        fallback_classifier,
+        invoke_bedrock,
+        parse_completion,
+        usage_fields,
+    )
+
+logger = logging.getLogger(__name__)
+
+URGENCY_LEVELS = ("LOW", "MEDIUM", "HIGH")
+DECISION_GRACE = 1.0  # seconds allowed past the LLM budget before giving up on the stream
+
+
+def streaming_enabled(provider: str) -> bool:
+    """BEDROCK_STREAMING=on switches Bedrock classification to the streaming call."""
+    if provider.lower() != "bedrock":
+        return False
+    return os.getenv("BEDROCK_STREAMING", "off").lower() in ("on", "true", "1")
+
+
+class UrgencyScanner:
+    """Incremental scan of a JSON object for its top-level ``urgency`` string.
+
+    Tracks only what is needed to recognise a top-level key and its string
+    value — nesting depth, whether we are inside a string, escapes — so each
+    delta costs O(len(delta)) and the full text is parsed once at the end.
+    Anything before the opening brace (a code fence, say) is ignored.
+    """
+
+    def __init__(self, field: str = "urgency") -> None:
+        self.field = field
+        self.urgency: Optional[str] = None
+        self._parts: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._chars: List[str] = []
+        self._key: Optional[str] = None
+        self._want_value = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Consume one text delta; return urgency once it is known."""
+        self._parts.append(chunk)
+        if self.urgency is not None:
+            return self.urgency
+        for ch in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._chars.append(ch)
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._end_string("".join(self._chars)):
+                        return self.urgency
+                else:
+                    self._chars.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._chars = []
+            elif ch in "{[":
+                self._depth += 1
+                self._key, self._want_value = None, False
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._want_value = self._key == self.field
+                self._key = None
+            elif ch == ",":
+                self._key, self._want_value = None, False
+            elif not ch.isspace():
+                self._want_value = False  # a number or literal, not a string
+        return None
+
+    def _end_string(self, value: str) -> bool:
+        if self._depth != 1:
+            return False
+        if not self._want_value:
+            self._key = value
+            return False
+        self._want_value = False
+        level = value.strip().upper()
+        if level in URGENCY_LEVELS:
+            self.urgency = level
+            return True
+        return False
+
+
+class PendingClassification:
+    """A classification whose urgency may be known before the rest of it.
+
+    The first result recorded wins; later ones (a stream finishing after the
+    handler gave up on it) are ignored. With a cache, the recorded result is
+    stored under ``keys`` before result() returns it.
+    """
+
+    def __init__(
+        self, message: str, timeout: Optional[float] = None, cache=None, keys=None
+    ) -> None:
+        self.message = message
+        self.timeout = timeout
+        self.cache = cache
+        self.keys = keys
+        self.started = time.perf_counter()
+        self.decision_ms: Optional[float] = None
+        self.complete_ms: Optional[float] = None
+        self.streamed = False
+        self._urgency: Optional[str] = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._decided = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def completed(cls, message: str, result: Dict[str, Any]) -> "PendingClassification":
+        pending = cls(message)
+        pending.finish(result)
+        return pending
+
+    def decide(self, urgency: str) -> None:
+        with self._lock:
+            if self._urgency is None:
+                self._urgency = urgency
+                self.decision_ms = self._elapsed_ms()
+                self._decided.set()
+
+    def finish(self, result: Dict[str, Any]) -> bool:
+        """Record the full result; return False if one was already recorded."""
+        with self._lock:
+            if self._result is not None:
+                return False
+            if self._urgency is None:
+                self._urgency = result.get("urgency", "LOW")
+                self.decision_ms = self._elapsed_ms()
+            elif result.get("urgency") != self._urgency:
+                # The reply was already chosen from the early urgency
+                result = {**result, "urgency": self._urgency}
+            self._result = result
+            self.complete_ms = self._elapsed_ms()
+        if self.keys is not None:
+            self.cache.put(*self.keys, result)
+        self._decided.set()
+        self._done.set()
+        return True
+
+    def urgency(self) -> str:
+        """Block until urgency is known (or the budget runs out) and return it."""
+        if not self._decided.wait(self._wait_seconds()):
+            self._give_up("decision")
+        return self._urgency
+
+    def result(self) -> Dict[str, Any]:
+        """Block until the full result is known (or the budget runs out)."""
+        if not self._done.wait(self._wait_seconds()):
+            self._give_up("completion")
+        return self._result
+
+    def log_fields(self) -> Dict[str, Any]:
+        return {
+            "streamed": self.streamed,
+            "decision_ms": self.decision_ms,
+            "complete_ms": self.complete_ms,
+        }
+
+    def _give_up(self, stage: str) -> None:
+        logger.warning(json.dumps({"event": "bedrock_stream_timeout", "stage": stage}))
+        self.finish(fallback_classifier(self.message))
+
+    def _wait_seconds(self) -> Optional[float]:
+        if self.timeout is None:
+            return None
+        remaining = self.timeout + DECISION_GRACE - (time.perf_counter() - self.started)
+        return max(0.0, remaining)
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+
+def stream_classification(
+    message: str,
+    history: List[Dict[str, Any]],
+    timeout: Optional[float] = None,
+    summary: Optional[str] = None,
+    user_id: Optional[str] = None,
+    cache=None,
+) -> PendingClassification:
+    """Start a streaming Bedrock classification and return without waiting.
+
+    Cache and time-budget handling match classify_message; the full result
+    is put in the cache once the stream completes.
+    """
+    prompt = build_prompt(message, history, summary)
+    keys = None
+    if cache is not None:
+        turns = history[len(history) - prompt.context_turns:]
+        keys = _classification_keys("bedrock", message, turns, summary, user_id)
+        cached = cache.get(*keys)
+        if cached is not None:
+            logger.info(json.dumps({
+                "event": "classification_cache_hit", "urgency": cached.get("urgency"),
+            }))
+            return PendingClassification.completed(message, cached)
+
+    if timeout is not None and timeout <= 0:
+        logger.warning(json.dumps({"event": "llm_skipped_no_time", "provider": "bedrock"}))
+        return PendingClassification.completed(message, fallback_classifier(message))
+
+    breaker = get_circuit_breaker("bedrock")
+    if breaker is not None and not breaker.allow():
+        logger.warning(json.dumps({"event": "circuit_open", "provider": "bedrock"}))
+        return PendingClassification.completed(message, fallback_classifier(message))
+
+    pending = PendingClassification(message, timeout, cache, keys)
+    pending.streamed = True
+    logger.info(json.dumps({
+        "event": "classification_prompt", "provider": "bedrock", **prompt.log_fields(),
+    }))
+    threading.Thread(
+        target=_consume_stream,
+        args=(pending, prompt, breaker),
+        name="bedrock-stream",
+        daemon=True,
+    ).start()
+    return pending
+
+
+def _consume_stream(pending: PendingClassification, prompt, breaker=None) -> None:
+    scanner = UrgencyScanner()
+    start = time.perf_counter()
+    try:
+        if pending.timeout is None:
+            client = get_bedrock_client()
+        else:
+            client = get_bedrock_client(
+                read_timeout=max(1, math.ceil(pending.timeout)), max_attempts=1
+            )
+        response, prompt_cached = invoke_bedrock(
+            client, "invoke_model_with_response_stream", prompt.user, prompt.system
+        )
+        usage: Dict[str, Any] = {}
+        for event in response["body"]:
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+            payload = json.loads(chunk["bytes"])
+            kind = payload.get("type")
+            if kind == "content_block_delta":
+                if scanner.feed(payload["delta"].get("text", "")):
+                    pending.decide(scanner.urgency)
+            elif kind == "message_start":
+                usage.update(payload.get("message", {}).get("usage") or {})
+            elif kind == "message_delta":
+                usage.update(payload.get("usage") or {})
+        result = parse_completion(scanner.text)
+    except Exception as exc:
+        logger.error(json.dumps({"event": "bedrock_error", "error": str(exc), "streamed": True}))
+        if breaker is not None:
+            breaker.record(False, (time.perf_counter() - start) * 1000)
+        pending.finish(fallback_classifier(pending.message))
+        return
+
+    if breaker is not None:
+        breaker.record(True, (time.perf_counter() - start) * 1000)
+    pending.finish(result)
+    logger.info(json.dumps({
+        "event": "bedrock_classification",
+        "urgency": result["urgency"],
+        "prompt_cache": prompt_cached,
+        **usage_fields(usage),
+        **pending.log_fields(),
+    }))
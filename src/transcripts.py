@@ -0,0 +1,255 @@
+"""Incremental, append-only transcript archive for the WhatsApp Healthcare Triage Agent.
+
+Each message writes only its new turns as a small JSONL segment instead of
+re-uploading the whole history, so PUT bytes stay proportional to the
+message rather than the conversation. A periodic compaction merges segments
+into one transcript object per conversation, and readers reassemble the
+compacted object plus any newer segments lazily as a stream.
+
+Layout under the transcript bucket (``<prefix>`` = masked number + hash):
+
+    <prefix>/transcript.jsonl                compacted turns, metadata next-index=N
+    <prefix>/segments/<start-index>.jsonl    turns N.. appended since compaction
+
+Segments are written with ``IfNoneMatch="*"``, so one never replaces
+another: a container whose start index is stale moves its segment past the
+turns already archived there instead of overwriting them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+try:
+    from utils import _mask
+except ImportError:
+    from src.utils import _mask
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS_DIR = "segments"
+COMPACTED_NAME = "transcript.jsonl"
+INDEX_WIDTH = 10
+NEXT_INDEX_METADATA = "next-index"
+MAX_APPEND_ATTEMPTS = 5
+# S3 answers a lost conditional write with 412, or 409 while a racing one is in flight
+WRITE_CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict")
+
+
+def transcript_prefix(user_id: str) -> str:
+    """Return the S3 prefix for a user's transcript.
+
+    The masked number keeps the archive browsable; the hash stops two users
+    who share the same last four digits from landing in one transcript.
+    """
+    digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:16]
+    return f"{_mask(user_id)}/{digest}"
+
+
+def append_transcript(
+    s3_client,
+    bucket: str,
+    user_id: str,
+    turns: List[Dict[str, Any]],
+    start_index: int,
+    raise_errors: bool = False,
+) -> Optional[int]:
+    """Write ``turns`` as one segment starting at absolute turn ``start_index``.
+
+    Returns the index the segment was stored at. If a segment already holds
+    that index and has the same turns, this was a retry and nothing is
+    written; if it holds other turns, the write moves to the first index
+    after them.
+    """
+    if not turns:
+        return None
+    body = _to_jsonl(turns)
+    prefix = transcript_prefix(user_id)
+    index = start_index
+    try:
+        for _ in range(MAX_APPEND_ATTEMPTS):
+            key = f"{prefix}/{SEGMENTS_DIR}/{index:0{INDEX_WIDTH}d}.jsonl"
+            try:
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=body,
+                    ContentType="application/x-ndjson",
+                    ServerSideEncryption="AES256",
+                    IfNoneMatch="*",
+                )
+                return index
+            except ClientError as exc:
+                if exc.response.get("Error", {}).get("Code") not in WRITE_CONFLICT_CODES:
+                    raise
+            try:
+                existing = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+            except s3_client.exceptions.NoSuchKey:
+                continue  # the racing write did not land; try the same index again
+            if existing == body:
+                return index
+            logger.warning(json.dumps({"event": "s3_segment_conflict", "index": index}))
+            index += existing.count(b"\n")
+        raise RuntimeError(f"no free segment index after {MAX_APPEND_ATTEMPTS} attempts")
+    except Exception as exc:
+        logger.error(json.dumps({"event": "s3_segment_error", "error": str(exc)}))
+        if raise_errors:
+            raise
+    return None
+
+
+def iter_transcript(s3_client, bucket: str, user_id: str) -> Iterator[Dict[str, Any]]:
+    """Yield every archived turn in order, streaming objects line by line."""
+    yield from _iter_prefix(s3_client, bucket, transcript_prefix(user_id))
+
+
+def list_transcripts(s3_client, bucket: str) -> Iterator[str]:
+    """Yield the prefix of every archived conversation once, in key order."""
+    last = None
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            prefix, sep, _ = key.rpartition(f"/{SEGMENTS_DIR}/")
+            if not sep:
+                prefix, sep, name = key.rpartition("/")
+                if name != COMPACTED_NAME:
+                    continue  # legacy plain-text transcripts and other objects
+            if prefix != last:
+                # a conversation's segments and compacted object list together
+                last = prefix
+                yield prefix
+
+
+def iter_conversation(s3_client, bucket: str, prefix: str) -> Iterator[Dict[str, Any]]:
+    """Yield every turn of the conversation archived under ``prefix``."""
+    yield from _iter_prefix(s3_client, bucket, prefix)
+
+
+def format_turn(turn: Dict[str, Any]) -> str:
+    """Render a turn in the plain-text transcript format."""
+    return f"{turn.get('timestamp', '')} [{turn.get('role', 'patient')}]: {turn.get('message', '')}"
+
+
+# ---------------------------------------------------------------------------
+# Compaction
+# ---------------------------------------------------------------------------
+
+def compact_transcript(s3_client, bucket: str, prefix: str) -> int:
+    """Merge all segments under ``prefix`` into its compacted transcript.
+
+    Returns the number of segments merged. Segments written while compaction
+    runs are left in place and picked up by the next run.
+    """
+    segments = _list_segments(s3_client, bucket, prefix)
+    if not segments:
+        return 0
+
+    turns: List[Dict[str, Any]] = []
+    obj = _get_compacted(s3_client, bucket, prefix)
+    next_index = 0
+    if obj is not None:
+        next_index = int(obj.get("Metadata", {}).get(NEXT_INDEX_METADATA, 0))
+        turns.extend(iter_jsonl(obj["Body"]))
+    for start, key in segments:
+        if start < next_index:
+            continue  # duplicate of an already merged write
+        segment = list(iter_jsonl(s3_client.get_object(Bucket=bucket, Key=key)["Body"]))
+        turns.extend(segment)
+        next_index = start + len(segment)
+
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}/{COMPACTED_NAME}",
+        Body=_to_jsonl(turns),
+        ContentType="application/x-ndjson",
+        ServerSideEncryption="AES256",
+        Metadata={NEXT_INDEX_METADATA: str(next_index)},
+    )
+    keys = [key for _, key in segments]
+    for start in range(0, len(keys), 1000):
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={"Objects": [{"Key": k} for k in keys[start:start + 1000]], "Quiet": True},
+        )
+    logger.info(json.dumps({"event": "transcript_compacted", "segments": len(keys)}))
+    return len(keys)
+
+
+def compact_all(s3_client, bucket: str, min_segments: int = 1) -> Dict[str, int]:
+    """Compact every conversation with at least ``min_segments`` pending segments."""
+    pending: Dict[str, int] = defaultdict(int)
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket):
+        for obj in page.get("Contents", []):
+            prefix, sep, _ = obj["Key"].rpartition(f"/{SEGMENTS_DIR}/")
+            if sep:
+                pending[prefix] += 1
+
+    compacted = merged = 0
+    for prefix, count in pending.items():
+        if count < min_segments:
+            continue
+        try:
+            merged += compact_transcript(s3_client, bucket, prefix)
+            compacted += 1
+        except Exception as exc:
+            logger.error(json.dumps({"event": "transcript_compaction_error", "error": str(exc)}))
+    return {"conversations": compacted, "segments": merged}
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _iter_prefix(s3_client, bucket: str, prefix: str) -> Iterator[Dict[str, Any]]:
+    next_index = 0
+    obj = _get_compacted(s3_client, bucket, prefix)
+    if obj is not None:
+        next_index = int(obj.get("Metadata", {}).get(NEXT_INDEX_METADATA, 0))
+        yield from iter_jsonl(obj["Body"])
+
+    for start, key in _list_segments(s3_client, bucket, prefix):
+        # Segments below the high-water mark were merged already or are retries
+        if start < next_index:
+            continue
+        count = 0
+        for turn in iter_jsonl(s3_client.get_object(Bucket=bucket, Key=key)["Body"]):
+            count += 1
+            yield turn
+        next_index = start + count
+
+
+def _get_compacted(s3_client, bucket: str, prefix: str):
+    try:
+        return s3_client.get_object(Bucket=bucket, Key=f"{prefix}/{COMPACTED_NAME}")
+    except s3_client.exceptions.NoSuchKey:
+        return None
+
+
+def _list_segments(s3_client, bucket: str, prefix: str) -> List:
+    segments = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/{SEGMENTS_DIR}/"):
+        for obj in page.get("Contents", []):
+            name = obj["Key"].rsplit("/", 1)[-1].split(".", 1)[0]
+            if name.isdigit():
+                segments.append((int(name), obj["Key"]))
+    return sorted(segments)
+
+
+def iter_jsonl(body) -> Iterator[Dict[str, Any]]:
+    """Yield one decoded object per line of a streaming S3 body."""
+    for line in body.iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+def _to_jsonl(turns: List[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(turn) + "\n" for turn in turns).encode("utf-8")
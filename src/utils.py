@@ -12,31 +12,57 @@ import hashlib
 import hmac
 import json
 import logging
+import math
 import os
 import xml.sax.saxutils as saxutils
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
-
-import boto3
-
-try:
-    import openai  # type: ignore
-except Exception:
-    openai = None
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 try:
-    from twilio.request_validator import RequestValidator  # type: ignore
-except Exception:
-    RequestValidator = None
+    from circuit_breaker import get_circuit_breaker
+    from classification_cache import cache_keys, context_fingerprint
+    from clients import get_bedrock_client, get_openai_client, optional_module
+    from hedging import get_hedger
+    from json_extract import coerce_triage, extract_object
+    from keyword_matcher import DEFAULT_MATCHER, SEVERITY_RANK
+    from negation import scope_matches
+    from prompts import build_prompt
+except ImportError:
+    from src.circuit_breaker import get_circuit_breaker
+    from src.classification_cache import cache_keys, context_fingerprint
+    from src.clients import get_bedrock_client, get_openai_client, optional_module
+    from src.hedging import get_hedger
+    from src.json_extract import coerce_triage, extract_object
+    from src.keyword_matcher import DEFAULT_MATCHER, SEVERITY_RANK
+    from src.negation import scope_matches
+    from src.prompts import build_prompt
+
+# The twilio package is imported by _request_validator on the first webhook
+# rather than at cold start; setting RequestValidator to None forces the
+# manual HMAC check.
+_UNSET = object()
+RequestValidator: Any = _UNSET
 
 logger = logging.getLogger(__name__)
 
 MAX_MESSAGE_LENGTH = 1600   # WhatsApp character limit
 MAX_DAILY_MESSAGES = 50     # Abuse prevention
 CONVERSATION_TTL_DAYS = 90  # Auto-expire data after 90 days (GDPR/HIPAA-adjacent)
+HISTORY_WINDOW = 20         # Turns kept on the DynamoDB item (10 exchanges)
+HISTORY_TRIM_BATCH = 10     # Extra turns tolerated before trimming back to the window
+SUMMARY_MAX_CHARS = 1000    # Cap on the rolling summary of trimmed turns
+SUMMARY_SNIPPET_CHARS = 120
+GATE_ATTRIBUTES = ("daily_count", "count_date", "version")  # projected for the rate-limit check
+STORE_MAX_ATTEMPTS = 3      # conditional writes tried before giving up on a version conflict
 
 BEDROCK_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
 OPENAI_MODEL_ID = "gpt-3.5-turbo-1106"
+PROVIDER_MODELS = {"bedrock": BEDROCK_MODEL_ID, "openai": OPENAI_MODEL_ID}
+
+MAX_OUTPUT_TOKENS = 512      # completion cap for one triage result
+LLM_TIMEOUT_CAP = 8.0        # seconds — never wait longer than this for a provider
+LLM_TIMEOUT_RESERVE_MS = 2000  # kept back for fallback, DynamoDB/S3 writes and the reply
+LLM_TIMEOUT_MIN = 0.5        # below this the LLM is skipped in favour of keywords
 
 
 # ---------------------------------------------------------------------------
@@ -87,11 +113,29 @@ def verify_twilio_signature(
     Uses the official Twilio library when available; falls back to a manual
     HMAC-SHA1 implementation that is constant-time to prevent timing attacks.
     """
-    if RequestValidator is not None:
-        validator = RequestValidator(auth_token)
+    validator_class = _request_validator()
+    if validator_class is not None:
+        validator = validator_class(auth_token)
         flat_params = {k: v[0] if isinstance(v, list) else v for k, v in params.items()}
         return bool(validator.validate(url, flat_params, signature))
 
+    return hmac.compare_digest(twilio_signature(url, params, auth_token), signature)
+
+
+def _request_validator():
+    global RequestValidator
+    if RequestValidator is _UNSET:
+        module = optional_module("twilio.request_validator")
+        RequestValidator = getattr(module, "RequestValidator", None)
+    return RequestValidator
+
+
+def twilio_signature(url: str, params: Dict[str, Any], auth_token: str) -> str:
+    """Compute the X-Twilio-Signature Twilio sends for a form POST to ``url``.
+
+    Base64 HMAC-SHA1, keyed by the auth token, of the URL followed by every
+    parameter name and (first) value sorted by name.
+    """
     sorted_params = sorted(
         (k, v[0] if isinstance(v, list) else v) for k, v in params.items()
     )
@@ -99,38 +143,323 @@ def verify_twilio_signature(
     digest = hmac.new(
         auth_token.encode("utf-8"), data.encode("utf-8"), hashlib.sha1
     ).digest()
-    computed = base64.b64encode(digest).decode("utf-8")
-    return hmac.compare_digest(computed, signature)
+    return base64.b64encode(digest).decode("utf-8")
 
 
 # ---------------------------------------------------------------------------
 # DynamoDB helpers
 # ---------------------------------------------------------------------------
 
-def load_conversation(table, user_id: str) -> Dict[str, Any]:
-    """Load conversation state from DynamoDB, returning defaults for new users."""
+class Conversation(dict):
+    """Conversation item that records which attributes changed since it was loaded.
+
+    store_conversation uses the dirty set to send a partial UpdateItem: only
+    changed attributes are SET, and turns appended to ``history`` are sent via
+    list_append instead of rewriting the whole list.
+    """
+
+    def __init__(self, *args: Any, is_new: bool = False, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.is_new = is_new
+        self.from_cache = False
+        self.partial = False
+        self.excluded: Set[str] = set()
+        self.mark_clean()
+        if is_new:
+            self.dirty = set(self)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+
+    def exclude(self, *keys: str) -> None:
+        """Never write ``keys``; another component (e.g. the rate limiter) owns them."""
+        self.excluded.update(keys)
+
+    def mark_clean(self) -> None:
+        """Record the current state as persisted."""
+        self.dirty: Set[str] = set()
+        self._stored_history = list(self.get("history") or [])
+        self._stored_offset = int(self.get("history_offset") or 0)
+
+    def appended_history(self) -> Optional[List[Dict[str, Any]]]:
+        """Return turns added after the persisted ones, or None if history was rewritten."""
+        history = self.get("history") or []
+        stored = self._stored_history
+        if len(history) < len(stored):
+            return None
+        if any(a is not b for a, b in zip(history, stored)):
+            return None
+        return history[len(stored):]
+
+    def added_history(self) -> List[Dict[str, Any]]:
+        """Return the turns added since the last load or store, even if history
+        has been trimmed since (trim_history only drops the oldest turns)."""
+        appended = self.appended_history()
+        if appended is not None:
+            return appended
+        history = self.get("history") or []
+        trimmed = int(self.get("history_offset") or 0) - self._stored_offset
+        added = len(history) + trimmed - len(self._stored_history)
+        return history[-added:] if added > 0 else []
+
+    def fill(self, item: Dict[str, Any]) -> None:
+        """Merge a full item into a partially loaded conversation.
+
+        Attributes changed locally since the partial load (e.g. the daily
+        counter) keep their local value; everything else is taken from
+        ``item`` without being marked dirty.
+        """
+        for key, value in item.items():
+            if key not in self.dirty:
+                super().__setitem__(key, value)
+        if "history" not in self.dirty:
+            self._stored_history = list(self.get("history") or [])
+        self.partial = False
+
+    def rebase(self, item: Optional[Dict[str, Any]]) -> None:
+        """Replay this conversation's unsaved changes on top of a fresher ``item``.
+
+        Turns added by this request go after the fresh history. If the
+        history had been trimmed, the trim is redone on the result, so turns
+        another writer stored in between are kept (or folded into the fresh
+        summary) instead of being replaced by the stale list. Any other dirty
+        attribute overwrites the fresh value; excluded attributes always take
+        the fresh value.
+        """
+        trimmed = self.appended_history() is None
+        added = self.added_history()
+        skip = self.excluded | {"history"} | ({"history_offset", "summary"} if trimmed else set())
+        changes = {k: self[k] for k in self.dirty - skip}
+        fresh = dict(item) if item else _default_conversation(self["user_id"])
+        fresh_history = list(fresh.get("history") or [])
+
+        super().clear()
+        super().update(fresh)
+        self.is_new = not item
+        self.mark_clean()
+        self._stored_history = fresh_history
+        if added:
+            super().__setitem__("history", fresh_history + added)
+            self.dirty.add("history")
+        for key, value in changes.items():
+            self[key] = value
+        if trimmed:
+            trim_history(self)
+        if self.is_new:
+            self.dirty = set(self)
+
+
+def load_conversation(
+    table,
+    user_id: str,
+    cache=None,
+    attributes: Optional[Tuple[str, ...]] = None,
+    consistent: bool = False,
+) -> Dict[str, Any]:
+    """Load conversation state from DynamoDB, returning defaults for new users.
+
+    With a ConversationCache, a warm container reuses the item it last wrote
+    for this user and skips the get_item.
+
+    ``attributes`` projects the read down to those attributes (e.g.
+    GATE_ATTRIBUTES for the rate-limit check) and returns a conversation
+    flagged ``partial``; complete_conversation fetches the rest later.
+    Projection saves transfer and deserialisation, not read capacity —
+    DynamoDB still charges for the full item.
+    """
+    if cache is not None:
+        item = cache.get(user_id)
+        if item is not None:
+            conversation = Conversation(item)
+            conversation.from_cache = True
+            return conversation
     try:
-        response = table.get_item(Key={"user_id": user_id})
-        item = response.get("Item")
+        request: Dict[str, Any] = {"Key": {"user_id": user_id}, "ConsistentRead": consistent}
+        if attributes:
+            names = {f"#p{i}": name for i, name in enumerate(attributes)}
+            request["ProjectionExpression"] = ", ".join(names)
+            request["ExpressionAttributeNames"] = names
+        item = table.get_item(**request).get("Item")
+        if item and attributes:
+            conversation = Conversation(item)
+            dict.__setitem__(conversation, "user_id", user_id)
+            conversation.partial = True
+            return conversation
         if item:
-            return item
+            if cache is not None:
+                cache.put(user_id, item)
+            return _to_conversation(item, user_id)
     except Exception as exc:
         logger.error(
             json.dumps({"event": "dynamodb_load_error", "user": _mask(user_id), "error": str(exc)})
         )
-    return _default_conversation(user_id)
+    return Conversation(_default_conversation(user_id), is_new=True)
+
+
+def complete_conversation(
+    table, conversation: Dict[str, Any], cache=None, consistent: bool = False
+) -> Dict[str, Any]:
+    """Fetch the rest of a conversation loaded with a projection, in place.
+
+    Called only once the request has passed the rate-limit gate and the
+    classifier needs history and summary. A no-op for full conversations.
+    """
+    if not getattr(conversation, "partial", False):
+        return conversation
+    user_id = conversation["user_id"]
+    try:
+        item = table.get_item(Key={"user_id": user_id}, ConsistentRead=consistent).get("Item")
+    except Exception as exc:
+        logger.error(
+            json.dumps({"event": "dynamodb_load_error", "user": _mask(user_id), "error": str(exc)})
+        )
+        item = None
+    if item:
+        if cache is not None:
+            cache.put(user_id, item)
+        conversation.fill(item)
+        for key, value in _default_conversation(user_id).items():
+            if key not in conversation:
+                conversation[key] = value
+    else:
+        # Keep going without context; new turns still go through list_append,
+        # so nothing already stored is overwritten.
+        conversation.fill({
+            k: v for k, v in _default_conversation(user_id).items() if k not in conversation
+        })
+    return conversation
+
+
+def consistent_read(stage: str) -> bool:
+    """Return whether reads for ``stage`` ("gate" or "full") are strongly consistent.
+
+    Configured per stage with CONSISTENT_READ_GATE / CONSISTENT_READ_FULL;
+    both default to eventually consistent reads, as before.
+    """
+    return os.getenv(f"CONSISTENT_READ_{stage.upper()}", "false").lower() in ("1", "true", "yes")
+
 
+def store_conversation(table, conversation: Dict[str, Any], cache=None) -> bool:
+    """Persist conversation state to DynamoDB with a 90-day TTL for auto-expiry.
 
-def store_conversation(table, conversation: Dict[str, Any]) -> None:
-    """Persist conversation state to DynamoDB with a 90-day TTL for auto-expiry."""
+    A Conversation is written with a single UpdateItem covering only its dirty
+    attributes (all of them for a new conversation); plain dicts use put_item.
+    The UpdateItem is conditional on the ``version`` that was loaded. If
+    another writer got there first, the item is reloaded, this message's
+    changes are reapplied and the write is retried.
+
+    After a successful UpdateItem the conversation holds the item as stored
+    (ReturnValues=ALL_NEW), so ``history`` and ``history_offset`` are
+    authoritative even when it was loaded from a stale cache. Returns whether
+    the write succeeded.
+    """
     now = datetime.now(timezone.utc)
     conversation["updated_at"] = now.isoformat()
     # DynamoDB TTL expects an epoch-seconds integer
     conversation["ttl"] = int(now.timestamp()) + (CONVERSATION_TTL_DAYS * 86_400)
-    try:
-        table.put_item(Item=conversation)
-    except Exception as exc:
-        logger.error(json.dumps({"event": "dynamodb_store_error", "error": str(exc)}))
+    if not isinstance(conversation, Conversation):
+        try:
+            table.put_item(Item=conversation)
+        except Exception as exc:
+            logger.error(json.dumps({"event": "dynamodb_store_error", "error": str(exc)}))
+            return False
+        return True
+
+    user_id = conversation["user_id"]
+    for attempt in range(1, STORE_MAX_ATTEMPTS + 1):
+        try:
+            response = table.update_item(ReturnValues="ALL_NEW", **build_update_request(conversation))
+            break
+        except Exception as exc:
+            if not _is_condition_failure(exc) or attempt == STORE_MAX_ATTEMPTS:
+                logger.error(json.dumps({"event": "dynamodb_store_error", "error": str(exc)}))
+                if cache is not None:
+                    cache.invalidate(user_id)
+                return False
+            logger.warning(json.dumps({
+                "event": "conversation_version_conflict",
+                "user": _mask(user_id),
+                "attempt": attempt,
+                "from_cache": conversation.from_cache,
+            }))
+            try:
+                item = table.get_item(Key={"user_id": user_id}, ConsistentRead=True).get("Item")
+            except Exception as reload_exc:
+                logger.error(json.dumps({"event": "dynamodb_load_error", "error": str(reload_exc)}))
+                if cache is not None:
+                    cache.invalidate(user_id)
+                return False
+            conversation.rebase(item)
+
+    stored = response.get("Attributes") if isinstance(response, dict) else None
+    if stored:
+        dict.update(conversation, stored)
+    else:
+        dict.__setitem__(conversation, "version", int(conversation.get("version") or 0) + 1)
+    conversation.is_new = False
+    conversation.mark_clean()
+    if cache is not None:
+        cache.put(user_id, conversation)
+    return True
+
+
+def build_update_request(conversation: Conversation) -> Dict[str, Any]:
+    """Build UpdateItem kwargs that SET the dirty attributes of ``conversation``.
+
+    The write bumps ``version`` and only succeeds if the stored version is
+    still the one this conversation was loaded with.
+    """
+    names: Dict[str, str] = {"#ver": "version"}
+    values: Dict[str, Any] = {}
+    clauses = []
+    skip = conversation.excluded | {"user_id", "version"}
+    for i, key in enumerate(sorted(conversation.dirty - skip)):
+        name, value = f"#a{i}", f":v{i}"
+        if key == "history":
+            appended = conversation.appended_history()
+            if appended == []:
+                continue
+            if appended is not None:
+                values[value] = appended
+                values[":empty"] = []
+                clauses.append(f"{name} = list_append(if_not_exists({name}, :empty), {value})")
+                names[name] = key
+                continue
+        values[value] = conversation[key]
+        clauses.append(f"{name} = {value}")
+        names[name] = key
+
+    version = conversation.get("version")
+    values[":next"] = int(version or 0) + 1
+    clauses.append("#ver = :next")
+    if version is None:
+        condition = "attribute_not_exists(#ver)"
+    else:
+        condition = "#ver = :expected"
+        values[":expected"] = version
+
+    return {
+        "Key": {"user_id": conversation["user_id"]},
+        "UpdateExpression": "SET " + ", ".join(clauses),
+        "ConditionExpression": condition,
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+
+def _to_conversation(item: Dict[str, Any], user_id: str) -> Conversation:
+    conversation = Conversation(item)
+    # Items first created by the rate limiter only hold the counters
+    for key, value in _default_conversation(user_id).items():
+        if key not in conversation:
+            conversation[key] = value
+    return conversation
+
+
+def _is_condition_failure(exc: Exception) -> bool:
+    response = getattr(exc, "response", None) or {}
+    return response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
 
 
 def _default_conversation(user_id: str) -> Dict[str, Any]:
@@ -147,12 +476,90 @@ def _default_conversation(user_id: str) -> Dict[str, Any]:
     }
 
 
+def trim_history(
+    conversation: Dict[str, Any],
+    window: Optional[int] = None,
+    batch: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Cap the stored history at ``window`` turns and return the turns removed.
+
+    Trimming only happens once the history exceeds ``window + batch`` turns,
+    so most stores append via list_append instead of rewriting the list.
+    Removed patient messages are folded into the rolling ``summary`` field and
+    ``history_offset`` counts every turn ever trimmed, so absolute turn
+    indices (used by the transcript archive) stay stable.
+    """
+    if window is None:
+        window = int(_env_number("HISTORY_WINDOW", HISTORY_WINDOW))
+    if batch is None:
+        batch = int(_env_number("HISTORY_TRIM_BATCH", HISTORY_TRIM_BATCH))
+    history = conversation.get("history", [])
+    overflow = len(history) - window
+    if window < 0 or overflow <= max(batch, 0):
+        return []
+
+    dropped = history[:overflow]
+    conversation["history"] = history[overflow:]
+    conversation["history_offset"] = int(conversation.get("history_offset", 0)) + overflow
+    conversation["summary"] = summarise_turns(conversation.get("summary") or "", dropped)
+    return dropped
+
+
+def summarise_turns(summary: str, turns: List[Dict[str, Any]]) -> str:
+    """Append short snippets of the patient's trimmed messages to ``summary``.
+
+    Deterministic and free: no model call. When the result exceeds
+    SUMMARY_MAX_CHARS the oldest snippets are dropped first.
+    """
+    snippets = [part for part in summary.split(" | ") if part]
+    for turn in turns:
+        if turn.get("role", "patient") != "patient":
+            continue
+        text = " ".join(str(turn.get("message", "")).split())
+        if len(text) > SUMMARY_SNIPPET_CHARS:
+            text = text[:SUMMARY_SNIPPET_CHARS - 3].rstrip() + "..."
+        date = str(turn.get("timestamp", ""))[:10]
+        snippets.append(f"{date}: {text}" if date else text)
+
+    joined = " | ".join(snippets)
+    while len(joined) > SUMMARY_MAX_CHARS and len(snippets) > 1:
+        snippets.pop(0)
+        joined = " | ".join(snippets)
+    return joined[-SUMMARY_MAX_CHARS:]
+
+
+def spill_history(
+    table, user_id: str, turns: List[Dict[str, Any]], start_index: int
+) -> None:
+    """Persist trimmed turns to a secondary item keyed ``<user>#history#<index>``.
+
+    Used when no transcript bucket is configured; otherwise the S3 archive
+    already holds every turn.
+    """
+    if not turns:
+        return
+    ttl = int(datetime.now(timezone.utc).timestamp()) + (CONVERSATION_TTL_DAYS * 86_400)
+    try:
+        table.put_item(Item={
+            "user_id": f"{user_id}#history#{start_index:010d}",
+            "history": turns,
+            "ttl": ttl,
+        })
+    except Exception as exc:
+        logger.error(json.dumps({"event": "dynamodb_spill_error", "error": str(exc)}))
+
+
 # ---------------------------------------------------------------------------
 # S3 transcript archival
 # ---------------------------------------------------------------------------
 
 def upload_transcript(s3_client, bucket: str, user_id: str, transcript: str) -> None:
-    """Archive the conversation transcript to S3 under a masked user prefix."""
+    """Archive a whole plain-text transcript to S3 under a masked user prefix.
+
+    Kept for compatibility only: the handler and worker archive incremental
+    segments with transcripts.append_transcript, and readers skip these
+    legacy ``.txt`` objects.
+    """
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
     key = f"{_mask(user_id)}/transcript_{timestamp}.txt"
     try:
@@ -171,13 +578,17 @@ def upload_transcript(s3_client, bucket: str, user_id: str, transcript: str) ->
 # SNS alerting
 # ---------------------------------------------------------------------------
 
-def send_alert(sns_client, topic_arn: str, subject: str, message: str) -> None:
+def send_alert(
+    sns_client, topic_arn: str, subject: str, message: str, raise_errors: bool = False
+) -> None:
     """Publish a high-urgency alert to the SNS topic."""
     try:
         sns_client.publish(TopicArn=topic_arn, Subject=subject, Message=message)
     except Exception as exc:
         # Log the error but don't crash — the patient still needs a reply
         logger.error(json.dumps({"event": "sns_alert_error", "error": str(exc)}))
+        if raise_errors:
+            raise
 
 
 # ---------------------------------------------------------------------------
@@ -199,85 +610,233 @@ def generate_twiml_response(message: str) -> str:
 # LLM classification
 # ---------------------------------------------------------------------------
 
+def llm_timeout_budget(context: Any = None) -> float:
+    """Return the seconds an LLM call may take within this invocation.
+
+    Derived from ``context.get_remaining_time_in_millis()`` minus
+    LLM_TIMEOUT_RESERVE_MS and capped at LLM_TIMEOUT_CAP (both overridable via
+    the environment). Without a Lambda context the cap is returned. A result of
+    0 means there is no time left for a provider call. Calls made with a
+    budget disable SDK retries, so the budget bounds the whole call.
+    """
+    cap = _env_number("LLM_TIMEOUT_CAP", LLM_TIMEOUT_CAP)
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining is None:
+        return cap
+    reserve_ms = _env_number("LLM_TIMEOUT_RESERVE_MS", LLM_TIMEOUT_RESERVE_MS)
+    budget = min(cap, (get_remaining() - reserve_ms) / 1000)
+    return budget if budget >= LLM_TIMEOUT_MIN else 0.0
+
+
 def classify_message(
     message: str,
     history: List[Dict[str, Any]],
     provider: str = "bedrock",
     openai_api_key: Optional[str] = None,
+    timeout: Optional[float] = None,
+    summary: Optional[str] = None,
+    user_id: Optional[str] = None,
+    cache=None,
 ) -> Dict[str, Any]:
     """Classify a patient message and return a structured triage result.
 
     Tries the configured LLM provider first; falls back to keyword-based
-    classification if the LLM call fails or is unavailable.
+    classification if the LLM call fails, is unavailable, or ``timeout``
+    (seconds, usually from llm_timeout_budget) leaves no room for it.
+    ``summary`` is the rolling summary of turns trimmed from ``history``.
+
+    With CIRCUIT_BREAKER=on, a provider that has been failing or slow is
+    skipped in favour of the keyword classifier until its breaker half-opens.
+    With LLM_HEDGE=on, a primary that has not answered by its latency
+    percentile deadline is raced against the secondary provider (hedging.py).
+
+    With a ClassificationCache, a result for the same normalised message in
+    the same context is reused instead of calling the provider; ``user_id``
+    scopes cached HIGH results to that user.
 
     Returns a dict with keys: symptoms, duration, age, red_flags, urgency.
     urgency is one of: LOW | MEDIUM | HIGH.
     """
     resolved_provider = (provider or os.getenv("LLM_PROVIDER", "bedrock")).lower()
+    prompt = build_prompt(message, history, summary)
+
+    keys = None
+    if cache is not None and resolved_provider in PROVIDER_MODELS:
+        turns = history[len(history) - prompt.context_turns:]
+        keys = _classification_keys(resolved_provider, message, turns, summary, user_id)
+        cached = cache.get(*keys)
+        if cached is not None:
+            logger.info(json.dumps({
+                "event": "classification_cache_hit", "urgency": cached.get("urgency"),
+            }))
+            return cached
+
+    if timeout is not None and timeout <= 0:
+        logger.warning(json.dumps({"event": "llm_skipped_no_time", "provider": resolved_provider}))
+        return fallback_classifier(message)
+
+    logger.info(json.dumps({
+        "event": "classification_prompt", "provider": resolved_provider, **prompt.log_fields(),
+    }))
+    system_prompt, user_content = prompt.system, prompt.user
+    calls = {
+        "bedrock": lambda t: _classify_bedrock(user_content, system_prompt, message, t),
+        "openai": lambda t: _classify_openai(user_content, system_prompt, message, openai_api_key, t),
+    }
+    for name, call in list(calls.items()):
+        breaker = get_circuit_breaker(name)
+        if breaker is not None:
+            calls[name] = breaker.wrap(call, lambda: fallback_classifier(message))
+
+    hedger = get_hedger()
+    secondary = hedger.secondary(resolved_provider) if hedger is not None else None
+    if resolved_provider in calls and secondary in calls:
+        # LLM_HEDGE: race the secondary provider against a slow primary
+        result, _ = hedger.run(
+            resolved_provider, calls[resolved_provider], secondary, calls[secondary],
+            timeout, input_tokens=prompt.input_tokens,
+        )
+        if result is None:
+            result = fallback_classifier(message)
+    elif resolved_provider in calls:
+        result = calls[resolved_provider](timeout)
+    else:
+        result = None
+    if result is not None:
+        if keys is not None:
+            cache.put(*keys, result)
+        return result
 
-    system_prompt = (
-        "You are a medical triage assistant. Analyze the patient's message "
-        "and any prior conversation context provided. Extract: a list of symptoms, "
-        "how long symptoms have lasted (duration), the patient's age if mentioned, "
-        "and any red-flag emergency symptoms. "
-        "Classify urgency as HIGH (call emergency services immediately), "
-        "MEDIUM (see a doctor within 24 hours), or LOW (safe for self-care). "
-        "IMPORTANT: You are NOT a diagnostic tool — only classify urgency. "
-        "Respond ONLY with valid JSON matching this schema exactly: "
-        '{"symptoms": ["string"], "duration": "string", "age": "string", '
-        '"red_flags": ["string"], "urgency": "LOW|MEDIUM|HIGH"}'
-    )
+    logger.warning(json.dumps({"event": "unknown_provider", "provider": resolved_provider}))
+    return fallback_classifier(message)
 
-    context = _build_context(history)
-    user_content = (
-        f"Conversation history:\n{context}\n\nLatest message: {message}"
-        if context
-        else message
-    )
 
-    if resolved_provider == "bedrock":
-        return _classify_bedrock(user_content, system_prompt, message)
-    if resolved_provider == "openai":
-        return _classify_openai(user_content, system_prompt, message, openai_api_key)
+def bedrock_request_body(
+    user_content: str,
+    system_prompt: str,
+    cache_prompt: bool = False,
+    max_tokens: int = MAX_OUTPUT_TOKENS,
+) -> str:
+    """Anthropic Messages request body shared by the blocking and streaming calls.
 
-    logger.warning(json.dumps({"event": "unknown_provider", "provider": resolved_provider}))
-    return _fallback_classifier(message)
+    With ``cache_prompt`` the system prompt is sent as a content block carrying
+    a cache_control marker, so Bedrock can reuse the processed prefix.
+    """
+    system: Any = system_prompt
+    if cache_prompt:
+        system = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "system": system,
+        "messages": [{"role": "user", "content": user_content}],
+    })
 
 
-def _classify_bedrock(
-    user_content: str, system_prompt: str, raw_message: str
-) -> Dict[str, Any]:
-    """Invoke AWS Bedrock (Claude 3 Haiku) for triage classification."""
+_prompt_cache_unsupported: Set[str] = set()
+
+
+def prompt_cache_enabled(model_id: str = BEDROCK_MODEL_ID) -> bool:
+    """BEDROCK_PROMPT_CACHE=on, unless ``model_id`` has rejected the marker before."""
+    if os.getenv("BEDROCK_PROMPT_CACHE", "off").lower() not in ("on", "true", "1"):
+        return False
+    return model_id not in _prompt_cache_unsupported
+
+
+def invoke_bedrock(
+    client,
+    operation: str,
+    user_content: str,
+    system_prompt: str,
+    max_tokens: int = MAX_OUTPUT_TOKENS,
+) -> Tuple[Any, bool]:
+    """Call ``operation`` (invoke_model or its streaming variant) for a triage prompt.
+
+    Returns (response, prompt_cached). A model that rejects the cache_control
+    marker is remembered for the life of the container and the call is
+    retried without it.
+    """
+    call = getattr(client, operation)
+    cache_prompt = prompt_cache_enabled()
     try:
-        region = os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1"))
-        client = boto3.client("bedrock-runtime", region_name=region)
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 512,
-            "system": system_prompt,
-            "messages": [{"role": "user", "content": user_content}],
-        })
-        response = client.invoke_model(
+        return call(
             modelId=BEDROCK_MODEL_ID,
             contentType="application/json",
             accept="application/json",
-            body=body,
-        )
-        response_body = json.loads(response["body"].read())
-        text = response_body["content"][0]["text"].strip()
+            body=bedrock_request_body(user_content, system_prompt, cache_prompt, max_tokens),
+        ), cache_prompt
+    except Exception as exc:
+        if not cache_prompt or not _rejects_prompt_cache(exc):
+            raise
+        _prompt_cache_unsupported.add(BEDROCK_MODEL_ID)
+        logger.warning(json.dumps({
+            "event": "prompt_cache_unsupported", "model": BEDROCK_MODEL_ID, "error": str(exc),
+        }))
+    return call(
+        modelId=BEDROCK_MODEL_ID,
+        contentType="application/json",
+        accept="application/json",
+        body=bedrock_request_body(user_content, system_prompt, max_tokens=max_tokens),
+    ), False
+
+
+def _rejects_prompt_cache(exc: Exception) -> bool:
+    """True for a Bedrock validation error about the cache_control marker."""
+    response = getattr(exc, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    return code == "ValidationException" and "cach" in str(exc).lower()
+
+
+def usage_fields(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Token usage (including prompt-cache reads and writes) for the logs."""
+    usage = usage or {}
+    return {
+        key: int(usage[key])
+        for key in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+        if usage.get(key) is not None
+    }
 
-        # Strip markdown code fences if the model wrapped the JSON
-        if "```" in text:
-            text = text.split("```")[1].lstrip("json").strip()
 
-        result = json.loads(text)
-        result.setdefault("urgency", "LOW")
-        result["urgency"] = result["urgency"].upper()
-        logger.info(json.dumps({"event": "bedrock_classification", "urgency": result["urgency"]}))
+def parse_completion(text: str) -> Dict[str, Any]:
+    """Extract and validate the triage JSON from the model's answer.
+
+    Tolerates preambles, code fences, trailing commentary and truncation
+    (see json_extract.py); raises ValueError if no urgency can be recovered.
+    """
+    obj, repairs = extract_object(text)
+    if repairs:
+        logger.info(json.dumps({"event": "llm_json_repaired", "repairs": repairs}))
+    return coerce_triage(obj)
+
+
+def _classify_bedrock(
+    user_content: str,
+    system_prompt: str,
+    raw_message: str,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Invoke AWS Bedrock (Claude 3 Haiku) for triage classification."""
+    try:
+        if timeout is None:
+            client = get_bedrock_client()
+        else:
+            # Whole seconds keep the number of cached client variants small.
+            # One attempt only: a retry would get a fresh read timeout and
+            # overrun the budget.
+            client = get_bedrock_client(read_timeout=max(1, math.ceil(timeout)), max_attempts=1)
+        response, prompt_cached = invoke_bedrock(client, "invoke_model", user_content, system_prompt)
+        response_body = json.loads(response["body"].read())
+        result = parse_completion(response_body["content"][0]["text"])
+        logger.info(json.dumps({
+            "event": "bedrock_classification",
+            "urgency": result["urgency"],
+            "prompt_cache": prompt_cached,
+            **usage_fields(response_body.get("usage")),
+        }))
         return result
     except Exception as exc:
         logger.error(json.dumps({"event": "bedrock_error", "error": str(exc)}))
-        return _fallback_classifier(raw_message)
+        return fallback_classifier(raw_message)
 
 
 def _classify_openai(
@@ -285,19 +844,27 @@ def _classify_openai(
     system_prompt: str,
     raw_message: str,
     openai_api_key: Optional[str],
+    timeout: Optional[float] = None,
 ) -> Dict[str, Any]:
     """Call the OpenAI Chat Completions API for triage classification."""
-    if openai is None:
+    if optional_module("openai") is None:
         logger.warning(json.dumps({"event": "openai_not_installed"}))
-        return _fallback_classifier(raw_message)
+        return fallback_classifier(raw_message)
 
     api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
     if not api_key:
         logger.warning(json.dumps({"event": "openai_no_api_key"}))
-        return _fallback_classifier(raw_message)
+        return fallback_classifier(raw_message)
 
     try:
-        client = openai.OpenAI(api_key=api_key)
+        client = get_openai_client(api_key)
+        # Only override the client default when a budget was given — passing
+        # timeout=None to the SDK would disable the timeout entirely. Within a
+        # budget the SDK must not retry, or each attempt gets the full timeout.
+        extra = {}
+        if timeout is not None:
+            client = client.with_options(max_retries=0)
+            extra["timeout"] = timeout
         completion = client.chat.completions.create(
             model=OPENAI_MODEL_ID,
             messages=[
@@ -306,46 +873,40 @@ def _classify_openai(
             ],
             response_format={"type": "json_object"},
             max_tokens=512,
+            **extra,
         )
-        text = completion.choices[0].message.content.strip()
-        result = json.loads(text)
-        result.setdefault("urgency", "LOW")
-        result["urgency"] = result["urgency"].upper()
+        result = parse_completion(completion.choices[0].message.content)
         logger.info(json.dumps({"event": "openai_classification", "urgency": result["urgency"]}))
         return result
     except Exception as exc:
         logger.error(json.dumps({"event": "openai_error", "error": str(exc)}))
-        return _fallback_classifier(raw_message)
-
-
-def _fallback_classifier(message: str) -> Dict[str, Any]:
-    """Keyword-based classifier used when no LLM provider is available."""
-    text = message.lower()
-    high_keywords = [
-        "chest pain", "shortness of breath", "difficulty breathing",
-        "fainting", "unconscious", "heart attack", "stroke",
-        "not breathing", "severe bleeding", "overdose", "seizure",
-        "anaphylaxis", "allergic reaction",
-    ]
-    medium_keywords = [
-        "fever", "vomiting", "vomit", "infection", "severe pain",
-        "broken bone", "deep cut", "high temperature", "dehydrated",
-        "painful urination", "rash spreading",
-    ]
+        return fallback_classifier(raw_message)
+
+
+def fallback_classifier(message: str) -> Dict[str, Any]:
+    """Keyword-based classifier used when no LLM provider is available.
+
+    All whole-word lexicon matches are found in one pass of the precompiled
+    matcher and scoped for negation ("no fever" is ignored) and uncertainty
+    ("maybe a stroke" counts as at most MEDIUM). A negated HIGH phrase also
+    counts as MEDIUM: this is the safety net when the LLM is unavailable, and
+    a mis-scoped negation must not turn an emergency into LOW. Urgency is the
+    highest remaining severity; every affirmed HIGH phrase is a red flag.
+    """
+    matches = scope_matches(message, DEFAULT_MATCHER.find_all(message))
 
     urgency = "LOW"
     red_flags: List[str] = []
-
-    for kw in high_keywords:
-        if kw in text:
-            urgency = "HIGH"
-            red_flags.append(kw)
-            break
-    else:
-        for kw in medium_keywords:
-            if kw in text:
-                urgency = "MEDIUM"
-                break
+    for match in matches:
+        severity = match.severity
+        if match.status != "affirmed" and severity == "HIGH":
+            severity = "MEDIUM"
+        elif match.status == "negated":
+            continue
+        if SEVERITY_RANK[severity] > SEVERITY_RANK[urgency]:
+            urgency = severity
+        if severity == "HIGH" and match.phrase not in red_flags:
+            red_flags.append(match.phrase)
 
     return {
         "symptoms": [message],
@@ -353,6 +914,8 @@ def _fallback_classifier(message: str) -> Dict[str, Any]:
         "age": "",
         "red_flags": red_flags,
         "urgency": urgency,
+        "source": "keywords",
+        "matches": [match._asdict() for match in matches],
     }
 
 
@@ -360,6 +923,52 @@ def _fallback_classifier(message: str) -> Dict[str, Any]:
 # Response builder
 # ---------------------------------------------------------------------------
 
+# Classifier diagnostics (fallback_classifier) kept out of staff alerts
+DIAGNOSTIC_KEYS = ("source", "matches")
+
+
+def build_alert(triage_result: Dict[str, Any], user_id: str) -> Tuple[str, str]:
+    """Return the (subject, body) of the staff alert for a HIGH triage result."""
+    triage_data = {k: v for k, v in triage_result.items() if k not in DIAGNOSTIC_KEYS}
+    subject = f"HIGH urgency triage alert — patient {_mask(user_id)}"
+    body = (
+        f"Patient {_mask(user_id)} requires immediate attention.\n\n"
+        f"Symptoms: {', '.join(triage_result.get('symptoms', []))}\n"
+        f"Red flags: {', '.join(triage_result.get('red_flags', []))}\n"
+        f"Duration: {triage_result.get('duration', 'unknown')}\n\n"
+        "Please contact the patient immediately.\n\n"
+        f"Full triage data:\n{json.dumps(triage_data, indent=2)}"
+    )
+    return subject, body
+
+
+# Reply templates by urgency; retriage.py maps archived replies back to them
+TRIAGE_REPLIES = {
+    "HIGH": (
+        "Based on what you've described, this sounds like it could be a medical emergency.\n\n"
+        "Please call emergency services (911 / 999 / 112) or go to your nearest "
+        "emergency room right away.\n\n"
+        "Do not drive yourself — call an ambulance or ask someone to take you."
+    ),
+    "MEDIUM": (
+        "Thank you for sharing that. Your symptoms suggest you should see a doctor "
+        "soon — ideally within the next 24 hours.\n\n"
+        "To schedule an appointment, please reply with:\n"
+        "- Your full name\n"
+        "- A preferred date and time\n\n"
+        "If your condition worsens before then, please call emergency services."
+    ),
+    "LOW": (
+        "Your symptoms sound mild. Here are some self-care tips:\n\n"
+        "- Rest and stay well hydrated\n"
+        "- Monitor your symptoms over the next 24-48 hours\n"
+        "- Take over-the-counter medication as appropriate\n\n"
+        "If your symptoms worsen or new ones appear, please consult a healthcare professional.\n\n"
+        "Reminder: This service does not provide medical diagnoses."
+    ),
+}
+
+
 def build_response_and_state(
     triage_result: Dict[str, Any],
     conversation: Dict[str, Any],
@@ -367,8 +976,13 @@ def build_response_and_state(
     sns_client,
     topic_arn: str,
     user_id: str,
+    send_alerts: bool = True,
 ) -> str:
-    """Append the latest exchange to the conversation and return the reply text."""
+    """Append the latest exchange to the conversation and return the reply text.
+
+    HIGH urgency publishes an SNS alert unless ``send_alerts`` is False, in
+    which case the caller is responsible for sending build_alert()'s message.
+    """
     urgency = triage_result.get("urgency", "LOW").upper()
     now_iso = datetime.now(timezone.utc).isoformat()
 
@@ -378,43 +992,9 @@ def build_response_and_state(
     conversation["triage_level"] = urgency
     conversation["last_intent"] = "triage"
 
-    if urgency == "HIGH":
-        subject = f"HIGH urgency triage alert — patient {_mask(user_id)}"
-        body = (
-            f"Patient {_mask(user_id)} requires immediate attention.\n\n"
-            f"Symptoms: {', '.join(triage_result.get('symptoms', []))}\n"
-            f"Red flags: {', '.join(triage_result.get('red_flags', []))}\n"
-            f"Duration: {triage_result.get('duration', 'unknown')}\n\n"
-            "Please contact the patient immediately.\n\n"
-            f"Full triage data:\n{json.dumps(triage_result, indent=2)}"
-        )
-        send_alert(sns_client, topic_arn, subject, body)
-        reply = (
-            "Based on what you've described, this sounds like it could be a medical emergency.\n\n"
-            "Please call emergency services (911 / 999 / 112) or go to your nearest "
-            "emergency room right away.\n\n"
-            "Do not drive yourself — call an ambulance or ask someone to take you."
-        )
-
-    elif urgency == "MEDIUM":
-        reply = (
-            "Thank you for sharing that. Your symptoms suggest you should see a doctor "
-            "soon — ideally within the next 24 hours.\n\n"
-            "To schedule an appointment, please reply with:\n"
-            "- Your full name\n"
-            "- A preferred date and time\n\n"
-            "If your condition worsens before then, please call emergency services."
-        )
-
-    else:
-        reply = (
-            "Your symptoms sound mild. Here are some self-care tips:\n\n"
-            "- Rest and stay well hydrated\n"
-            "- Monitor your symptoms over the next 24-48 hours\n"
-            "- Take over-the-counter medication as appropriate\n\n"
-            "If your symptoms worsen or new ones appear, please consult a healthcare professional.\n\n"
-            "Reminder: This service does not provide medical diagnoses."
-        )
+    if urgency == "HIGH" and send_alerts:
+        send_alert(sns_client, topic_arn, *build_alert(triage_result, user_id))
+    reply = TRIAGE_REPLIES.get(urgency, TRIAGE_REPLIES["LOW"])
 
     history.append({"timestamp": now_iso, "role": "agent", "message": reply})
     conversation["history"] = history
@@ -425,17 +1005,24 @@ def build_response_and_state(
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _build_context(history: List[Dict[str, Any]]) -> str:
-    """Format the last 10 conversation turns for inclusion in the LLM prompt."""
-    if not history:
-        return ""
-    lines = []
-    for entry in history[-10:]:
-        role = entry.get("role", "patient").capitalize()
-        msg = entry.get("message", "")
-        ts = entry.get("timestamp", "")
-        lines.append(f"[{ts}] {role}: {msg}")
-    return "\n".join(lines)
+def _classification_keys(
+    provider: str,
+    message: str,
+    turns: List[Dict[str, Any]],
+    summary: Optional[str],
+    user_id: Optional[str],
+) -> Tuple[str, Optional[str]]:
+    """Cache keys for ``message`` given the context ``turns`` packed into its prompt."""
+    context = f"{summary or ''}\x1e{context_fingerprint(turns)}"
+    return cache_keys(provider, PROVIDER_MODELS[provider], message, context, user_id)
+
+
+def _env_number(name: str, default: float) -> float:
+    """Read a numeric environment override, ignoring malformed values."""
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
 
 
 def _mask(user_id: str) -> str:
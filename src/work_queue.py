@@ -0,0 +1,253 @@
+"""After-reply work queue for the WhatsApp Healthcare Triage Agent.
+
+Side effects that do not have to finish before Twilio gets its TwiML reply
+(transcript archival, the staff alert) are enqueued as compact JSON job
+records and drained in batches by a separate consumer (see worker.py).
+
+Backends share one small interface — enqueue / receive / ack:
+
+- SQSWorkQueue      — production; drained by an SQS-triggered Lambda
+- SQLiteWorkQueue   — durable single-host queue for local runs
+- InMemoryWorkQueue — process-local queue for tests
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from clients import get_client
+except ImportError:
+    from src.clients import get_client
+
+logger = logging.getLogger(__name__)
+
+SQS_MAX_BATCH = 10          # SQS receive/delete limit per call
+VISIBILITY_TIMEOUT = 60     # seconds before an unacked SQLite job is redelivered
+
+Job = Dict[str, Any]
+Receipt = Any
+
+
+class WorkQueue(ABC):
+    """Interface implemented by every queue backend."""
+
+    @abstractmethod
+    def enqueue(self, job: Job) -> None:
+        """Add ``job`` to the queue."""
+
+    @abstractmethod
+    def receive(self, max_jobs: int) -> List[Tuple[Receipt, Job]]:
+        """Claim up to ``max_jobs`` jobs; unacked jobs are eventually redelivered."""
+
+    @abstractmethod
+    def ack(self, receipts: List[Receipt]) -> None:
+        """Remove successfully processed jobs from the queue."""
+
+
+class InMemoryWorkQueue(WorkQueue):
+    """Thread-safe FIFO held in process memory. Unacked jobs are lost on exit."""
+
+    def __init__(self) -> None:
+        self._jobs: deque = deque()
+        self._inflight: Dict[int, Job] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, job: Job) -> None:
+        with self._lock:
+            self._jobs.append(json.dumps(job))
+
+    def receive(self, max_jobs: int) -> List[Tuple[Receipt, Job]]:
+        claimed = []
+        with self._lock:
+            while self._jobs and len(claimed) < max_jobs:
+                self._next_id += 1
+                job = json.loads(self._jobs.popleft())
+                self._inflight[self._next_id] = job
+                claimed.append((self._next_id, job))
+        return claimed
+
+    def ack(self, receipts: List[Receipt]) -> None:
+        with self._lock:
+            for receipt in receipts:
+                self._inflight.pop(receipt, None)
+
+    def requeue_unacked(self) -> None:
+        """Return claimed-but-unacked jobs to the queue (simulates redelivery)."""
+        with self._lock:
+            for receipt in sorted(self._inflight):
+                self._jobs.append(json.dumps(self._inflight[receipt]))
+            self._inflight.clear()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """Durable queue in a local SQLite file with visibility-timeout redelivery."""
+
+    def __init__(self, path: str, visibility_timeout: float = VISIBILITY_TIMEOUT) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " body TEXT NOT NULL,"
+            " claimed_at REAL)"
+        )
+
+    def enqueue(self, job: Job) -> None:
+        with self._lock:
+            self._conn.execute("INSERT INTO jobs (body) VALUES (?)", (json.dumps(job),))
+
+    def receive(self, max_jobs: int) -> List[Tuple[Receipt, Job]]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, body FROM jobs WHERE claimed_at IS NULL OR claimed_at < ?"
+                " ORDER BY id LIMIT ?",
+                (now - self._visibility_timeout, max_jobs),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE jobs SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows]
+            )
+            self._conn.execute("COMMIT")
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def ack(self, receipts: List[Receipt]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(r,) for r in receipts])
+
+    def requeue_unacked(self) -> None:
+        """Make claimed-but-unacked jobs visible again without waiting."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET claimed_at = NULL")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+class SQSWorkQueue(WorkQueue):
+    """Amazon SQS standard queue. In Lambda the event source mapping receives
+    and deletes messages; receive/ack are used when draining manually."""
+
+    def __init__(self, queue_url: str, sqs_client=None) -> None:
+        self.queue_url = queue_url
+        self._sqs = sqs_client or get_client("sqs")
+
+    def enqueue(self, job: Job) -> None:
+        self._sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job))
+
+    def receive(self, max_jobs: int) -> List[Tuple[Receipt, Job]]:
+        response = self._sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max(1, min(SQS_MAX_BATCH, max_jobs)),
+            WaitTimeSeconds=0,
+        )
+        return [
+            (msg["ReceiptHandle"], json.loads(msg["Body"]))
+            for msg in response.get("Messages", [])
+        ]
+
+    def ack(self, receipts: List[Receipt]) -> None:
+        for start in range(0, len(receipts), SQS_MAX_BATCH):
+            chunk = receipts[start:start + SQS_MAX_BATCH]
+            self._sqs.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": r} for i, r in enumerate(chunk)],
+            )
+
+
+# ---------------------------------------------------------------------------
+# Draining
+# ---------------------------------------------------------------------------
+
+def drain(
+    queue: WorkQueue,
+    process: Callable[[Job], None],
+    max_jobs: int = 100,
+    batch_size: int = SQS_MAX_BATCH,
+) -> Dict[str, int]:
+    """Process up to ``max_jobs`` jobs in batches, acking only the ones that succeed.
+
+    Failed jobs stay unacked so the backend redelivers them later.
+    """
+    processed = failed = 0
+    while processed + failed < max_jobs:
+        batch = queue.receive(min(batch_size, max_jobs - processed - failed))
+        if not batch:
+            break
+        done = []
+        for receipt, job in batch:
+            try:
+                process(job)
+                done.append(receipt)
+            except Exception as exc:
+                failed += 1
+                logger.error(json.dumps({
+                    "event": "work_job_error", "type": job.get("type"), "error": str(exc),
+                }))
+        if done:
+            queue.ack(done)
+        processed += len(done)
+    return {"processed": processed, "failed": failed}
+
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+_queue: Optional[WorkQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_work_queue() -> Optional[WorkQueue]:
+    """Return the process-wide queue selected by WORK_QUEUE_BACKEND, or None.
+
+    ``sqs`` needs WORK_QUEUE_URL, ``sqlite`` uses WORK_QUEUE_PATH
+    (default work_queue.db), ``memory`` needs nothing. Unset disables
+    deferral so side effects run inline.
+    """
+    global _queue
+    backend = os.getenv("WORK_QUEUE_BACKEND", "").lower()
+    if not backend:
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = _build_queue(backend)
+    return _queue
+
+
+def reset_work_queue() -> None:
+    """Forget the configured queue (used by tests)."""
+    global _queue
+    with _queue_lock:
+        _queue = None
+
+
+def _build_queue(backend: str) -> Optional[WorkQueue]:
+    if backend == "sqs":
+        url = os.getenv("WORK_QUEUE_URL")
+        if url:
+            return SQSWorkQueue(url)
+        logger.warning(json.dumps({"event": "work_queue_missing_url"}))
+        return None
+    if backend == "sqlite":
+        return SQLiteWorkQueue(os.getenv("WORK_QUEUE_PATH", "work_queue.db"))
+    if backend == "memory":
+        return InMemoryWorkQueue()
+    logger.warning(json.dumps({"event": "unknown_work_queue_backend", "backend": backend}))
+    return None
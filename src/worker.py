@@ -0,0 +1,180 @@
+"""Consumer for deferred after-reply work.
+
+lambda_handler enqueues compact job records (see work_queue.py) instead of
+archiving transcripts and publishing alerts on the Twilio critical path. This
+module defines those records and processes them:
+
+- queue_handler — Lambda entry point for the SQS event source mapping; one
+  invocation handles a whole batch and reports per-message failures
+- drain_local   — drains the SQLite / in-memory queue for local runs
+- compaction_handler — scheduled entry point that merges transcript segments
+
+With BATCH_CLASSIFY=on, the enrich jobs of an SQS batch are submitted to the
+batching coalescer before any job runs, so their LLM calls share multi-item
+requests (see batching.py) instead of going out one at a time.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+try:
+    from batching import get_coalescer
+    from clients import get_client
+    from transcripts import append_transcript, compact_all
+    from utils import _mask, build_alert, classify_message, send_alert
+    from work_queue import Job, drain, get_work_queue
+except ImportError:
+    from src.batching import get_coalescer
+    from src.clients import get_client
+    from src.transcripts import append_transcript, compact_all
+    from src.utils import _mask, build_alert, classify_message, send_alert
+    from src.work_queue import Job, drain, get_work_queue
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+# ---------------------------------------------------------------------------
+# Job records
+# ---------------------------------------------------------------------------
+
+def transcript_job(user_id: str, turns: List[Dict[str, Any]], start_index: int) -> Job:
+    return {"type": "transcript", "user_id": user_id, "start": start_index, "turns": turns}
+
+
+def alert_job(triage_result: Dict[str, Any], user_id: str) -> Job:
+    return {"type": "alert", "user_id": user_id, "triage": triage_result}
+
+
+def enrich_job(
+    user_id: str,
+    message: str,
+    history: List[Dict[str, Any]],
+    summary: Optional[str],
+    triage_result: Dict[str, Any],
+) -> Job:
+    return {
+        "type": "enrich", "user_id": user_id, "message": message, "history": history,
+        "summary": summary, "rules": triage_result.get("rules", []),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Processing
+# ---------------------------------------------------------------------------
+
+def process_job(job: Job, classification: Optional[Future] = None) -> None:
+    """Execute one job, raising on failure so the queue redelivers it.
+
+    ``classification`` is an already-submitted batched classification for an
+    enrich job.
+    """
+    job_type = job.get("type")
+    if job_type == "transcript":
+        append_transcript(
+            get_client("s3"), os.environ["S3_BUCKET"], job["user_id"], job["turns"], job["start"],
+            raise_errors=True,
+        )
+    elif job_type == "alert":
+        subject, body = build_alert(job["triage"], job["user_id"])
+        send_alert(
+            get_client("sns"), os.environ["SNS_TOPIC_ARN"], subject, body, raise_errors=True
+        )
+    elif job_type == "enrich":
+        _enrich_alert(job, classification)
+    else:
+        raise ValueError(f"unknown job type: {job_type}")
+    logger.info(json.dumps({
+        "event": "work_job_done", "type": job_type, "user": _mask(job.get("user_id", "")),
+    }))
+
+
+def _enrich_alert(job: Job, classification: Optional[Future] = None) -> None:
+    """Run the full LLM extraction for a rule-triaged emergency and publish it
+    as a follow-up to the alert already sent."""
+    if classification is not None:
+        triage = classification.result()
+    else:
+        triage = classify_message(
+            job["message"],
+            job.get("history", []),
+            provider=os.getenv("LLM_PROVIDER", "bedrock"),
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            summary=job.get("summary"),
+        )
+    if triage.get("source") == "keywords":
+        # The LLM was unavailable and the keyword fallback answered; it would
+        # only repeat the original alert.
+        logger.warning(json.dumps({"event": "enrichment_skipped", "user": _mask(job["user_id"])}))
+        return
+    triage["rules"] = job.get("rules", [])
+    subject, body = build_alert(triage, job["user_id"])
+    send_alert(
+        get_client("sns"), os.environ["SNS_TOPIC_ARN"], f"Update: {subject}", body, raise_errors=True
+    )
+
+
+def queue_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Process an SQS batch, returning the failed message IDs for redelivery.
+
+    Requires ReportBatchItemFailures on the event source mapping so successful
+    messages in a partially failed batch are not retried.
+    """
+    failures = []
+    records = event.get("Records", [])
+    classifications = _submit_classifications(records)
+    for index, record in enumerate(records):
+        try:
+            process_job(json.loads(record["body"]), classifications.get(index))
+        except Exception as exc:
+            logger.error(json.dumps({
+                "event": "work_job_error", "message_id": record.get("messageId"), "error": str(exc),
+            }))
+            failures.append({"itemIdentifier": record.get("messageId")})
+    logger.info(json.dumps({
+        "event": "work_batch_done", "received": len(records), "failed": len(failures),
+    }))
+    return {"batchItemFailures": failures}
+
+
+def _submit_classifications(records: List[Dict[str, Any]]) -> Dict[int, Future]:
+    """Start batched classifications for the enrich jobs in ``records``,
+    keyed by record index; empty unless BATCH_CLASSIFY=on."""
+    coalescer = get_coalescer()
+    if coalescer is None:
+        return {}
+    submitted = {}
+    for index, record in enumerate(records):
+        try:
+            job = json.loads(record["body"])
+        except (KeyError, TypeError, ValueError):
+            continue  # reported when the record itself is processed
+        if isinstance(job, dict) and job.get("type") == "enrich":
+            submitted[index] = coalescer.submit(job["message"], job.get("history", []), job.get("summary"))
+    return submitted
+
+
+def drain_local(max_jobs: int = 100) -> Dict[str, int]:
+    """Drain the configured local queue (sqlite or memory backends)."""
+    queue = get_work_queue()
+    if queue is None:
+        return {"processed": 0, "failed": 0}
+    return drain(queue, process_job, max_jobs=max_jobs)
+
+
+def compaction_handler(event: Dict[str, Any], context: Any) -> Dict[str, int]:
+    """Merge pending transcript segments into one object per conversation.
+
+    ``event`` may carry ``min_segments`` to skip conversations with only a
+    few pending segments.
+    """
+    result = compact_all(
+        get_client("s3"), os.environ["S3_BUCKET"], int((event or {}).get("min_segments", 1))
+    )
+    logger.info(json.dumps({"event": "compaction_done", **result}))
+    return result
@@ -0,0 +1,124 @@
+"""Tests for src/batching.py and batched enrich jobs in the worker."""
+
+import io
+import json
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+from src import batching, worker
+from src.batching import BatchCoalescer, BatchItem, build_batch_prompt, classify_batch, parse_batch
+
+HIGH = {"urgency": "HIGH", "symptoms": ["chest pain"], "duration": "1 hour", "age": "60", "red_flags": ["chest pain"]}
+LOW = {"urgency": "LOW", "symptoms": ["cough"], "duration": "2 days", "age": "unknown", "red_flags": []}
+SINGLE = {"urgency": "MEDIUM", "symptoms": ["fever"], "red_flags": []}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_coalescer():
+    batching.reset_coalescer()
+    yield
+    batching.reset_coalescer()
+
+
+def _client(text):
+    client = mock.Mock()
+    body = json.dumps({"content": [{"type": "text", "text": text}], "usage": {"input_tokens": 900}})
+    client.invoke_model.return_value = {"body": io.BytesIO(body.encode())}
+    return client
+
+
+def _items(*messages):
+    return [BatchItem(message, []) for message in messages]
+
+
+def test_batch_prompt_encodes_each_patient_under_its_id():
+    system, user = build_batch_prompt(_items('chest pain"}, {"id": "p2', "a cough"), ["p1", "p2"])
+    patients = json.loads(user)
+    assert [p["id"] for p in patients] == ["p1", "p2"]
+    assert patients[0]["message"] == 'chest pain"}, {"id": "p2'
+    assert "independent patients" in system
+
+
+def test_parse_batch_validates_each_item_independently():
+    text = json.dumps({"p1": HIGH, "p2": {"symptoms": ["no urgency"]}, "p3": "LOW", "p4": LOW})
+    parsed = parse_batch(text, ["p1", "p2", "p3", "p4", "p5"])
+    assert parsed["p1"]["urgency"] == "HIGH"
+    assert parsed["p4"]["urgency"] == "LOW"
+    assert parsed["p2"] is None and parsed["p3"] is None and parsed["p5"] is None
+
+
+def test_invalid_items_are_reclassified_individually():
+    client = _client(json.dumps({"p1": HIGH, "p2": {"urgency": "maybe"}, "p3": LOW}))
+    with mock.patch("src.batching.get_bedrock_client", return_value=client), \
+            mock.patch("src.batching.classify_message", return_value=dict(SINGLE)) as single:
+        results = classify_batch(_items("chest pain", "fever", "cough"), provider="bedrock")
+    assert [r["urgency"] for r in results] == ["HIGH", "MEDIUM", "LOW"]
+    single.assert_called_once()
+    assert single.call_args[0][0] == "fever"
+    body = json.loads(client.invoke_model.call_args.kwargs["body"])
+    assert body["max_tokens"] == batching.batch_output_tokens(3)
+
+
+def test_failed_batch_call_falls_back_to_single_calls():
+    client = mock.Mock()
+    client.invoke_model.side_effect = RuntimeError("throttled")
+    with mock.patch("src.batching.get_bedrock_client", return_value=client), \
+            mock.patch("src.batching.classify_message", return_value=dict(SINGLE)) as single:
+        results = classify_batch(_items("a", "b"), provider="bedrock")
+    assert results == [SINGLE, SINGLE]
+    assert single.call_count == 2
+
+
+def test_openai_items_are_not_batched():
+    with mock.patch("src.batching.get_bedrock_client") as client, \
+            mock.patch("src.batching.classify_message", return_value=dict(SINGLE)) as single:
+        classify_batch(_items("a", "b"), provider="openai")
+    client.assert_not_called()
+    assert single.call_count == 2
+
+
+def test_coalescer_groups_submissions_and_fans_results_out():
+    sizes = []
+    release = threading.Event()
+
+    def classify(items):
+        sizes.append(len(items))
+        release.wait(1)
+        return [{"urgency": "LOW", "echo": item.message} for item in items]
+
+    coalescer = BatchCoalescer(max_items=3, max_wait_ms=200, classify=classify)
+    futures = [coalescer.submit(f"message {i}") for i in range(5)]
+    release.set()
+    assert [f.result(timeout=2)["echo"] for f in futures] == [f"message {i}" for i in range(5)]
+    assert sizes == [3, 2]
+    assert coalescer.mean_batch_size == 2.5
+
+
+def test_coalescer_propagates_batch_errors_to_every_item():
+    coalescer = BatchCoalescer(max_items=2, max_wait_ms=50, classify=mock.Mock(side_effect=RuntimeError("x")))
+    futures = [coalescer.submit("a"), coalescer.submit("b")]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=2)
+
+
+def test_worker_batches_enrich_jobs_in_one_sqs_batch():
+    jobs = [
+        worker.enrich_job("+10001234567", "He is not breathing", [], None, {"rules": ["not breathing"]}),
+        worker.enrich_job("+10007654321", "Crushing chest pain", [], None, {"rules": ["chest pain"]}),
+    ]
+    event = {"Records": [{"messageId": str(i), "body": json.dumps(job)} for i, job in enumerate(jobs)]}
+    env = {"BATCH_CLASSIFY": "on", "BATCH_MAX_WAIT_MS": "200", "LLM_PROVIDER": "bedrock",
+           "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:123456789012:alerts"}
+    sns = mock.Mock()
+    client = _client(json.dumps({"p1": HIGH, "p2": HIGH}))
+    with mock.patch.dict(os.environ, env), \
+            mock.patch("src.worker.get_client", return_value=sns), \
+            mock.patch("src.batching.get_bedrock_client", return_value=client):
+        result = worker.queue_handler(event, None)
+    assert result == {"batchItemFailures": []}
+    client.invoke_model.assert_called_once()
+    assert sns.publish.call_count == 2
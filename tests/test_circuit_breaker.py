@@ -0,0 +1,121 @@
+"""Tests for src/circuit_breaker.py and its use in classify_message."""
+
+import os
+import time
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from src import circuit_breaker
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, SharedBreakerState
+from src.clients import reset_clients
+from src.utils import classify_message
+
+FALLBACK = {"urgency": "LOW", "source": "keywords"}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def _fresh_breakers():
+    circuit_breaker.reset_circuit_breakers()
+    yield
+    circuit_breaker.reset_circuit_breakers()
+
+
+def _breaker(clock, **kwargs):
+    return CircuitBreaker("bedrock", min_calls=4, window=4, open_seconds=30, clock=clock, **kwargs)
+
+
+def test_opens_on_failure_rate_and_refuses_calls():
+    clock = _Clock()
+    breaker = _breaker(clock)
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success, 100)
+    assert breaker.state == CLOSED
+    breaker.record(False, 100)  # 2 of 4 failed
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_opens_on_slow_calls():
+    breaker = _breaker(_Clock(), slow_ms=1000, slow_rate=0.75)
+    for elapsed in (50, 2000, 2000, 2000):
+        breaker.record(True, elapsed)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_one_probe_through():
+    clock = _Clock()
+    breaker = _breaker(clock, failure_rate=0.25)
+    for _ in range(4):
+        breaker.record(False, 100)
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the probe is still in flight
+
+    breaker.record(False, 100)
+    assert breaker.state == OPEN and breaker.open_until == clock.now + 30
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True, 100)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_wrap_answers_from_fallback_while_open():
+    breaker = _breaker(_Clock(), failure_rate=0.25)
+    provider = mock.Mock(return_value=dict(FALLBACK))
+    guarded = breaker.wrap(provider, lambda: {"urgency": "HIGH", "source": "keywords"})
+    for _ in range(4):
+        guarded(None)
+    assert breaker.state == OPEN
+
+    assert guarded(None)["urgency"] == "HIGH"
+    assert provider.call_count == 4
+
+
+@mock_dynamodb
+def test_shared_state_trips_other_containers():
+    reset_clients()
+    boto3.resource("dynamodb", region_name="us-east-1").create_table(
+        TableName="triage",
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    clock = _Clock()
+    clock.now = time.time()
+    first = _breaker(clock, failure_rate=0.25, shared=SharedBreakerState("triage"))
+    second = _breaker(clock, shared=SharedBreakerState("triage"))
+    assert second.allow()
+
+    for _ in range(4):
+        first.record(False, 100)
+    assert second.allow()  # not re-read until the refresh interval has passed
+    second._next_shared_check = 0
+    assert not second.allow()
+    assert second.state == OPEN and second.open_until == pytest.approx(first.open_until, abs=0.01)
+    reset_clients()
+
+
+def test_classify_message_skips_an_open_provider():
+    env = {"CIRCUIT_BREAKER": "on", "CIRCUIT_BREAKER_MIN_CALLS": "3"}
+    with mock.patch.dict(os.environ, env), \
+            mock.patch("src.utils._classify_bedrock", return_value=dict(FALLBACK)) as bedrock:
+        for _ in range(5):
+            result = classify_message("chest pain", [], provider="bedrock")
+
+    assert bedrock.call_count == 3
+    assert result["urgency"] == "HIGH" and result["source"] == "keywords"
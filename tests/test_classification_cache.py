@@ -0,0 +1,141 @@
+"""Tests for src/classification_cache.py and its use in classify_message."""
+
+from unittest import mock
+
+import boto3
+from moto import mock_dynamodb
+
+from src.classification_cache import (
+    ClassificationCache,
+    DynamoDBCacheTier,
+    TTLCache,
+    cache_keys,
+    context_fingerprint,
+    normalise_message,
+)
+from src.utils import classify_message
+
+LOW = {"urgency": "LOW", "symptoms": ["headache"], "red_flags": []}
+HIGH = {"urgency": "HIGH", "symptoms": ["chest pain"], "red_flags": ["chest pain"]}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _keys(message="I have a headache", context="", user_id="+1"):
+    return cache_keys("bedrock", "model", message, context, user_id)
+
+
+def test_normalise_folds_case_punctuation_and_whitespace():
+    assert normalise_message("  I have a HEADACHE!! ") == normalise_message("i have a headache")
+    assert normalise_message("no chest pain") != normalise_message("chest pain")
+
+
+def test_keys_depend_on_context_and_user():
+    shared, scoped = _keys()
+    assert _keys("i have a headache.")[0] == shared
+    assert _keys(context="earlier: fever")[0] != shared
+    assert _keys(user_id="+2")[0] == shared
+    assert _keys(user_id="+2")[1] != scoped
+    assert _keys(user_id=None)[1] is None
+
+
+
+def test_context_fingerprint_ignores_timestamps():
+    def turns(timestamp, reply):
+        return [
+            {"timestamp": timestamp, "role": "patient", "message": "I have a cough"},
+            {"timestamp": timestamp, "role": "agent", "message": reply},
+        ]
+
+    assert context_fingerprint(turns("2024-01-01T09:00", "Rest.")) == context_fingerprint(
+        turns("2024-03-05T17:42", "rest")
+    )
+    assert context_fingerprint(turns("t", "Rest.")) != context_fingerprint(turns("t", "See a doctor."))
+
+def test_ttl_and_lru_eviction():
+    clock = _Clock()
+    cache = TTLCache(max_entries=2, ttl=10, clock=clock)
+    cache.put("a", LOW)
+    cache.put("b", LOW)
+    cache.get("a")
+    cache.put("c", LOW)  # evicts b, the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == LOW
+
+    clock.now = 11
+    assert cache.get("a") is None
+
+
+def test_high_results_are_scoped_to_the_user():
+    cache = ClassificationCache(TTLCache())
+    shared, alice = _keys(user_id="+1")
+    _, bob = _keys(user_id="+2")
+
+    cache.put(shared, alice, HIGH)
+    assert cache.get(shared, alice) == HIGH
+    assert cache.get(shared, bob) is None
+
+    cache.put(shared, None, HIGH)  # no user: never cached
+    assert cache.get(shared, None) is None
+
+
+def test_low_results_are_shared_and_fallback_results_skipped():
+    cache = ClassificationCache(TTLCache())
+    shared, alice = _keys(user_id="+1")
+    _, bob = _keys(user_id="+2")
+
+    cache.put(shared, alice, {**LOW, "source": "keywords"})
+    assert cache.get(shared, bob) is None
+    cache.put(shared, alice, LOW)
+    assert cache.get(shared, bob) == LOW
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+@mock_dynamodb
+def test_shared_tier_serves_other_containers():
+    table = boto3.resource("dynamodb", region_name="us-east-1").create_table(
+        TableName="triage",
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    shared, user = _keys()
+    ClassificationCache(TTLCache(), DynamoDBCacheTier(table)).put(shared, user, LOW)
+
+    other = ClassificationCache(TTLCache(), DynamoDBCacheTier(table))
+    assert other.get(shared, user) == LOW
+    assert other.stats()["shared_hits"] == 1
+
+    expired = DynamoDBCacheTier(table, ttl=-1)
+    expired.put("stale", LOW)
+    assert expired.get("stale") is None
+
+
+def test_classify_message_reuses_cached_result():
+    cache = ClassificationCache(TTLCache())
+    with mock.patch("src.utils._classify_bedrock", return_value=dict(LOW)) as bedrock:
+        first = classify_message("I have a headache", [], provider="bedrock", user_id="+1", cache=cache)
+        second = classify_message("i have a HEADACHE!", [], provider="bedrock", user_id="+2", cache=cache)
+        history = [{"role": "patient", "message": "I fell off a ladder", "timestamp": "t"}]
+        classify_message("I have a headache", history, provider="bedrock", user_id="+1", cache=cache)
+        later = [{**history[0], "timestamp": "t2"}]
+        classify_message("I have a headache", later, provider="bedrock", user_id="+2", cache=cache)
+
+    assert first == second == LOW
+    assert bedrock.call_count == 2  # the third call has a different context; the fourth reuses it
+
+
+def test_classify_message_uses_cache_when_out_of_time():
+    cache = ClassificationCache(TTLCache())
+    with mock.patch("src.utils._classify_bedrock", return_value=dict(LOW)):
+        classify_message("I have a headache", [], provider="bedrock", cache=cache)
+    assert classify_message("I have a headache", [], provider="bedrock", timeout=0, cache=cache) == LOW
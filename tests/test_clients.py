@@ -0,0 +1,163 @@
+"""Tests for src/clients.py — cached client registry."""
+
+import io
+import json
+import os
+import subprocess
+import sys
+from decimal import Decimal
+from unittest import mock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_dynamodb
+
+from src import clients
+from src.utils import classify_message
+
+
+@pytest.fixture(autouse=True)
+def _fresh_registry():
+    clients.reset_clients()
+    yield
+    clients.reset_clients()
+
+
+def test_bedrock_client_is_reused():
+    first = clients.get_bedrock_client(region_name="us-east-1")
+    second = clients.get_bedrock_client(region_name="us-east-1")
+    assert first is second
+
+
+def test_bedrock_client_keyed_by_region_and_config():
+    base = clients.get_bedrock_client(region_name="us-east-1")
+    assert clients.get_bedrock_client(region_name="eu-west-1") is not base
+    assert clients.get_bedrock_client(region_name="us-east-1", read_timeout=3) is not base
+
+
+def test_bedrock_client_config_from_env():
+    env = {
+        "BEDROCK_CONNECT_TIMEOUT": "1.5",
+        "BEDROCK_READ_TIMEOUT": "4",
+        "BEDROCK_MAX_ATTEMPTS": "5",
+        "BEDROCK_RETRY_MODE": "adaptive",
+    }
+    with mock.patch.dict("os.environ", env):
+        client = clients.get_bedrock_client(region_name="us-east-1")
+
+    config = client.meta.config
+    assert config.connect_timeout == 1.5
+    assert config.read_timeout == 4.0
+    assert config.retries == {"total_max_attempts": 5, "mode": "adaptive"}
+    assert config.tcp_keepalive is True
+
+
+def test_invalid_env_value_uses_default():
+    with mock.patch.dict("os.environ", {"BEDROCK_READ_TIMEOUT": "soon"}):
+        client = clients.get_bedrock_client(region_name="us-east-1")
+    assert client.meta.config.read_timeout == clients.BEDROCK_READ_TIMEOUT
+
+
+def test_reset_clients_drops_cache():
+    first = clients.get_bedrock_client(region_name="us-east-1")
+    clients.reset_clients()
+    assert clients.get_bedrock_client(region_name="us-east-1") is not first
+
+
+def test_classify_bedrock_uses_registry_client():
+    payload = {"content": [{"text": json.dumps({"urgency": "medium", "symptoms": ["fever"]})}]}
+    fake = mock.Mock()
+    fake.invoke_model.return_value = {"body": io.BytesIO(json.dumps(payload).encode())}
+
+    with mock.patch("src.utils.get_bedrock_client", return_value=fake) as factory:
+        result = classify_message("I have a fever", history=[], provider="bedrock")
+
+    factory.assert_called_once_with()
+    assert result["urgency"] == "MEDIUM"
+
+
+def test_openai_client_cached_per_key_with_shared_pool():
+    first = clients.get_openai_client("sk-one")
+    assert clients.get_openai_client("sk-one") is first
+
+    second = clients.get_openai_client("sk-two")
+    assert second is not first
+    assert first._client is second._client  # same underlying HTTP pool
+
+
+def test_classify_openai_passes_timeout_budget():
+    completion = mock.Mock()
+    completion.choices = [mock.Mock(message=mock.Mock(content='{"urgency": "low"}'))]
+    fake = mock.Mock()
+    fake.with_options.return_value = fake
+    fake.chat.completions.create.return_value = completion
+
+    with mock.patch("src.utils.get_openai_client", return_value=fake):
+        result = classify_message(
+            "mild cough", history=[], provider="openai", openai_api_key="sk-test", timeout=2.5
+        )
+
+    assert result["urgency"] == "LOW"
+    assert fake.chat.completions.create.call_args.kwargs["timeout"] == 2.5
+    fake.with_options.assert_called_once_with(max_retries=0)  # a retry would overrun the budget
+
+
+def test_classify_bedrock_makes_one_attempt_within_a_budget():
+    payload = {"content": [{"text": json.dumps({"urgency": "low"})}]}
+    fake = mock.Mock()
+    fake.invoke_model.return_value = {"body": io.BytesIO(json.dumps(payload).encode())}
+
+    with mock.patch("src.utils.get_bedrock_client", return_value=fake) as factory:
+        classify_message("mild cough", history=[], provider="bedrock", timeout=2.5)
+
+    factory.assert_called_once_with(read_timeout=3, max_attempts=1)
+
+
+@mock_dynamodb
+def test_dynamodb_table_matches_resource_semantics():
+    resource = boto3.resource("dynamodb", region_name="us-east-1")
+    resource.create_table(
+        TableName="t",
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table = clients.DynamoDBTable(clients.get_client("dynamodb", "us-east-1"), "t")
+
+    table.put_item(Item={"user_id": "u", "history": [{"role": "patient"}], "daily_count": 1})
+    response = table.update_item(
+        Key={"user_id": "u"},
+        UpdateExpression="ADD daily_count :one",
+        ConditionExpression="daily_count < :limit",
+        ExpressionAttributeValues={":one": 1, ":limit": 2},
+        ReturnValues="UPDATED_NEW",
+    )
+    assert response["Attributes"] == {"daily_count": Decimal(2)}
+
+    with pytest.raises(ClientError) as exc:
+        table.update_item(
+            Key={"user_id": "u"},
+            UpdateExpression="ADD daily_count :one",
+            ConditionExpression="daily_count < :limit",
+            ExpressionAttributeValues={":one": 1, ":limit": 2},
+        )
+    assert exc.value.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+    item = table.get_item(Key={"user_id": "u"}, ProjectionExpression="history").get("Item")
+    assert item == {"history": [{"role": "patient"}]}
+    assert resource.Table("t").get_item(Key={"user_id": "u"})["Item"]["daily_count"] == 2
+    assert "Item" not in table.get_item(Key={"user_id": "missing"})
+
+
+def test_handler_import_defers_clients_and_optional_packages():
+    code = (
+        "import sys; from src import lambda_function; "
+        "print(sorted(m for m in ('openai', 'twilio') if m in sys.modules)); "
+        "print(lambda_function.table, lambda_function.s3_client, lambda_function.sns_client)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout.splitlines()
+    assert out == ["[]", "None None None"]
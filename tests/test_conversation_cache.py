@@ -0,0 +1,92 @@
+"""Tests for src/conversation_cache.py."""
+
+import os
+from decimal import Decimal
+from unittest import mock
+
+from src.conversation_cache import (
+    ConversationCache,
+    get_conversation_cache,
+    reset_conversation_cache,
+)
+
+
+def _item(user_id, message="hi"):
+    return {"user_id": user_id, "history": [{"role": "patient", "message": message}],
+            "version": Decimal(1)}
+
+
+def test_get_returns_independent_copies():
+    cache = ConversationCache()
+    cache.put("+1", _item("+1"))
+
+    first = cache.get("+1")
+    first["history"].append({"role": "agent", "message": "mutated"})
+
+    assert len(cache.get("+1")["history"]) == 1
+    assert cache.get("+1")["version"] == 1
+
+
+def test_hit_and_miss_counters():
+    cache = ConversationCache()
+    assert cache.get("+1") is None
+    cache.put("+1", _item("+1"))
+    cache.get("+1")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["bytes"] > 0
+
+
+def test_evicts_least_recently_used_by_entries():
+    cache = ConversationCache(max_entries=2)
+    cache.put("+1", _item("+1"))
+    cache.put("+2", _item("+2"))
+    cache.get("+1")  # +2 is now the oldest
+    cache.put("+3", _item("+3"))
+
+    assert cache.get("+2") is None
+    assert cache.get("+1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_by_bytes():
+    small = ConversationCache()
+    small.put("+1", _item("+1", "x" * 100))
+    budget = small.stats()["bytes"] * 2
+
+    cache = ConversationCache(max_bytes=budget)
+    for user in ("+1", "+2", "+3"):
+        cache.put(user, _item(user, "x" * 100))
+
+    assert len(cache) == 2
+    assert cache.stats()["bytes"] <= budget
+    assert cache.get("+1") is None
+
+
+def test_oversized_item_is_not_cached():
+    cache = ConversationCache(max_bytes=50)
+    cache.put("+1", _item("+1", "x" * 500))
+    assert len(cache) == 0
+
+
+def test_invalidate_and_replace_keep_byte_count():
+    cache = ConversationCache()
+    cache.put("+1", _item("+1"))
+    cache.put("+1", _item("+1", "longer message"))
+    assert len(cache) == 1
+    cache.invalidate("+1")
+    assert cache.stats()["bytes"] == 0
+
+
+def test_env_disables_cache():
+    reset_conversation_cache()
+    with mock.patch.dict(os.environ, {"CONVERSATION_CACHE_ENTRIES": "0"}):
+        assert get_conversation_cache() is None
+    with mock.patch.dict(os.environ, {"CONVERSATION_CACHE_ENTRIES": "8"}):
+        cache = get_conversation_cache()
+        assert cache.max_entries == 8
+        assert get_conversation_cache() is cache
+    reset_conversation_cache()
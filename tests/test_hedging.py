@@ -0,0 +1,102 @@
+"""Tests for src/hedging.py and hedged classify_message calls."""
+
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from src import hedging
+from src.hedging import Hedger, LatencyTracker, estimate_cost
+from src.utils import classify_message
+
+LOW = {"urgency": "LOW", "symptoms": ["headache"]}
+MEDIUM = {"urgency": "MEDIUM", "symptoms": ["fever"]}
+FALLBACK = {"urgency": "LOW", "source": "keywords"}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_hedger():
+    hedging.reset_hedger()
+    yield
+    hedging.reset_hedger()
+
+
+def _after(seconds, result):
+    def call(timeout):
+        time.sleep(seconds)
+        return dict(result)
+    return call
+
+
+def test_deadline_uses_default_until_enough_samples():
+    hedger = Hedger(percentile=90, default_deadline_ms=800)
+    tracker = hedger._tracker("bedrock")
+    for ms in range(1, hedging.MIN_SAMPLES):
+        tracker.record(ms * 100)
+    assert hedger.deadline_ms("bedrock") == 800
+    tracker.record(hedging.MIN_SAMPLES * 100)
+    assert hedger.deadline_ms("bedrock") == 1800
+
+
+def test_percentile_is_nearest_rank_over_the_window():
+    tracker = LatencyTracker(window=hedging.MIN_SAMPLES)
+    for ms in range(1000):
+        tracker.record(float(ms))
+    assert tracker.percentile(50) == 989.0  # only the last MIN_SAMPLES remain
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = Hedger(default_deadline_ms=500)
+    secondary = mock.Mock(return_value=MEDIUM)
+    result, winner = hedger.run("bedrock", _after(0, LOW), "openai", secondary)
+    assert (result, winner) == (LOW, "bedrock")
+    secondary.assert_not_called()
+    assert hedger.stats.hedged == 0
+
+
+def test_slow_primary_loses_to_the_hedge():
+    hedger = Hedger(default_deadline_ms=20)
+    start = time.perf_counter()
+    result, winner = hedger.run("bedrock", _after(0.5, LOW), "openai", _after(0, MEDIUM), input_tokens=500)
+    assert (result, winner) == (MEDIUM, "openai")
+    assert time.perf_counter() - start < 0.4
+    assert hedger.stats.hedge_wins == 1
+    assert hedger.stats.extra_cost_usd == pytest.approx(estimate_cost("openai", 500))
+
+
+def test_failed_primary_hedges_immediately_and_fallbacks_never_win():
+    hedger = Hedger(default_deadline_ms=5000)
+    result, winner = hedger.run("bedrock", _after(0, FALLBACK), "openai", _after(0.01, MEDIUM))
+    assert winner == "openai"
+
+    result, winner = hedger.run("bedrock", _after(0, FALLBACK), "openai", _after(0, FALLBACK))
+    assert (result, winner) == (None, None)
+    assert hedger.stats.failures == 1
+
+
+def test_race_respects_the_time_budget():
+    hedger = Hedger(default_deadline_ms=10)
+    start = time.perf_counter()
+    result, _ = hedger.run("bedrock", _after(0.5, LOW), "openai", _after(0.5, MEDIUM), timeout=0.1)
+    assert result is None
+    assert time.perf_counter() - start < 0.3
+
+
+def test_classify_message_hedges_when_enabled():
+    env = {"LLM_HEDGE": "on", "LLM_HEDGE_DEADLINE_MS": "20"}
+    with mock.patch.dict(os.environ, env), \
+            mock.patch("src.utils._classify_bedrock", side_effect=lambda *a: _after(0.5, LOW)(None)), \
+            mock.patch("src.utils._classify_openai", return_value=dict(MEDIUM)) as openai:
+        result = classify_message("I have a fever", [], provider="bedrock")
+    assert result == MEDIUM
+    openai.assert_called_once()
+
+
+def test_classify_message_falls_back_when_both_providers_fail():
+    with mock.patch.dict(os.environ, {"LLM_HEDGE": "on"}), \
+            mock.patch("src.utils._classify_bedrock", return_value=dict(FALLBACK)), \
+            mock.patch("src.utils._classify_openai", return_value=dict(FALLBACK)):
+        result = classify_message("chest pain", [], provider="bedrock")
+    assert result["source"] == "keywords"
+    assert result["urgency"] == "HIGH"
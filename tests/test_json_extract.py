@@ -0,0 +1,91 @@
+"""Tests for src/json_extract.py and the fuzzed model-output corpus."""
+
+import json
+import os
+
+import pytest
+
+from src.json_extract import coerce_triage, extract_object
+from src.utils import parse_completion
+
+# Generated by: python benchmarks/bench_json_extract.py --write-corpus <path> 200
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "llm_outputs.jsonl")
+
+
+def _corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def _legacy_parse(text):
+    text = text.strip()
+    if "```" in text:
+        text = text.split("```")[1].lstrip("json").strip()
+    return json.loads(text)
+
+
+def test_preamble_fence_and_commentary():
+    text = 'Sure! Here you go:\n```json\n{"urgency": "low", "note": "a } in a string"}\n```\nStay safe.'
+    obj, repairs = extract_object(text)
+    assert obj == {"urgency": "low", "note": "a } in a string"}
+    assert repairs == ["preamble", "trailing_text"]
+
+
+def test_trailing_commas_and_raw_newlines():
+    obj, repairs = extract_object('{"urgency": "HIGH", "duration": "since\nnoon", "symptoms": ["a", "b",],}')
+    assert obj == {"urgency": "HIGH", "duration": "since\nnoon", "symptoms": ["a", "b"]}
+    assert set(repairs) == {"control_char", "trailing_comma"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"urgency": "HIGH", "symptoms": ["chest pa', {"urgency": "HIGH", "symptoms": ["chest pa"]}),
+    ('{"urgency": "HIGH", "symptoms": ["chest pain"], "dura', {"urgency": "HIGH", "symptoms": ["chest pain"]}),
+    ('{"urgency": "MEDIUM", "age": ', {"urgency": "MEDIUM"}),
+    ('{"urgency": "LOW", "duration": "2 days\\', {"urgency": "LOW", "duration": "2 days"}),
+])
+def test_truncated_objects_are_closed(text, expected):
+    obj, repairs = extract_object(text)
+    assert obj == expected
+    assert "truncated" in repairs
+
+
+def test_unrecoverable_output_raises():
+    for text in ("I cannot help with that.", '{"urgency": "HI', "[1, 2]"):
+        with pytest.raises(ValueError):
+            parse_completion(text)
+
+
+def test_coerce_triage_fills_and_normalises_fields():
+    result = coerce_triage({"urgency": " high urgency ", "symptoms": "fever", "age": 34, "extra": 1})
+    assert result == {
+        "urgency": "HIGH", "symptoms": ["fever"], "red_flags": [], "duration": "unknown", "age": "34",
+    }
+    with pytest.raises(ValueError):
+        coerce_triage({"symptoms": ["fever"]})
+
+
+@pytest.mark.parametrize("urgency,expected", [
+    ("low", "LOW"),
+    ("LOW|MEDIUM|HIGH", "HIGH"),  # schema echoed back
+    ("not HIGH, LOW", "HIGH"),
+    ("medium (could be low)", "MEDIUM"),
+])
+def test_coerce_triage_prefers_exact_then_most_severe_urgency(urgency, expected):
+    assert coerce_triage({"urgency": urgency})["urgency"] == expected
+
+
+def test_fuzzed_corpus_failure_rate_drops():
+    corpus = [case for case in _corpus() if case["urgency"] is not None]
+    legacy_failures = tolerant_failures = 0
+    for case in corpus:
+        try:
+            legacy_failures += _legacy_parse(case["text"]).get("urgency", "LOW").upper() != case["urgency"]
+        except ValueError:
+            legacy_failures += 1
+        try:
+            tolerant_failures += parse_completion(case["text"])["urgency"] != case["urgency"]
+        except ValueError:
+            tolerant_failures += 1
+
+    assert legacy_failures / len(corpus) > 0.5
+    assert tolerant_failures == 0
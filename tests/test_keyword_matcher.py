@@ -0,0 +1,63 @@
+"""Tests for src/keyword_matcher.py."""
+
+import random
+
+from src.keyword_matcher import DEFAULT_MATCHER, KeywordMatcher, Match
+
+
+def _brute_force(entries, text):
+    text = text.lower()
+    found = []
+    for phrase, severity in entries:
+        start = text.find(phrase)
+        while start != -1:
+            found.append(Match(phrase, severity, start, start + len(phrase)))
+            start = text.find(phrase, start + 1)
+    return sorted(found, key=lambda m: (m.end, -len(m.phrase)))
+
+
+def test_classic_overlapping_patterns():
+    matcher = KeywordMatcher([("he", "MEDIUM"), ("she", "MEDIUM"), ("his", "MEDIUM"), ("hers", "HIGH")])
+    found = {(m.phrase, m.start, m.end) for m in matcher.find_all("ushers", whole_words=False)}
+    assert found == {("she", 1, 4), ("he", 2, 4), ("hers", 2, 6)}
+
+
+def test_case_insensitive_spans():
+    matcher = KeywordMatcher([("chest pain", "HIGH")])
+    text = "Sudden CHEST PAIN now"
+    [match] = matcher.find_all(text)
+    assert text[match.start:match.end].lower() == "chest pain"
+    assert match.severity == "HIGH"
+
+
+def test_whole_words_rejects_matches_inside_tokens():
+    matcher = KeywordMatcher([("vomit", "MEDIUM"), ("chest pain", "HIGH")])
+    assert matcher.find_all("the vomitorium, chest painting") == []
+    assert [m.phrase for m in matcher.find_all("vomit, then chest pain.")] == ["vomit", "chest pain"]
+    assert len(matcher.find_all("vomitorium", whole_words=False)) == 1
+
+
+def test_duplicate_phrase_keeps_highest_severity():
+    matcher = KeywordMatcher([("overdose", "MEDIUM"), ("Overdose ", "HIGH")])
+    assert [m.severity for m in matcher.find_all("possible overdose")] == ["HIGH"]
+    assert matcher.size == 1
+
+
+def test_matches_brute_force_on_random_text():
+    rng = random.Random(7)
+    alphabet = "abc "
+    entries = [("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))).strip() or "a", "MEDIUM")
+               for _ in range(30)]
+    entries = list(dict(entries).items())
+    matcher = KeywordMatcher(entries)
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet + "xyz") for _ in range(rng.randint(0, 40)))
+        expected = _brute_force(entries, text)
+        actual = sorted(matcher.find_all(text, whole_words=False), key=lambda m: (m.end, -len(m.phrase)))
+        assert actual == expected, text
+
+
+def test_default_lexicon_is_multilingual():
+    phrases = {m.phrase for m in DEFAULT_MATCHER.find_all("dolor de pecho, douleur thoracique, dor no peito")}
+    assert phrases == {"dolor de pecho", "douleur thoracique", "dor no peito"}
+    assert DEFAULT_MATCHER.size > 50
@@ -1,6 +1,7 @@
 """Integration tests for src/lambda_function.py."""
 
 import importlib
+import json
 import os
 from unittest import mock
 
@@ -23,6 +24,17 @@ VALID_ENV = {
 }
 
 
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    """Each test recreates the mocked table, so warm caches would be stale."""
+    from src import classification_cache, conversation_cache
+    conversation_cache.reset_conversation_cache()
+    classification_cache.reset_classification_cache()
+    yield
+    conversation_cache.reset_conversation_cache()
+    classification_cache.reset_classification_cache()
+
+
 def _make_event(body: str, signature: str = "dummy") -> dict:
     return {
         "body": body,
@@ -114,6 +126,162 @@ def test_high_urgency_triggers_sns():
     assert "emergency" in body_lower or "ambulance" in body_lower or "911" in body_lower
 
 
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_concurrent_side_effects_store_alert_and_archive():
+    """SIDE_EFFECTS_MODE=concurrent still alerts, persists state and archives."""
+    _setup_aws()
+    body = "From=%2B1234567890&Body=Chest+pain+and+shortness+of+breath"
+    env = {**VALID_ENV, "SIDE_EFFECTS_MODE": "concurrent"}
+
+    with mock.patch.dict(os.environ, env):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True), \
+                mock.patch("src.lambda_function.send_alert") as alert:
+            response = lambda_function.lambda_handler(_make_event(body), None)
+
+    assert response["statusCode"] == 200
+    alert.assert_called_once()
+    item = boto3.resource("dynamodb", region_name=REGION).Table("test-table").get_item(
+        Key={"user_id": "+1234567890"}
+    )["Item"]
+    assert item["triage_level"] == "HIGH"
+    objects = boto3.client("s3", region_name=REGION).list_objects_v2(Bucket="test-bucket")
+    assert objects["KeyCount"] == 1
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_queued_side_effects_defer_alert_and_transcript():
+    """With a work queue configured, alert and transcript become queued jobs."""
+    from src import work_queue
+    _setup_aws()
+    body = "From=%2B1234567890&Body=Chest+pain+and+shortness+of+breath"
+    env = {**VALID_ENV, "WORK_QUEUE_BACKEND": "memory"}
+    work_queue.reset_work_queue()
+
+    with mock.patch.dict(os.environ, env):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True), \
+                mock.patch("src.lambda_function.send_alert") as alert:
+            response = lambda_function.lambda_handler(_make_event(body), None)
+        queue = work_queue.get_work_queue()
+        jobs = [job for _, job in queue.receive(10)]
+
+    work_queue.reset_work_queue()
+    assert response["statusCode"] == 200
+    alert.assert_not_called()
+    assert sorted(job["type"] for job in jobs) == ["alert", "transcript"]
+    objects = boto3.client("s3", region_name=REGION).list_objects_v2(Bucket="test-bucket")
+    assert objects["KeyCount"] == 0
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_history_is_capped_at_window():
+    """Stored history stays within HISTORY_WINDOW; older turns feed the summary."""
+    _setup_aws()
+    from datetime import datetime, timezone
+    table = boto3.resource("dynamodb", region_name=REGION).Table("test-table")
+    table.put_item(Item={
+        "user_id": "+1234567890",
+        "history": [
+            {"timestamp": "2024-01-01T00:00:00", "role": "patient", "message": "old cough"},
+            {"timestamp": "2024-01-01T00:00:01", "role": "agent", "message": "rest"},
+        ],
+        "daily_count": 0,
+        "count_date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+    })
+    body = "From=%2B1234567890&Body=Still+coughing"
+
+    with mock.patch.dict(os.environ, {**VALID_ENV, "HISTORY_WINDOW": "2", "HISTORY_TRIM_BATCH": "0"}):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True):
+            lambda_function.lambda_handler(_make_event(body), None)
+
+    item = table.get_item(Key={"user_id": "+1234567890"})["Item"]
+    assert [t["message"] for t in item["history"]][0] == "Still coughing"
+    assert item["history_offset"] == 2
+    assert "old cough" in item["summary"]
+    keys = [o["Key"] for o in boto3.client("s3", region_name=REGION).list_objects_v2(
+        Bucket="test-bucket")["Contents"]]
+    assert keys[0].endswith("/segments/0000000002.jsonl")
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_rule_emergency_skips_llm_and_alerts_inline():
+    """An unambiguous emergency is answered without the LLM and pages staff inline."""
+    from src import work_queue
+    _setup_aws()
+    body = "From=%2B1234567890&Body=My+husband+is+not+breathing"
+    work_queue.reset_work_queue()
+
+    with mock.patch.dict(os.environ, {**VALID_ENV, "WORK_QUEUE_BACKEND": "memory", "PRE_TRIAGE": "on"}):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True), \
+                mock.patch("src.lambda_function.classify_message") as classify, \
+                mock.patch("src.lambda_function.send_alert") as alert:
+            response = lambda_function.lambda_handler(_make_event(body), None)
+        jobs = [job for _, job in work_queue.get_work_queue().receive(10)]
+
+    work_queue.reset_work_queue()
+    assert "emergency" in response["body"].lower() or "911" in response["body"]
+    classify.assert_not_called()
+    alert.assert_called_once()
+    assert sorted(job["type"] for job in jobs) == ["enrich", "transcript"]
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_streaming_reply_from_urgency_and_alert_from_full_result():
+    """BEDROCK_STREAMING picks the reply from urgency; the alert gets every field."""
+    import json
+    _setup_aws()
+    body = "From=%2B1234567890&Body=Crushing+pressure+in+my+chest"
+    text = '{"urgency": "HIGH", "symptoms": ["chest pressure"], "duration": "20 minutes", ' \
+        '"age": "unknown", "red_flags": ["crushing chest pressure"]}'
+    events = [
+        {"chunk": {"bytes": json.dumps({
+            "type": "content_block_delta", "delta": {"type": "text_delta", "text": text[i:i + 8]},
+        }).encode()}}
+        for i in range(0, len(text), 8)
+    ]
+    client = mock.Mock()
+    client.invoke_model_with_response_stream.return_value = {"body": events}
+    env = {**VALID_ENV, "LLM_PROVIDER": "bedrock", "BEDROCK_STREAMING": "on"}
+
+    with mock.patch.dict(os.environ, env):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True), \
+                mock.patch("src.streaming.get_bedrock_client", return_value=client), \
+                mock.patch("src.lambda_function.send_alert") as alert:
+            response = lambda_function.lambda_handler(_make_event(body), None)
+
+    assert "emergency" in response["body"].lower()
+    alert.assert_called_once()
+    assert "crushing chest pressure" in alert.call_args.args[3]
+    item = boto3.resource("dynamodb", region_name=REGION).Table("test-table").get_item(
+        Key={"user_id": "+1234567890"}
+    )["Item"]
+    assert item["triage_level"] == "HIGH"
+
+
 @mock_dynamodb
 @mock_s3
 @mock_sns
@@ -206,6 +374,125 @@ def test_rate_limited_user_receives_friendly_message():
     assert "too many" in response["body"].lower() or "tomorrow" in response["body"].lower()
 
 
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_item_rate_limit_gate_reads_only_projected_counters():
+    """With RATE_LIMIT_BACKEND=item a limited request never fetches the history."""
+    _setup_aws()
+    from datetime import datetime, timezone
+    table = boto3.resource("dynamodb", region_name=REGION).Table("test-table")
+    table.put_item(Item={
+        "user_id": "+19995551234",
+        "history": [{"timestamp": "x", "role": "patient", "message": "hi"}],
+        "daily_count": 50,
+        "count_date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+    })
+    body = "From=%2B19995551234&Body=Another+message"
+    env = {**VALID_ENV, "RATE_LIMIT_BACKEND": "item", "CONSISTENT_READ_GATE": "true"}
+
+    with mock.patch.dict(os.environ, env):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True), \
+                mock.patch.object(lambda_function.get_table(), "get_item",
+                                  wraps=lambda_function.get_table().get_item) as get_item:
+            response = lambda_function.lambda_handler(_make_event(body), None)
+
+    assert "too many" in response["body"].lower()
+    get_item.assert_called_once()
+    request = get_item.call_args.kwargs
+    assert set(request["ExpressionAttributeNames"].values()) == {"daily_count", "count_date", "version"}
+    assert request["ConsistentRead"] is True
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_daily_count_is_kept_by_the_atomic_limiter():
+    """Successive messages increment daily_count server-side and keep history."""
+    _setup_aws()
+    body = "From=%2B1234567890&Body=Mild+cough"
+
+    with mock.patch.dict(os.environ, VALID_ENV):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True):
+            for _ in range(3):
+                lambda_function.lambda_handler(_make_event(body), None)
+
+    item = boto3.resource("dynamodb", region_name=REGION).Table("test-table").get_item(
+        Key={"user_id": "+1234567890"}
+    )["Item"]
+    assert item["daily_count"] == 3
+    assert len(item["history"]) == 6
+    assert item["created_at"]
+    assert item["version"] == 3
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_stale_cache_is_refreshed_on_version_conflict():
+    """Another container's write is kept when this container's cache is stale."""
+    from src import conversation_cache
+    _setup_aws()
+    body = "From=%2B1234567890&Body=Mild+cough"
+    table = boto3.resource("dynamodb", region_name=REGION).Table("test-table")
+
+    with mock.patch.dict(os.environ, VALID_ENV):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True):
+            lambda_function.lambda_handler(_make_event(body), None)
+            # Simulate a message handled by a different container
+            table.update_item(
+                Key={"user_id": "+1234567890"},
+                UpdateExpression="SET history = list_append(history, :t), version = :v",
+                ExpressionAttributeValues={
+                    ":t": [{"timestamp": "x", "role": "patient", "message": "elsewhere"}],
+                    ":v": 2,
+                },
+            )
+            lambda_function.lambda_handler(_make_event(body), None)
+        stats = conversation_cache.get_conversation_cache().stats()
+
+    item = table.get_item(Key={"user_id": "+1234567890"})["Item"]
+    assert stats["hits"] == 1
+    assert [t["message"] for t in item["history"]].count("elsewhere") == 1
+    assert len(item["history"]) == 5
+    assert item["version"] == 3
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_transcript_survives_a_stale_cached_conversation():
+    """Container A (warm), then B (cold), then A again: no archived turn is lost."""
+    from src.transcripts import iter_transcript
+    _setup_aws()
+    s3 = boto3.client("s3", region_name=REGION)
+
+    def send(text, env):
+        with mock.patch.dict(os.environ, env):
+            with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True):
+                lambda_function.lambda_handler(_make_event(f"From=%2B1234567890&Body={text}"), None)
+
+    with mock.patch.dict(os.environ, VALID_ENV):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+    send("msg1", VALID_ENV)
+    send("msg2", {**VALID_ENV, "CONVERSATION_CACHE_ENTRIES": "0"})  # B has no cached copy
+    send("msg3", VALID_ENV)  # A still caches the item as of msg1
+
+    archived = [t["message"] for t in iter_transcript(s3, "test-bucket", "+1234567890")]
+    assert [m for m in archived if m.startswith("msg")] == ["msg1", "msg2", "msg3"]
+    assert len(archived) == 6
+
+
 @mock_dynamodb
 @mock_s3
 @mock_sns
@@ -228,3 +515,27 @@ def test_response_is_valid_twiml_xml():
     messages = root.findall("Message")
     assert len(messages) == 1
     assert messages[0].text  # not empty
+
+
+@mock_dynamodb
+@mock_s3
+@mock_sns
+def test_stage_timings_emitted_as_one_emf_line(capsys):
+    _setup_aws()
+    body = "From=%2B1234567890&Body=I%20have%20a%20mild%20headache"
+
+    with mock.patch.dict(os.environ, {**VALID_ENV, "METRICS_EMF": "on"}):
+        from src import lambda_function
+        importlib.reload(lambda_function)
+
+        with mock.patch("src.lambda_function.verify_twilio_signature", return_value=True):
+            lambda_function.lambda_handler(_make_event(body), None)
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"_aws"' in line]
+    assert len(lines) == 1
+    emf = lines[0]
+    assert (emf["Provider"], emf["Urgency"], emf["outcome"]) == ("unknown", "LOW", "triaged")
+    names = {m["Name"] for m in emf["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert {"verify_signature", "rate_limit", "load_conversation", "classify", "build_reply",
+            "side_effects", "store_conversation", "append_transcript", "total"} <= names
+    assert emf["total"] >= emf["classify"]
@@ -0,0 +1,61 @@
+"""Tests for src/metrics.py — per-invocation EMF stage timings."""
+
+import json
+import os
+from unittest import mock
+
+from src.metrics import DIMENSION_SETS, Metrics
+
+
+def _emitted(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines() if line]
+
+
+def test_spans_accumulate_and_become_millisecond_metrics():
+    metrics = Metrics(Provider="bedrock")
+    with metrics.span("load_conversation"):
+        pass
+    metrics.add("load_conversation", 5.0)
+    metrics.add("send_alert", 12.345)
+    metrics.dimension("Urgency", "HIGH")
+    metrics.property("request_id", "abc")
+
+    emf = metrics.to_emf()
+    directive = emf["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "WhatsAppTriage"
+    assert directive["Dimensions"] == DIMENSION_SETS
+    assert directive["Metrics"] == [
+        {"Name": "load_conversation", "Unit": "Milliseconds"},
+        {"Name": "send_alert", "Unit": "Milliseconds"},
+    ]
+    assert 5.0 <= emf["load_conversation"] < 50
+    assert emf["send_alert"] == 12.35
+    assert (emf["Provider"], emf["Urgency"], emf["request_id"]) == ("bedrock", "HIGH", "abc")
+
+
+def test_counts_use_the_count_unit():
+    metrics = Metrics()
+    metrics.add("total", 1.0)
+    metrics.count("side_effects_abandoned")
+    metrics.count("side_effects_abandoned", 2)
+
+    emf = metrics.to_emf()
+    units = {m["Name"]: m["Unit"] for m in emf["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert units == {"total": "Milliseconds", "side_effects_abandoned": "Count"}
+    assert emf["side_effects_abandoned"] == 3
+
+
+def test_flush_writes_one_line_only_when_enabled(capsys):
+    metrics = Metrics()
+    metrics.add("total", 1.0)
+    metrics.flush()
+    assert _emitted(capsys) == []
+
+    with mock.patch.dict(os.environ, {"METRICS_EMF": "on", "METRICS_NAMESPACE": "Triage/test"}):
+        metrics.add("total", 1.0)
+        metrics.flush()
+        metrics.flush()  # nothing new recorded
+    lines = _emitted(capsys)
+    assert len(lines) == 1
+    assert lines[0]["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "Triage/test"
+    assert lines[0]["Urgency"] == "none"  # every dimension key is always present
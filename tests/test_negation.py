@@ -0,0 +1,68 @@
+"""Tests for src/negation.py and the labelled fallback regression corpus."""
+
+import json
+import os
+
+import pytest
+
+from src.keyword_matcher import KeywordMatcher
+from src.negation import scope_matches
+from src.utils import fallback_classifier
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "fallback_corpus.jsonl")
+
+MATCHER = KeywordMatcher([("chest pain", "HIGH"), ("fever", "MEDIUM"), ("not breathing", "HIGH")])
+
+
+def _statuses(text):
+    return [(m.phrase, m.status) for m in scope_matches(text, MATCHER.find_all(text))]
+
+
+def _corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def test_pre_negation_scopes_following_tokens():
+    assert _statuses("I do NOT have chest pain") == [("chest pain", "negated")]
+    assert _statuses("no fever or chest pain") == [("fever", "negated"), ("chest pain", "negated")]
+
+
+def test_terminator_closes_window():
+    assert _statuses("no fever but chest pain") == [("fever", "negated"), ("chest pain", "affirmed")]
+    assert _statuses("no fever. chest pain") == [("fever", "negated"), ("chest pain", "affirmed")]
+    assert _statuses("no fever, chest pain") == [("fever", "negated"), ("chest pain", "affirmed")]
+    assert _statuses("no fever and chest pain") == [("fever", "negated"), ("chest pain", "affirmed")]
+
+
+def test_negation_only_reaches_the_adjacent_phrase():
+    assert _statuses("no signs of any chest pain") == [("chest pain", "negated")]
+    assert _statuses("no word chest pain") == [("chest pain", "affirmed")]
+    assert _statuses("not feeling well chest pain") == [("chest pain", "affirmed")]
+    assert _statuses("without my inhaler chest pain") == [("chest pain", "affirmed")]
+    assert _statuses("no fever word chest pain") == [("fever", "negated"), ("chest pain", "affirmed")]
+
+
+def test_negated_high_phrase_stays_medium():
+    result = fallback_classifier("I do not have chest pain")
+    assert result["urgency"] == "MEDIUM"
+    assert result["red_flags"] == []
+
+
+def test_phrase_starting_with_trigger_is_affirmed():
+    assert _statuses("he is not breathing") == [("not breathing", "affirmed")]
+    assert _statuses("no he is not breathing") == [("not breathing", "affirmed")]
+
+
+def test_post_negation_and_uncertainty():
+    assert _statuses("chest pain ruled out") == [("chest pain", "negated")]
+    assert _statuses("fever. chest pain went away") == [("fever", "affirmed"), ("chest pain", "negated")]
+    assert _statuses("maybe chest pain") == [("chest pain", "uncertain")]
+
+
+@pytest.mark.parametrize("case", _corpus(), ids=lambda c: c["text"][:40])
+def test_labelled_corpus(case):
+    result = fallback_classifier(case["text"])
+    assert result["urgency"] == case["urgency"]
+    if "red_flags" in case:
+        assert result["red_flags"] == case["red_flags"]
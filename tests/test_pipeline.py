@@ -0,0 +1,65 @@
+"""Tests for src/pipeline.py — post-reply side-effect execution."""
+
+import json
+import threading
+import time
+from unittest import mock
+
+from src.pipeline import SideEffect, run_side_effects, side_effects_mode
+
+
+def _sleeper(seconds, calls, name):
+    def run():
+        time.sleep(seconds)
+        calls.append(name)
+    return run
+
+
+def test_sequential_runs_in_order():
+    calls = []
+    effects = [SideEffect(n, _sleeper(0, calls, n)) for n in ("a", "b", "c")]
+    timings = run_side_effects(effects, mode="sequential")
+    assert calls == ["a", "b", "c"]
+    assert set(timings) == {"a", "b", "c"}
+
+
+def test_concurrent_overlaps_effects():
+    calls = []
+    effects = [SideEffect(n, _sleeper(0.1, calls, n)) for n in ("a", "b", "c")]
+    start = time.perf_counter()
+    run_side_effects(effects, mode="concurrent")
+    assert time.perf_counter() - start < 0.25
+    assert sorted(calls) == ["a", "b", "c"]
+
+
+def test_errors_are_swallowed():
+    def boom():
+        raise RuntimeError("s3 down")
+
+    calls = []
+    effects = [SideEffect("boom", boom), SideEffect("ok", _sleeper(0, calls, "ok"))]
+    for mode in ("sequential", "concurrent"):
+        timings = run_side_effects(effects, mode=mode)
+        assert "boom" in timings
+    assert calls == ["ok", "ok"]
+
+
+def test_best_effort_not_awaited_past_grace():
+    release = threading.Event()
+    effects = [
+        SideEffect("required", lambda: None),
+        SideEffect("slow", release.wait, required=False),
+    ]
+    start = time.perf_counter()
+    with mock.patch("src.pipeline.logger") as logger:
+        timings = run_side_effects(effects, mode="concurrent", grace_ms=50)
+    release.set()
+    assert time.perf_counter() - start < 1
+    assert "required" in timings and "slow" not in timings
+    [call] = logger.warning.call_args_list
+    assert json.loads(call.args[0]) == {"event": "side_effect_abandoned", "effect": "slow", "grace_ms": 50}
+
+
+def test_unknown_mode_falls_back_to_sequential(monkeypatch):
+    monkeypatch.setenv("SIDE_EFFECTS_MODE", "parallel-ish")
+    assert side_effects_mode() == "sequential"
@@ -0,0 +1,69 @@
+"""Tests for src/pre_triage.py."""
+
+import pytest
+
+from src.pre_triage import FAST_PATH_PHRASES, PreTriageStats, pre_triage
+
+
+@pytest.mark.parametrize("message", [
+    "He is not breathing",
+    "My father is unconscious on the floor",
+    "I think she took an overdose of pills",
+    "Mi padre no respira",
+    "Il ne respire pas",
+])
+def test_unambiguous_emergencies_hit(message):
+    result = pre_triage(message)
+    assert result is not None
+    assert result["urgency"] == "HIGH"
+    assert result["source"] == "rules"
+    assert result["rules"]
+
+
+@pytest.mark.parametrize("message", [
+    "I do not have a heart attack, just heartburn",
+    "What are the signs of a heart attack?",
+    "Maybe an overdose",
+    "Chest pain since this morning",  # HIGH, but left to the LLM
+    "Mild headache",
+])
+def test_everything_else_goes_to_the_llm(message):
+    assert pre_triage(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "My father had a heart attack two years ago. I have a cold",
+    "I took my seizure medication this morning, mild headache",
+    "Is it an overdose if I took 2 paracetamol",
+    "Grandma died of a heart attack, I feel sad",
+    "Mi abuelo murió de un ataque al corazón",
+    "Il y a deux ans j'ai eu une crise cardiaque",
+])
+def test_history_medication_and_hypotheticals_go_to_the_llm(message):
+    assert pre_triage(message) is None
+
+
+def test_fast_path_is_off_by_default(monkeypatch):
+    from src.pre_triage import pre_triage_enabled
+    monkeypatch.delenv("PRE_TRIAGE", raising=False)
+    assert pre_triage_enabled() is False
+    monkeypatch.setenv("PRE_TRIAGE", "on")
+    assert pre_triage_enabled() is True
+
+
+def test_fast_path_phrases_are_in_the_high_lexicon():
+    from src.keyword_matcher import DEFAULT_MATCHER
+    for phrase in FAST_PATH_PHRASES:
+        [match] = [m for m in DEFAULT_MATCHER.find_all(phrase) if m.phrase == phrase]
+        assert match.severity == "HIGH"
+
+
+def test_stats_track_hit_rate_and_latency_saved():
+    stats = PreTriageStats()
+    stats.record_llm(2000.0)
+    miss = stats.record(False, 0.02)
+    hit = stats.record(True, 0.02)
+
+    assert miss["latency_saved_ms"] == 0.0
+    assert hit["hit_rate"] == 0.5
+    assert 1500 < hit["latency_saved_ms"] < 2000
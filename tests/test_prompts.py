@@ -0,0 +1,54 @@
+"""Tests for src/prompts.py."""
+
+import os
+from unittest import mock
+
+from src.prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_TOKENS, build_prompt, estimate_tokens
+
+
+def _turn(message, role="patient", ts="t"):
+    return {"timestamp": ts, "role": role, "message": message}
+
+
+def test_estimate_tokens_counts_words_punctuation_and_long_words():
+    assert estimate_tokens("Hello, world!") == 4
+    assert estimate_tokens("gastroenteritis") == 3
+    assert estimate_tokens("") == 0
+
+
+def test_message_only_prompt():
+    prompt = build_prompt("I have a headache", [])
+    assert prompt.system == SYSTEM_PROMPT
+    assert prompt.user == "I have a headache"
+    assert prompt.context == ""
+    assert prompt.input_tokens == SYSTEM_PROMPT_TOKENS + 5  # "headache" counts as two
+
+
+def test_context_format_and_token_count():
+    history = [_turn("fever since Monday"), _turn("Rest and hydrate", role="agent")]
+    prompt = build_prompt("now a rash", history, summary="Earlier: cough")
+    assert prompt.user == (
+        "Summary of earlier messages: Earlier: cough\n\n"
+        "Conversation history:\n[t] Patient: fever since Monday\n[t] Agent: Rest and hydrate"
+        "\n\nLatest message: now a rash"
+    )
+    exact = estimate_tokens(prompt.system) + estimate_tokens(prompt.user)
+    assert abs(prompt.input_tokens - exact) <= 5
+    assert prompt.context_turns == 2 and prompt.dropped_turns == 0
+
+
+def test_packs_newest_turns_first_within_budget():
+    history = [_turn("word " * 300), _turn("older"), _turn("newest")]
+    prompt = build_prompt("hello", history, summary="s " * 50, budget=40)
+    assert prompt.context == "[t] Patient: older\n[t] Patient: newest"
+    assert prompt.dropped_turns == 1
+    assert "Summary" not in prompt.user  # no room left for it
+
+
+def test_budget_from_environment_and_turn_cap():
+    history = [_turn(f"message {i}") for i in range(30)]
+    with mock.patch.dict(os.environ, {"PROMPT_CONTEXT_TOKENS": "0"}):
+        assert build_prompt("hi", history).context_turns == 0
+    prompt = build_prompt("hi", history)
+    assert prompt.context_turns == 10
+    assert prompt.context.endswith("message 29")
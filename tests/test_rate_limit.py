@@ -0,0 +1,102 @@
+"""Tests for src/rate_limit.py — atomic DynamoDB counter and token bucket."""
+
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from src import rate_limit
+from src.rate_limit import DynamoDBRateLimiter, TokenBucketRateLimiter, get_rate_limiter
+
+USER = "+19995550001"
+
+
+@pytest.fixture
+def table():
+    with mock_dynamodb():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        yield dynamodb.create_table(
+            TableName="triage",
+            KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+
+def test_first_message_creates_counter(table):
+    decision = DynamoDBRateLimiter(table, limit=3).acquire(USER)
+    assert decision == (True, 1)
+    item = table.get_item(Key={"user_id": USER})["Item"]
+    assert item["daily_count"] == 1
+    assert item["count_date"] == rate_limit._today()
+
+
+def test_counter_denies_at_limit(table):
+    limiter = DynamoDBRateLimiter(table, limit=3)
+    results = [limiter.acquire(USER) for _ in range(5)]
+    assert [r.allowed for r in results] == [True, True, True, False, False]
+    assert [r.count for r in results[:3]] == [1, 2, 3]
+    assert table.get_item(Key={"user_id": USER})["Item"]["daily_count"] == 3
+
+
+def test_counter_resets_on_new_day(table):
+    table.put_item(Item={"user_id": USER, "daily_count": 999, "count_date": "2000-01-01"})
+    assert DynamoDBRateLimiter(table, limit=3).acquire(USER) == (True, 1)
+
+
+def test_concurrent_first_messages_of_the_day_are_both_counted(table):
+    table.put_item(Item={"user_id": USER, "daily_count": 5, "count_date": "2000-01-01"})
+    limiter = DynamoDBRateLimiter(table, limit=3)
+    rival = DynamoDBRateLimiter(table, limit=3)
+    update_item = table.update_item
+
+    def racing_update(**kwargs):
+        # The rival's reset lands between our failed ADD and our reset
+        if kwargs["UpdateExpression"].startswith("SET") and not racing_update.raced:
+            racing_update.raced = True
+            assert rival.acquire(USER) == (True, 1)
+        return update_item(**kwargs)
+    racing_update.raced = False
+
+    with mock.patch.object(table, "update_item", side_effect=racing_update):
+        assert limiter.acquire(USER) == (True, 2)
+    assert table.get_item(Key={"user_id": USER})["Item"]["daily_count"] == 2
+
+
+def test_denial_reports_stored_count(table):
+    table.put_item(Item={"user_id": USER, "daily_count": 4, "count_date": rate_limit._today()})
+    assert DynamoDBRateLimiter(table, limit=3).acquire(USER) == (False, 4)
+
+
+def test_counter_preserves_other_attributes(table):
+    table.put_item(Item={"user_id": USER, "history": [{"message": "hi"}]})
+    DynamoDBRateLimiter(table, limit=3).acquire(USER)
+    assert table.get_item(Key={"user_id": USER})["Item"]["history"] == [{"message": "hi"}]
+
+
+def test_dynamodb_errors_fail_open():
+    broken = mock.Mock()
+    broken.update_item.side_effect = RuntimeError("throttled")
+    assert DynamoDBRateLimiter(broken).acquire(USER).allowed is True
+
+
+def test_token_bucket_limits_and_refills():
+    now = [0.0]
+    limiter = TokenBucketRateLimiter(limit=2, period_seconds=100, clock=lambda: now[0])
+    assert [limiter.acquire(USER).allowed for _ in range(3)] == [True, True, False]
+    now[0] = 50.0  # one token back
+    assert limiter.acquire(USER).allowed is True
+    assert limiter.acquire("+10000000000").allowed is True  # buckets are per user
+
+
+def test_get_rate_limiter_selection(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_BACKEND", raising=False)
+    assert isinstance(get_rate_limiter(mock.Mock()), DynamoDBRateLimiter)
+    assert get_rate_limiter(None) is None
+
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "memory")
+    assert isinstance(get_rate_limiter(None), TokenBucketRateLimiter)
+
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "item")
+    assert get_rate_limiter(mock.Mock()) is None
@@ -0,0 +1,126 @@
+"""Tests for src/retriage.py — offline batch re-triage of the transcript archive."""
+
+import json
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from src import retriage
+from src.transcripts import append_transcript, list_transcripts, transcript_prefix
+from src.utils import TRIAGE_REPLIES
+
+ARCHIVE = "archive-bucket"
+OUTPUT = "retriage-bucket"
+ALICE = "+10001234567"
+BOB = "+10009876543"
+
+
+@pytest.fixture
+def s3():
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=ARCHIVE)
+        client.create_bucket(Bucket=OUTPUT)
+        yield client
+
+
+def _exchange(message, urgency):
+    return [
+        {"timestamp": "t", "role": "patient", "message": message},
+        {"timestamp": "t", "role": "agent", "message": TRIAGE_REPLIES[urgency]},
+    ]
+
+
+def _archive(s3):
+    append_transcript(s3, ARCHIVE, ALICE, _exchange("mild cough", "LOW"), 0)
+    append_transcript(s3, ARCHIVE, ALICE, _exchange("now chest pain", "LOW"), 2)
+    append_transcript(s3, ARCHIVE, BOB, _exchange("a headache", "MEDIUM"), 0)
+    s3.put_object(Bucket=ARCHIVE, Key="***4567/transcript_20240101T000000Z.txt", Body=b"legacy")
+
+
+def _records(s3):
+    body = s3.get_object(Bucket=OUTPUT, Key="retriage/r1/input.jsonl")["Body"].read().decode()
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_list_transcripts_yields_each_conversation_once(s3):
+    _archive(s3)
+    assert sorted(list_transcripts(s3, ARCHIVE)) == sorted([transcript_prefix(ALICE), transcript_prefix(BOB)])
+
+
+def test_turns_carry_prior_history_and_original_urgency(s3):
+    _archive(s3)
+    turns = {(t.conversation, t.turn): t for t in retriage.iter_turns(s3, ARCHIVE)}
+    chest = turns[(transcript_prefix(ALICE), 2)]
+    assert chest.message == "now chest pain"
+    assert chest.original == "LOW"
+    assert [h["message"] for h in chest.history][0] == "mild cough"
+    assert turns[(transcript_prefix(BOB), 0)].original == "MEDIUM"
+
+
+def test_prepare_writes_opaque_records_and_manifest(s3):
+    _archive(s3)
+    assert retriage.prepare(s3, ARCHIVE, OUTPUT, "r1") == {"conversations": 2, "records": 3}
+    records = _records(s3)
+    assert [r["recordId"] for r in records] == ["00000000001", "00000000002", "00000000003"]
+    assert records[0]["modelInput"]["anthropic_version"] == "bedrock-2023-05-31"
+    assert "4567" not in json.dumps(records)
+
+
+def test_replay_reports_urgency_diff(s3):
+    _archive(s3)
+    result = retriage.replay(s3, ARCHIVE, OUTPUT, "r1")
+    assert result["records"] == 3 and result["compared"] == 3
+    assert result["changed"] == 2
+    assert result["escalated"] == 1 and result["deescalated"] == 1
+    assert result["changes"][0] == {
+        "conversation": transcript_prefix(ALICE), "turn": 2, "original": "LOW", "new": "HIGH",
+    }
+    stored = json.loads(s3.get_object(Bucket=OUTPUT, Key="retriage/r1/report.json")["Body"].read())
+    assert stored["transitions"]["LOW->HIGH"] == 1
+
+
+def test_canned_outputs_errors_and_missing_records(s3, tmp_path):
+    _archive(s3)
+    canned = tmp_path / "outputs.jsonl"
+    canned.write_text(
+        json.dumps({"recordId": "00000000001", "text": 'Sure: {"urgency": "medium"}'}) + "\n"
+        + json.dumps({"recordId": "00000000002", "text": "I cannot help"}) + "\n"
+    )
+    result = retriage.replay(s3, ARCHIVE, OUTPUT, "r1", retriage.load_outputs(str(canned)))
+    assert result["transitions"] == {"LOW->MEDIUM": 1}
+    assert result["failed"] == 2  # unparseable answer + record without canned output
+    assert result["missing"] == 0
+
+
+def test_report_joins_unordered_output_to_the_manifest(s3):
+    _archive(s3)
+    retriage.prepare(s3, ARCHIVE, OUTPUT, "r1")
+
+    def line(record_id, urgency):
+        text = json.dumps({"urgency": urgency})
+        return json.dumps({"recordId": record_id, "modelOutput": {"content": [{"type": "text", "text": text}]}})
+
+    body = "\n".join([
+        line("00000000003", "HIGH"),
+        line("99999999999", "LOW"),   # not in the manifest
+        line("00000000001", "LOW"),
+        line("00000000001", "HIGH"),  # duplicate: the first output wins
+    ]) + "\n"
+    s3.put_object(Bucket=OUTPUT, Key="retriage/r1/output/job1/input.jsonl.out", Body=body.encode())
+    result = retriage.report(s3, OUTPUT, "r1")
+    assert result["records"] == 3 and result["compared"] == 2 and result["missing"] == 1
+    assert result["transitions"] == {"LOW->LOW": 1, "MEDIUM->HIGH": 1}
+    assert result["escalated"] == 1 and result["failed"] == 0
+
+
+def test_submit_builds_the_invocation_job_request():
+    bedrock = mock.Mock()
+    bedrock.create_model_invocation_job.return_value = {"jobArn": "arn:job"}
+    assert retriage.submit(bedrock, OUTPUT, "r1", "arn:role") == "arn:job"
+    request = bedrock.create_model_invocation_job.call_args.kwargs
+    assert request["roleArn"] == "arn:role"
+    assert request["inputDataConfig"]["s3InputDataConfig"]["s3Uri"] == f"s3://{OUTPUT}/retriage/r1/input.jsonl"
+    assert request["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"] == f"s3://{OUTPUT}/retriage/r1/output/"
@@ -0,0 +1,118 @@
+"""Tests for src/streaming.py."""
+
+import json
+import threading
+from unittest import mock
+
+from src.classification_cache import ClassificationCache, TTLCache
+from src.streaming import PendingClassification, UrgencyScanner, stream_classification
+from src.utils import _classification_keys
+
+COMPLETION = (
+    '{"urgency": "HIGH", "symptoms": ["chest pain"], "duration": "1 hour", '
+    '"age": "54", "red_flags": ["chest pain"]}'
+)
+
+
+def _event(text):
+    payload = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+    return {"chunk": {"bytes": json.dumps(payload).encode()}}
+
+
+def _keys(message):
+    return _classification_keys("bedrock", message, [], None, "+1")
+
+
+def _client(events):
+    client = mock.Mock()
+    client.invoke_model_with_response_stream.return_value = {"body": events}
+    return client
+
+
+def _gated_stream(head, tail, gate):
+    """Yield ``head``, wait for ``gate``, then yield ``tail``."""
+    yield {"chunk": {"bytes": json.dumps({"type": "message_start"}).encode()}}
+    for text in head:
+        yield _event(text)
+    gate.wait(5)
+    for text in tail:
+        yield _event(text)
+
+
+def test_scanner_finds_urgency_at_every_split_point():
+    for split in range(len(COMPLETION) + 1):
+        scanner = UrgencyScanner()
+        first = scanner.feed(COMPLETION[:split])
+        assert scanner.feed(COMPLETION[split:]) == "HIGH"
+        assert first == ("HIGH" if split >= COMPLETION.index(",") else None)
+        assert scanner.text == COMPLETION
+
+
+def test_scanner_decides_before_the_rest_arrives():
+    scanner = UrgencyScanner()
+    assert scanner.feed('```json\n{"urgency": "med') is None
+    assert scanner.feed('ium", "symptoms": [') == "MEDIUM"
+
+
+def test_scanner_ignores_nested_keys_string_contents_and_bad_values():
+    scanner = UrgencyScanner()
+    assert scanner.feed('{"symptoms": ["\\"urgency\\": \\"HIGH\\""], "notes": {"urgency": "HIGH"}, ') is None
+    assert scanner.feed('"urgency": "soon", ') is None
+    assert scanner.feed('"urgency": "LOW"}') == "LOW"
+
+
+def test_pending_keeps_the_early_urgency_when_the_result_disagrees():
+    pending = PendingClassification("chest pain")
+    pending.decide("HIGH")
+    assert pending.urgency() == "HIGH"
+    pending.finish({"urgency": "LOW", "symptoms": []})
+    assert pending.result()["urgency"] == "HIGH"
+    assert pending.finish({"urgency": "MEDIUM"}) is False
+
+
+def test_pending_falls_back_when_the_stream_stalls():
+    pending = PendingClassification("I have chest pain", timeout=0.0)
+    with mock.patch("src.streaming.DECISION_GRACE", 0.01):
+        assert pending.urgency() == "HIGH"
+    assert pending.result()["source"] == "keywords"
+
+
+def test_urgency_is_known_before_the_stream_completes():
+    gate = threading.Event()
+    events = _gated_stream(['{"urgency": "HI', 'GH", '], [COMPLETION[len('{"urgency": "HIGH", '):]], gate)
+    cache = ClassificationCache(TTLCache())
+    with mock.patch("src.streaming.get_bedrock_client", return_value=_client(events)):
+        pending = stream_classification("chest pain", [], timeout=5, user_id="+1", cache=cache)
+        assert pending.urgency() == "HIGH"
+        assert not pending._done.is_set()
+        gate.set()
+        result = pending.result()
+
+    assert result["red_flags"] == ["chest pain"]
+    assert pending.decision_ms <= pending.complete_ms
+    assert cache.get(*_keys("chest pain")) == result
+
+
+def test_stream_error_after_decision_keeps_urgency():
+    def broken():
+        yield _event('{"urgency": "MEDIUM", "symptoms": [')
+        raise ConnectionError("stream reset")
+
+    with mock.patch("src.streaming.get_bedrock_client", return_value=_client(broken())):
+        pending = stream_classification("I have had a fever for three days", [], timeout=5)
+        result = pending.result()
+
+    assert pending.urgency() == "MEDIUM"
+    assert result["urgency"] == "MEDIUM"
+    assert result["source"] == "keywords"
+
+
+def test_cache_hit_does_not_call_bedrock():
+    cache = ClassificationCache(TTLCache())
+    cache.put(*_keys("mild headache"), {"urgency": "LOW", "symptoms": ["headache"]})
+    with mock.patch("src.streaming.get_bedrock_client") as client:
+        pending = stream_classification("mild headache", [], user_id="+1", cache=cache)
+
+    client.assert_not_called()
+    assert pending.urgency() == "LOW"
+    assert not pending.streamed
@@ -0,0 +1,116 @@
+"""Tests for src/transcripts.py — append-only segments, compaction and streaming reads."""
+
+from unittest import mock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_s3
+
+from src.transcripts import (
+    append_transcript,
+    compact_all,
+    compact_transcript,
+    format_turn,
+    iter_transcript,
+    transcript_prefix,
+)
+
+BUCKET = "test-bucket"
+USER = "+10001234567"
+
+
+def _turn(n, role="patient"):
+    return {"timestamp": f"2024-01-01T00:00:{n:02d}", "role": role, "message": f"msg {n}"}
+
+
+@pytest.fixture
+def s3():
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _conditional_puts(s3):
+    """Enforce IfNoneMatch="*" on put_object, which moto ignores."""
+    put_object = s3.put_object
+
+    def put(**kwargs):
+        if kwargs.pop("IfNoneMatch", None) == "*":
+            try:
+                s3.head_object(Bucket=kwargs["Bucket"], Key=kwargs["Key"])
+            except ClientError:
+                pass
+            else:
+                raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        return put_object(**kwargs)
+    return mock.patch.object(s3, "put_object", side_effect=put)
+
+
+def _exchange(s3, start):
+    append_transcript(s3, BUCKET, USER, [_turn(start), _turn(start + 1, "agent")], start)
+
+
+def test_prefix_separates_users_with_same_last_digits():
+    assert transcript_prefix("+10001234567") != transcript_prefix("+19991234567")
+    assert transcript_prefix(USER).startswith("***4567/")
+
+
+def test_each_message_writes_only_its_turns(s3):
+    _exchange(s3, 0)
+    _exchange(s3, 2)
+
+    keys = [o["Key"] for o in s3.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert len(keys) == 2
+    assert all("/segments/" in key for key in keys)
+    assert [t["message"] for t in iter_transcript(s3, BUCKET, USER)] == [
+        "msg 0", "msg 1", "msg 2", "msg 3",
+    ]
+
+
+def test_compaction_merges_and_removes_segments(s3):
+    for start in (0, 2, 4):
+        _exchange(s3, start)
+
+    assert compact_transcript(s3, BUCKET, transcript_prefix(USER)) == 3
+    keys = [o["Key"] for o in s3.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert keys == [f"{transcript_prefix(USER)}/transcript.jsonl"]
+
+    _exchange(s3, 6)
+    messages = [t["message"] for t in iter_transcript(s3, BUCKET, USER)]
+    assert messages == [f"msg {n}" for n in range(8)]
+
+
+def test_retried_segment_is_not_duplicated(s3):
+    _exchange(s3, 0)
+    compact_transcript(s3, BUCKET, transcript_prefix(USER))
+    _exchange(s3, 0)  # late retry of an already compacted write
+
+    assert len(list(iter_transcript(s3, BUCKET, USER))) == 2
+    compact_transcript(s3, BUCKET, transcript_prefix(USER))
+    assert len(list(iter_transcript(s3, BUCKET, USER))) == 2
+
+
+def test_stale_index_never_overwrites_a_segment(s3):
+    with _conditional_puts(s3):
+        _exchange(s3, 0)
+        _exchange(s3, 2)  # another container archived turns 2-3
+        stale = [_turn(4), _turn(5, "agent")]
+        assert append_transcript(s3, BUCKET, USER, stale, 2) == 4
+        assert append_transcript(s3, BUCKET, USER, stale, 2) == 4  # retry: no duplicate
+
+    messages = [t["message"] for t in iter_transcript(s3, BUCKET, USER)]
+    assert messages == [f"msg {n}" for n in range(6)]
+
+
+def test_compact_all_handles_every_conversation(s3):
+    _exchange(s3, 0)
+    append_transcript(s3, BUCKET, "+15550009999", [_turn(0)], 0)
+
+    assert compact_all(s3, BUCKET) == {"conversations": 2, "segments": 2}
+    assert compact_all(s3, BUCKET) == {"conversations": 0, "segments": 0}
+
+
+def test_format_turn():
+    assert format_turn(_turn(1, "agent")) == "2024-01-01T00:00:01 [agent]: msg 1"
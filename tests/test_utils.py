@@ -1,5 +1,7 @@
 """Tests for src/utils.py — triage logic, rate limiting, DynamoDB helpers."""
 
+import contextlib
+import io
 import json
 import time
 from datetime import datetime, timezone
@@ -10,18 +12,30 @@ import pytest
 from moto import mock_dynamodb, mock_s3, mock_sns
 
 from src.utils import (
-    _fallback_classifier,
+    GATE_ATTRIBUTES,
+    Conversation,
     _mask,
+    build_alert,
     build_response_and_state,
+    build_update_request,
     classify_message,
+    complete_conversation,
+    consistent_read,
+    fallback_classifier,
     generate_twiml_response,
     increment_message_count,
     is_rate_limited,
+    llm_timeout_budget,
     load_conversation,
     sanitize_input,
     send_alert,
+    spill_history,
     store_conversation,
+    summarise_turns,
+    trim_history,
+    twilio_signature,
     upload_transcript,
+    verify_twilio_signature,
 )
 
 
@@ -39,6 +53,21 @@ def test_sanitize_truncates_long_input():
     assert len(result) == 1600
 
 
+# ---------------------------------------------------------------------------
+# Twilio signatures
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("library", [True, False])
+def test_computed_signature_verifies(library):
+    url = "https://example.execute-api.us-east-1.amazonaws.com/webhook"
+    params = {"From": ["whatsapp:+10001234567"], "Body": ["I have a fever"]}
+    signature = twilio_signature(url, params, "token")
+    with contextlib.nullcontext() if library else mock.patch("src.utils.RequestValidator", None):
+        assert verify_twilio_signature(signature, url, params, "token")
+        assert not verify_twilio_signature(signature, url, params, "other-token")
+        assert not verify_twilio_signature(signature, url, {**params, "Body": ["edited"]}, "token")
+
+
 # ---------------------------------------------------------------------------
 # Rate limiting
 # ---------------------------------------------------------------------------
@@ -79,26 +108,36 @@ def test_increment_message_count_new_day():
 # ---------------------------------------------------------------------------
 
 def test_fallback_low():
-    result = _fallback_classifier("I have a mild headache.")
+    result = fallback_classifier("I have a mild headache.")
     assert result["urgency"] == "LOW"
 
 
 def test_fallback_medium_fever():
-    result = _fallback_classifier("My child has a high fever and is vomiting.")
+    result = fallback_classifier("My child has a high fever and is vomiting.")
     assert result["urgency"] == "MEDIUM"
 
 
 def test_fallback_high_chest_pain():
-    result = _fallback_classifier("Sudden chest pain and shortness of breath.")
+    result = fallback_classifier("Sudden chest pain and shortness of breath.")
     assert result["urgency"] == "HIGH"
     assert "chest pain" in result["red_flags"]
 
 
 def test_fallback_high_unconscious():
-    result = _fallback_classifier("The patient is unconscious and not breathing.")
+    result = fallback_classifier("The patient is unconscious and not breathing.")
     assert result["urgency"] == "HIGH"
 
 
+def test_fallback_reports_every_high_match_with_spans():
+    message = "Vomiting, then chest pain and shortness of breath."
+    result = fallback_classifier(message)
+    assert result["urgency"] == "HIGH"
+    assert result["red_flags"] == ["chest pain", "shortness of breath"]
+    spans = {m["phrase"]: message[m["start"]:m["end"]].lower() for m in result["matches"]}
+    assert spans["vomiting"] == "vomiting"
+    assert spans["chest pain"] == "chest pain"
+
+
 # ---------------------------------------------------------------------------
 # classify_message — fallback path (unknown provider)
 # ---------------------------------------------------------------------------
@@ -118,6 +157,37 @@ def test_classify_high_via_fallback():
     assert result["urgency"] == "HIGH"
 
 
+def test_classify_with_no_time_left_skips_llm():
+    with mock.patch("src.utils._classify_bedrock") as bedrock:
+        result = classify_message("Chest pain.", history=[], provider="bedrock", timeout=0)
+    bedrock.assert_not_called()
+    assert result["urgency"] == "HIGH"
+
+
+# ---------------------------------------------------------------------------
+# llm_timeout_budget
+# ---------------------------------------------------------------------------
+
+def _context(remaining_ms):
+    return mock.Mock(get_remaining_time_in_millis=mock.Mock(return_value=remaining_ms))
+
+
+def test_timeout_budget_without_context_uses_cap():
+    assert llm_timeout_budget(None) == 8.0
+
+
+def test_timeout_budget_subtracts_reserve():
+    assert llm_timeout_budget(_context(5000)) == pytest.approx(3.0)
+
+
+def test_timeout_budget_is_capped():
+    assert llm_timeout_budget(_context(30000)) == 8.0
+
+
+def test_timeout_budget_zero_when_nearly_out_of_time():
+    assert llm_timeout_budget(_context(2200)) == 0.0
+
+
 # ---------------------------------------------------------------------------
 # generate_twiml_response — XML escaping
 # ---------------------------------------------------------------------------
@@ -161,6 +231,15 @@ def test_build_response_high_sends_alert_and_updates_state():
     assert conv["history"][1]["role"] == "agent"
 
 
+
+def test_alert_omits_classifier_diagnostics():
+    result = fallback_classifier("Sudden chest pain")
+    assert result["source"] == "keywords" and result["matches"]
+    _, body = build_alert(result, "+10001234")
+    data = json.loads(body.split("Full triage data:\n", 1)[1])
+    assert data["red_flags"] == ["chest pain"]
+    assert "source" not in data and "matches" not in data
+
 @mock_sns
 def test_build_response_medium():
     sns = boto3.client("sns", region_name="us-east-1")
@@ -228,6 +307,224 @@ def test_store_and_reload_conversation():
     assert reloaded["triage_level"] == "LOW"
 
 
+def _triage_table():
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    return dynamodb.create_table(
+        TableName="triage",
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+@mock_dynamodb
+def test_store_existing_conversation_appends_with_update_item():
+    table = _triage_table()
+    store_conversation(table, load_conversation(table, "+19995550001"))
+
+    conv = load_conversation(table, "+19995550001")
+    with mock.patch.object(table, "put_item") as put:
+        build_response_and_state(
+            {"urgency": "LOW"}, conv, "runny nose", None, "", "+19995550001"
+        )
+        request = build_update_request(conv)
+        store_conversation(table, conv)
+    put.assert_not_called()
+
+    assert "list_append" in request["UpdateExpression"]
+    history_name = next(k for k, v in request["ExpressionAttributeNames"].items() if v == "history")
+    appended = request["ExpressionAttributeValues"][history_name.replace("#a", ":v")]
+    assert len(appended) == 2  # only the new turns
+    assert "created_at" not in request["ExpressionAttributeNames"].values()
+
+    reloaded = load_conversation(table, "+19995550001")
+    assert [t["role"] for t in reloaded["history"]] == ["patient", "agent"]
+    assert reloaded["triage_level"] == "LOW"
+    assert not conv.dirty
+
+
+@mock_dynamodb
+def test_projected_load_then_complete_keeps_local_counter():
+    table = _triage_table()
+    table.put_item(Item={
+        "user_id": "+19995550001",
+        "history": _turns(2),
+        "summary": "earlier cough",
+        "daily_count": 3,
+        "count_date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+        "version": 4,
+    })
+
+    conv = load_conversation(table, "+19995550001", attributes=GATE_ATTRIBUTES)
+    assert conv.partial
+    assert "history" not in conv and "summary" not in conv
+    assert conv["user_id"] == "+19995550001"
+
+    increment_message_count(conv)
+    complete_conversation(table, conv)
+
+    assert not conv.partial
+    assert conv["daily_count"] == 4
+    assert conv["summary"] == "earlier cough"
+    assert len(conv["history"]) == 2
+    assert "daily_count" in conv.dirty
+    assert not conv.dirty & {"history", "summary", "version"}
+
+
+@mock_dynamodb
+def test_projected_load_for_new_user_needs_no_second_read():
+    table = _triage_table()
+    conv = load_conversation(table, "+19995550001", attributes=GATE_ATTRIBUTES)
+    assert conv.is_new and not conv.partial
+    with mock.patch.object(table, "get_item") as get_item:
+        complete_conversation(table, conv)
+    get_item.assert_not_called()
+
+
+def test_consistent_read_is_configured_per_stage():
+    with mock.patch.dict("os.environ", {"CONSISTENT_READ_GATE": "true"}):
+        assert consistent_read("gate") is True
+        assert consistent_read("full") is False
+
+
+def test_update_request_rewrites_trimmed_history():
+    conv = Conversation({"user_id": "+1", "history": _turns(4)})
+    trim_history(conv, window=2, batch=0)
+    request = build_update_request(conv)
+    assert "list_append" not in request["UpdateExpression"]
+    history_name = next(k for k, v in request["ExpressionAttributeNames"].items() if v == "history")
+    assert f"{history_name} = :" in request["UpdateExpression"]
+
+
+
+@mock_dynamodb
+def test_trimmed_stale_conversation_keeps_turns_stored_by_another_writer():
+    table = _triage_table()
+    table.put_item(Item={"user_id": "+19995550001", "history": _turns(4), "version": 1})
+    conv = load_conversation(table, "+19995550001")  # the stale copy
+    table.update_item(
+        Key={"user_id": "+19995550001"},
+        UpdateExpression="SET history = list_append(history, :t), version = :v",
+        ExpressionAttributeValues={":t": [
+            {"role": "patient", "message": "elsewhere"}, {"role": "agent", "message": "reply"},
+        ], ":v": 2},
+    )
+
+    with mock.patch.dict("os.environ", {"HISTORY_WINDOW": "4", "HISTORY_TRIM_BATCH": "0"}):
+        build_response_and_state({"urgency": "LOW"}, conv, "runny nose", None, "", "+19995550001")
+        assert [t["message"] for t in trim_history(conv)] == ["message 0", "message 1"]
+        assert store_conversation(table, conv)
+
+    item = table.get_item(Key={"user_id": "+19995550001"})["Item"]
+    assert [t["message"] for t in item["history"]][:2] == ["elsewhere", "reply"]
+    assert item["history"][2]["message"] == "runny nose"
+    assert item["history_offset"] == 4
+    assert "message 2" in item["summary"] and "elsewhere" not in item["summary"]
+    assert item["version"] == 3
+    assert conv["history_offset"] == 4
+
+# ---------------------------------------------------------------------------
+# History window and rolling summary
+# ---------------------------------------------------------------------------
+
+def _turns(n):
+    return [
+        {"timestamp": f"2024-01-0{1 + i // 10}T00:00:00", "role": "patient" if i % 2 == 0 else "agent",
+         "message": f"message {i}"}
+        for i in range(n)
+    ]
+
+
+def test_trim_history_within_window_is_noop():
+    conv = {"history": _turns(4)}
+    assert trim_history(conv, window=4, batch=0) == []
+    assert trim_history(conv, window=2, batch=2) == []
+    assert "history_offset" not in conv
+
+
+def test_trim_history_drops_oldest_and_summarises_patient_turns():
+    conv = {"history": _turns(6), "history_offset": 10}
+    dropped = trim_history(conv, window=2, batch=0)
+
+    assert [t["message"] for t in dropped] == ["message 0", "message 1", "message 2", "message 3"]
+    assert [t["message"] for t in conv["history"]] == ["message 4", "message 5"]
+    assert conv["history_offset"] == 14
+    assert "message 0" in conv["summary"] and "message 2" in conv["summary"]
+    assert "message 1" not in conv["summary"]  # agent replies are not summarised
+
+
+def test_summary_is_bounded_and_keeps_newest():
+    turns = [{"role": "patient", "message": f"symptom report {i} " + "x" * 100} for i in range(50)]
+    summary = summarise_turns("", turns)
+    assert len(summary) <= 1000
+    assert "symptom report 49" in summary
+    assert "symptom report 0 " not in summary
+
+
+def test_classify_message_includes_summary_in_prompt():
+    with mock.patch("src.utils._classify_bedrock", return_value={"urgency": "LOW"}) as bedrock:
+        classify_message("still coughing", history=[], provider="bedrock", summary="2024-01-01: cough")
+    user_content = bedrock.call_args.args[0]
+    assert user_content.startswith("Summary of earlier messages: 2024-01-01: cough")
+
+
+def _bedrock_reply(usage=None):
+    body = {"content": [{"text": '{"urgency": "LOW"}'}], "usage": usage or {}}
+    return {"body": io.BytesIO(json.dumps(body).encode())}
+
+
+def test_prompt_cache_marks_system_block_and_logs_cached_tokens(caplog):
+    client = mock.Mock()
+    client.invoke_model.return_value = _bedrock_reply({"input_tokens": 12, "cache_read_input_tokens": 190})
+    with mock.patch.dict("os.environ", {"BEDROCK_PROMPT_CACHE": "on"}), \
+            mock.patch("src.utils.get_bedrock_client", return_value=client), \
+            caplog.at_level("INFO", logger="src.utils"):
+        classify_message("mild headache", history=[], provider="bedrock")
+
+    body = json.loads(client.invoke_model.call_args.kwargs["body"])
+    assert body["system"][0]["cache_control"] == {"type": "ephemeral"}
+    logged = [json.loads(r.message) for r in caplog.records if "bedrock_classification" in r.message]
+    assert logged[0]["prompt_cache"] is True
+    assert logged[0]["cache_read_input_tokens"] == 190
+
+
+def test_prompt_cache_is_dropped_for_models_that_reject_it():
+    from botocore.exceptions import ClientError
+    from src import utils
+    rejected = ClientError(
+        {"Error": {"Code": "ValidationException", "Message": "cache_control is not supported"}}, "InvokeModel"
+    )
+    client = mock.Mock()
+    client.invoke_model.side_effect = [rejected, _bedrock_reply(), _bedrock_reply()]
+    with mock.patch.dict("os.environ", {"BEDROCK_PROMPT_CACHE": "on"}), \
+            mock.patch("src.utils.get_bedrock_client", return_value=client):
+        try:
+            first = classify_message("mild headache", history=[], provider="bedrock")
+            classify_message("mild cough", history=[], provider="bedrock")
+        finally:
+            utils._prompt_cache_unsupported.clear()
+
+    assert first["urgency"] == "LOW" and "source" not in first
+    bodies = [json.loads(c.kwargs["body"]) for c in client.invoke_model.call_args_list]
+    assert [isinstance(b["system"], list) for b in bodies] == [True, False, False]
+
+
+@mock_dynamodb
+def test_spill_history_writes_secondary_item():
+    dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+    table = dynamodb.create_table(
+        TableName="triage",
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    spill_history(table, "+19995550001", _turns(2), 40)
+
+    item = table.get_item(Key={"user_id": "+19995550001#history#0000000040"})["Item"]
+    assert len(item["history"]) == 2
+    assert item["ttl"] > int(time.time())
+
+
 # ---------------------------------------------------------------------------
 # S3 upload
 # ---------------------------------------------------------------------------
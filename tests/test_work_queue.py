@@ -0,0 +1,110 @@
+"""Tests for src/work_queue.py — after-reply queue backends and draining."""
+
+import boto3
+import pytest
+from moto import mock_sqs
+
+from src import work_queue
+from src.work_queue import (
+    InMemoryWorkQueue,
+    SQLiteWorkQueue,
+    SQSWorkQueue,
+    WorkQueue,
+    drain,
+    get_work_queue,
+)
+
+
+@pytest.fixture(autouse=True)
+def _reset_queue():
+    work_queue.reset_work_queue()
+    yield
+    work_queue.reset_work_queue()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def local_queue(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryWorkQueue()
+    return SQLiteWorkQueue(str(tmp_path / "jobs.db"))
+
+
+def test_local_queue_round_trip(local_queue):
+    local_queue.enqueue({"type": "alert", "n": 1})
+    local_queue.enqueue({"type": "alert", "n": 2})
+
+    batch = local_queue.receive(10)
+    assert [job["n"] for _, job in batch] == [1, 2]
+
+    local_queue.ack([receipt for receipt, _ in batch])
+    assert local_queue.receive(10) == []
+
+
+def test_drain_processes_in_batches(local_queue):
+    for n in range(25):
+        local_queue.enqueue({"n": n})
+    seen = []
+
+    result = drain(local_queue, lambda job: seen.append(job["n"]), batch_size=10)
+
+    assert result == {"processed": 25, "failed": 0}
+    assert seen == list(range(25))
+    assert len(local_queue) == 0
+
+
+def test_drain_leaves_failed_jobs_for_redelivery(local_queue):
+    local_queue.enqueue({"n": 1})
+    local_queue.enqueue({"n": 2})
+
+    def process(job):
+        if job["n"] == 2:
+            raise RuntimeError("sns down")
+
+    assert drain(local_queue, process) == {"processed": 1, "failed": 1}
+    assert local_queue.receive(10) == []  # still invisible
+    local_queue.requeue_unacked()
+    assert [job["n"] for _, job in local_queue.receive(10)] == [2]
+
+
+def test_sqlite_queue_survives_reopen(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    SQLiteWorkQueue(path).enqueue({"type": "transcript"})
+    assert SQLiteWorkQueue(path).receive(1)[0][1] == {"type": "transcript"}
+
+
+@mock_sqs
+def test_sqs_queue_round_trip():
+    sqs = boto3.client("sqs", region_name="us-east-1")
+    url = sqs.create_queue(QueueName="after-reply")["QueueUrl"]
+    queue = SQSWorkQueue(url, sqs_client=sqs)
+
+    for n in range(12):
+        queue.enqueue({"n": n})
+    seen = []
+    result = drain(queue, lambda job: seen.append(job["n"]))
+
+    assert result["processed"] == 12
+    assert sorted(seen) == list(range(12))
+
+
+def test_get_work_queue_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("WORK_QUEUE_BACKEND", raising=False)
+    assert get_work_queue() is None
+
+
+def test_get_work_queue_is_a_singleton(monkeypatch):
+    monkeypatch.setenv("WORK_QUEUE_BACKEND", "memory")
+    assert isinstance(get_work_queue(), InMemoryWorkQueue)
+    assert get_work_queue() is get_work_queue()
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoAck(WorkQueue):
+        def enqueue(self, job):
+            pass
+
+        def receive(self, max_jobs):
+            return []
+
+    with pytest.raises(TypeError):
+        NoAck()
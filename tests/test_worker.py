@@ -0,0 +1,101 @@
+"""Tests for src/worker.py — deferred transcript and alert jobs."""
+
+import json
+import os
+from unittest import mock
+
+import boto3
+from moto import mock_s3, mock_sns
+
+from src import worker
+from src.transcripts import append_transcript
+
+ENV = {
+    "S3_BUCKET": "test-bucket",
+    "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:123456789012:test-topic",
+}
+
+
+def _sqs_event(*jobs):
+    return {"Records": [
+        {"messageId": f"m{i}", "body": json.dumps(job)} for i, job in enumerate(jobs)
+    ]}
+
+
+@mock_s3
+def test_queue_handler_archives_transcript():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="test-bucket")
+
+    with mock.patch.dict(os.environ, ENV), mock.patch("src.worker.get_client", return_value=s3):
+        result = worker.queue_handler(
+            _sqs_event(worker.transcript_job("+10001234567", [{"message": "hi"}], 4)), None
+        )
+
+    assert result == {"batchItemFailures": []}
+    objects = s3.list_objects_v2(Bucket="test-bucket")["Contents"]
+    assert [o["Key"].rsplit("/", 1)[-1] for o in objects] == ["0000000004.jsonl"]
+
+
+def test_queue_handler_publishes_alert():
+    sns = mock.Mock()
+    triage = {"urgency": "HIGH", "symptoms": ["chest pain"], "red_flags": ["chest pain"]}
+
+    with mock.patch.dict(os.environ, ENV), mock.patch("src.worker.get_client", return_value=sns):
+        worker.queue_handler(_sqs_event(worker.alert_job(triage, "+10001234567")), None)
+
+    kwargs = sns.publish.call_args.kwargs
+    assert kwargs["TopicArn"] == ENV["SNS_TOPIC_ARN"]
+    assert "***4567" in kwargs["Subject"]
+
+
+def test_enrich_job_publishes_follow_up_alert():
+    sns = mock.Mock()
+    llm = {"urgency": "HIGH", "symptoms": ["not breathing"], "red_flags": ["not breathing"],
+           "duration": "2 min", "age": "70"}
+    job = worker.enrich_job("+10001234567", "He is not breathing", [], None, {"rules": ["not breathing"]})
+
+    with mock.patch.dict(os.environ, ENV), mock.patch("src.worker.get_client", return_value=sns), \
+            mock.patch("src.worker.classify_message", return_value=llm):
+        worker.queue_handler(_sqs_event(job), None)
+
+    kwargs = sns.publish.call_args.kwargs
+    assert kwargs["Subject"].startswith("Update: ")
+    assert "2 min" in kwargs["Message"]
+
+
+def test_enrich_job_skips_keyword_fallback_result():
+    sns = mock.Mock()
+    job = worker.enrich_job("+10001234567", "He is not breathing", [], None, {})
+
+    with mock.patch.dict(os.environ, {**ENV, "LLM_PROVIDER": "unknown"}), \
+            mock.patch("src.worker.get_client", return_value=sns):
+        result = worker.queue_handler(_sqs_event(job), None)
+
+    assert result == {"batchItemFailures": []}
+    sns.publish.assert_not_called()
+
+
+@mock_sns
+def test_queue_handler_reports_partial_failures():
+    sns = mock.Mock()
+    sns.publish.side_effect = RuntimeError("throttled")
+    jobs = [worker.alert_job({"urgency": "HIGH"}, "+10001234567"), {"type": "bogus"}]
+
+    with mock.patch.dict(os.environ, ENV), mock.patch("src.worker.get_client", return_value=sns):
+        result = worker.queue_handler(_sqs_event(*jobs), None)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m0"}, {"itemIdentifier": "m1"}]}
+
+
+@mock_s3
+def test_compaction_handler_merges_segments():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="test-bucket")
+    for start in (0, 2):
+        append_transcript(s3, "test-bucket", "+10001234567", [{"message": "x"}] * 2, start)
+
+    with mock.patch.dict(os.environ, ENV), mock.patch("src.worker.get_client", return_value=s3):
+        result = worker.compaction_handler({}, None)
+
+    assert result == {"conversations": 1, "segments": 2}